@@ -13,7 +13,7 @@ from werkzeug.exceptions import BadRequest
 from ripple1d.api import tasks
 from ripple1d.api.utils import get_unexpected_and_missing_args
 from ripple1d.hecstac.ras_to_gpkg import gpkg_from_ras
-from ripple1d.ops.fim_lib import create_fim_lib, create_rating_curves_db
+from ripple1d.ops.fim_lib import consolidate_rating_curves_dbs, create_fim_lib, create_rating_curves_db
 from ripple1d.ops.metrics import compute_conflation_metrics
 from ripple1d.ops.ras_conflate import conflate_model
 from ripple1d.ops.ras_run import (
@@ -87,6 +87,12 @@ def process__create_fim_lib():
     return enqueue_async_task(create_fim_lib)
 
 
+@app.route("/processes/consolidate_rating_curves_dbs/execution", methods=["POST"])
+def process__consolidate_rating_curves_dbs():
+    """Enqueue a task to consolidate rating curve dbs into a regional db."""
+    return enqueue_async_task(consolidate_rating_curves_dbs)
+
+
 @app.route("/ping", methods=["GET"])
 def ping():
     """Check the health of the service."""
@@ -123,7 +123,14 @@ def revoke_task_by_pid(task_id: str):
     expression = """select "p_id" from "task_status" where "task_id" = ?"""
     args = (task_id,)
     pid = huey.storage.sql(expression, args, results=True)[0][0]
-    psutil.Process(int(pid)).terminate()
+    # terminate the worker pool processes of the task along with it so they are not orphaned
+    process = psutil.Process(int(pid))
+    for child in process.children(recursive=True):
+        try:
+            child.terminate()
+        except psutil.NoSuchProcess:
+            pass
+    process.terminate()
     expression = f"""
         update "task_status"
         set
@@ -32,6 +32,17 @@ WSE_HDF_PATH = "/Results/Steady/Output/Output Blocks/Base Output/Steady Profiles
 FLOW_HDF_PATH = "/Results/Steady/Output/Output Blocks/Base Output/Steady Profiles/Cross Sections/Flow"
 XS_NAMES_HDF_PATH = "/Results/Steady/Output/Geometry Info/Cross Section Only"
 PROFILE_NAMES_HDF_PATH = "/Results/Steady/Output/Output Blocks/Base Output/Steady Profiles/Profile Names"
+STEADY_XS_RESULTS_HDF_PATH = "/Results/Steady/Output/Output Blocks/Base Output/Steady Profiles/Cross Sections"
+# steady cross section result variables and their datasets relative to STEADY_XS_RESULTS_HDF_PATH
+STEADY_RESULT_VARIABLES = {
+    "wse": "Water Surface",
+    "flow": "Flow",
+    "energy_grade": "Energy Grade",
+    "velocity": "Additional Variables/Velocity Total",
+    "flow_area": "Additional Variables/Area Flow Total",
+    "top_width": "Additional Variables/Top Width Total",
+    "max_depth": "Additional Variables/Maximum Depth Total",
+}
 
 LAYER_COLORS = OrderedDict(
     {
@@ -81,3 +92,33 @@ for k in keys:
     TERRAIN_AGREEMENT_PRECISION[f"max_el_residuals_{k}"] = TERRAIN_AGREEMENT_PRECISION[k]
 
 DEFAULT_MAX_WALK = 3e4
+
+# fixed-width text blocks with fewer fields than this are decoded field by field instead of in bulk with numpy
+BULK_DECODE_MIN_FIELDS = 64
+
+# sidecar cache of parsed geometry files; bump the version when the cached layout changes
+GEOM_CACHE_SUFFIX = ".ripple-cache"
+GEOM_CACHE_VERSION = 1
+
+# process-wide pool of open read-only HDF handles; HDF5 chunk cache size (bytes) and hash slots (a prime) per handle
+HDF_POOL_MAX_HANDLES = 64
+HDF_POOL_FD_FRACTION = 0.25
+HDF_RDCC_NBYTES = 16 * 1024**2
+HDF_RDCC_NSLOTS = 10007
+
+# rating curve databases attached per batch when consolidating them (SQLite attaches at most 10 by default) and
+# merged into each worker shard
+SQLITE_ATTACH_BATCH_SIZE = 10
+CONSOLIDATE_SHARD_SIZE = 200
+
+# GDAL block cache (MB) of each worker post-processing depth grids in create_fim_lib
+DEPTH_GRID_GDAL_CACHE_MB = 256
+
+# overview decimation levels of Cloud Optimized GeoTIFF depth grids
+COG_OVERVIEW_LEVELS = [4, 8, 16]
+
+# memory budget (MB) of the windows in which rasters are reprojected and clipped
+RASTER_MEMORY_BUDGET_MB = 256
+
+# nodata of depth grids quantized to uint16 multiples of a depth scale
+QUANTIZED_DEPTH_NODATA = 65535
@@ -14,17 +14,23 @@ import geopandas as gpd
 import numpy as np
 import pandas as pd
 from pyproj import CRS
-from shapely import reverse
+from shapely import offset_curve, reverse
 from shapely.geometry import LineString, Point
 
 from ripple1d.errors import InvalidStructureDataError
+from ripple1d.utils.rating_curve_utils import read_rating_curves_db
 from ripple1d.utils.ripple_utils import (
+    GeomTextIndex,
+    cache_on_contents,
+    data_block_from_offsets,
+    data_pairs_array_from_text_block,
     data_pairs_from_text_block,
-    data_triplets_from_text_block,
+    data_triplets_array_from_text_block,
     determine_crs_units,
     fix_reversed_xs,
+    gdf_from_records,
+    linestrings_from_coords,
     search_contents,
-    text_block_from_start_end_str,
     text_block_from_start_str_length,
     text_block_from_start_str_to_empty_line,
     validate_point,
@@ -271,6 +277,11 @@ class NwmReachModel(RasModelStructure):
         """FIM results directory."""
         return str(Path(self.library_directory) / self.model_name)
 
+    @property
+    def fim_depth_cube_file(self):
+        """Depth cube holding the depth grids of every profile of the reach."""
+        return str(Path(self.fim_results_directory) / "cube" / "depth_cube.tif")
+
     @property
     def fim_lib_assets(self):
         """Assets of the fim library."""
@@ -303,6 +314,11 @@ class NwmReachModel(RasModelStructure):
 
         return data_list
 
+    @property
+    def fim_rating_curve_arrays(self) -> dict[str, np.ndarray]:
+        """FIM rating curve; typed arrays of the rows of this reach in the results database."""
+        return read_rating_curves_db(self.fim_results_database, [int(self.model_name)])
+
     @property
     def crs(self):
         """Coordinate Reference System."""
@@ -390,6 +406,96 @@ class FlowChangeLocation:
     profile_names: list[str] = None
 
 
+class XSRecord:
+    """
+    Compact record of the data of a HEC-RAS cross section.
+
+    The header, bank stations, htab, skew, station-elevation, Manning's and cut line blocks are decoded
+    exactly once, in a single pass over the cross section's lines, and kept as arrays.
+    """
+
+    __slots__ = (
+        "header",
+        "bank_stations",
+        "htab_string",
+        "skew",
+        "number_of_station_elevation_points",
+        "station_elevation",
+        "number_of_mannings_points",
+        "mannings_code",
+        "mannings",
+        "number_of_coords",
+        "coords",
+    )
+
+    KEYS = {
+        "Type RM Length L Ch R =": "header",
+        "Bank Sta=": "bank_stations",
+        "XS HTab Starting El and Incr=": "htab_string",
+        "Skew Angle=": "skew",
+        "#Sta/Elev=": "#Sta/Elev=",
+        "#Mann=": "#Mann=",
+        "XS GIS Cut Line=": "XS GIS Cut Line=",
+    }
+
+    ARRAY_FIELDS = ("station_elevation", "mannings", "coords")
+
+    def __init__(self, ras_data: list[str], offsets: dict = None):
+        values, positions = {key: [] for key in self.KEYS.values()}, {}
+        for i, line in enumerate(ras_data):
+            for search_string, key in self.KEYS.items():
+                if search_string in line:
+                    values[key].append(line.split("=")[1])
+                    positions.setdefault(key, i)
+                    break
+        if offsets:
+            positions.update(offsets)
+
+        if len(values["header"]) != 1:
+            raise ValueError(f"expected 1 cross section header, got {len(values['header'])}")
+        self.header = values["header"][0].split(",")
+        self.bank_stations = values["bank_stations"][0].split(",") if len(values["bank_stations"]) == 1 else None
+        self.htab_string = values["htab_string"][0] if len(values["htab_string"]) == 1 else None
+        self.skew = [float(skew) for skew in values["skew"]]
+
+        self.number_of_station_elevation_points, self.station_elevation = None, None
+        if len(values["#Sta/Elev="]) == 1:
+            self.number_of_station_elevation_points = int(values["#Sta/Elev="][0])
+            lines = data_block_from_offsets(
+                positions, "#Sta/Elev=", math.ceil(self.number_of_station_elevation_points / 5), ras_data
+            )
+            self.station_elevation = data_pairs_array_from_text_block(lines, 16)
+
+        self.number_of_mannings_points, self.mannings_code, self.mannings = None, None, None
+        if len(values["#Mann="]) == 1:
+            mann = values["#Mann="][0].split(",")
+            self.number_of_mannings_points, self.mannings_code = int(mann[0]), int(mann[1])
+            lines = data_block_from_offsets(
+                positions, "#Mann=", math.ceil(self.number_of_mannings_points / 4), ras_data
+            )
+            try:
+                self.mannings = data_triplets_array_from_text_block(lines, 24)
+            except ValueError as e:
+                print(e)
+
+        self.number_of_coords, self.coords = 0, None
+        if len(values["XS GIS Cut Line="]) == 1:
+            self.number_of_coords = int(values["XS GIS Cut Line="][0])
+            lines = data_block_from_offsets(
+                positions, "XS GIS Cut Line=", math.ceil(self.number_of_coords / 2), ras_data
+            )
+            if lines:
+                self.coords = data_pairs_array_from_text_block(lines, 32)
+
+    @classmethod
+    def from_fields(cls, **fields) -> "XSRecord":
+        """Create a record from previously decoded fields without parsing any text."""
+        record = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(record, name, fields[name])
+        return record
+
+
 class XS:
     """HEC-RAS Cross Section."""
 
@@ -402,8 +508,14 @@ class XS:
         crs: str,
         reach_geom: LineString = None,
         units: str = "English",
+        offsets: dict = None,
+        record: XSRecord = None,
+        start_line: int = None,
     ):
         self.ras_data = ras_data
+        self._offsets = offsets
+        self.start_line = start_line
+        self.record = record if record is not None else XSRecord(ras_data, offsets)
         self.crs = crs
         self.river = river
         self.reach = reach
@@ -423,9 +535,7 @@ class XS:
 
         Example: Type RM Length L Ch R = 1 ,83554.  ,237.02,192.39,113.07.
         """
-        header = search_contents(self.ras_data, "Type RM Length L Ch R ", expect_one=True)
-
-        return header.split(",")[position]
+        return self.record.header[position]
 
     @property
     def river_station(self):
@@ -467,18 +577,13 @@ class XS:
     @property
     def number_of_coords(self):
         """Number of coordinates in cross section."""
-        try:
-            return int(search_contents(self.ras_data, "XS GIS Cut Line", expect_one=True))
-        except ValueError as e:
-            return 0
-            # raise NotGeoreferencedError(f"No coordinates found for cross section: {self.river_reach_rs} ")
+        return self.record.number_of_coords
 
     @property
     def min_elevation(self):
         """The min elevaiton in the cross section."""
-        if self.station_elevation_points:
-            _, y = list(zip(*self.station_elevation_points))
-            return min(y)
+        if self.record.station_elevation is not None and len(self.record.station_elevation):
+            return float(self.record.station_elevation[:, 1].min())
 
     @property
     def min_elevation_in_channel(self):
@@ -491,11 +596,9 @@ class XS:
     @property
     def thalweg(self):
         """The min elevation of the channel (between bank points)."""
-        return self.station_elevation_df.loc[
-            (self.station_elevation_df["Station"] <= self.right_bank_station)
-            & (self.station_elevation_df["Station"] >= self.left_bank_station),
-            "Elevation",
-        ].min()
+        station, elevation = self.station_elevation_arrays
+        channel = elevation[(station <= self.right_bank_station) & (station >= self.left_bank_station)]
+        return channel.min() if len(channel) else np.nan
 
     @property
     def has_htab_error(self):
@@ -508,11 +611,7 @@ class XS:
     @property
     def htab_string(self):
         """Cross section htab string."""
-        try:
-            htabstr = search_contents(self.ras_data, "XS HTab Starting El and Incr", expect_one=True)
-        except:
-            htabstr = None
-        return htabstr
+        return self.record.htab_string
 
     @property
     def htab_starting_el(self):
@@ -532,43 +631,41 @@ class XS:
     @property
     def xs_max_elevation(self):
         """Cross section maximum elevation."""
-        if self.station_elevation_points:
-            _, y = list(zip(*self.station_elevation_points))
-            return max(y)
+        if self.record.station_elevation is not None and len(self.record.station_elevation):
+            return float(self.record.station_elevation[:, 1].max())
 
     @property
     def coords(self):
         """Cross section coordinates."""
-        lines = text_block_from_start_str_length(
-            f"XS GIS Cut Line={self.number_of_coords}",
-            math.ceil(self.number_of_coords / 2),
-            self.ras_data,
-        )
-        if lines:
-            return data_pairs_from_text_block(lines, 32)
+        if self.record.coords is not None:
+            return list(map(tuple, self.record.coords.tolist()))
 
     @property
     def number_of_station_elevation_points(self):
         """Number of station elevation points."""
-        return int(search_contents(self.ras_data, "#Sta/Elev", expect_one=True))
+        if self.record.number_of_station_elevation_points is None:
+            raise ValueError(f"expected 1 #Sta/Elev result for cross section: {self.river_reach_rs}")
+        return self.record.number_of_station_elevation_points
 
     @property
     def station_elevation_points(self):
         """Station elevation points."""
-        try:
-            lines = text_block_from_start_str_length(
-                f"#Sta/Elev= {self.number_of_station_elevation_points} ",
-                math.ceil(self.number_of_station_elevation_points / 5),
-                self.ras_data,
-            )
-            return data_pairs_from_text_block(lines, 16)
-        except ValueError as e:
-            return None
+        if self.record.station_elevation is not None:
+            return list(map(tuple, self.record.station_elevation.tolist()))
+
+    @property
+    def station_elevation_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """Station and elevation arrays of the cross section."""
+        if self.record.station_elevation is None:
+            return np.empty(0), np.empty(0)
+        return self.record.station_elevation[:, 0], self.record.station_elevation[:, 1]
 
     @property
     def bank_stations(self):
         """Bank stations."""
-        return search_contents(self.ras_data, "Bank Sta", expect_one=True).split(",")
+        if self.record.bank_stations is None:
+            raise ValueError(f"expected 1 Bank Sta result for cross section: {self.river_reach_rs}")
+        return self.record.bank_stations
 
     @property
     def left_bank_station(self):
@@ -588,12 +685,12 @@ class XS:
     @property
     def first_station(self):
         """First station of the cross section."""
-        return float(self.station_elevation_points[0][0])
+        return float(self.record.station_elevation[0, 0])
 
     @property
     def last_station(self):
         """Last station of the cross section."""
-        return float(self.station_elevation_points[-1][0])
+        return float(self.record.station_elevation[-1, 0])
 
     @property
     def cutline_length(self):
@@ -690,9 +787,9 @@ class XS:
     @property
     def skew(self):
         """The skew applied to the cross section."""
-        skew = search_contents(self.ras_data, "Skew Angle", expect_one=False)
+        skew = self.record.skew
         if len(skew) == 1:
-            return float(skew[0])
+            return skew[0]
         elif len(skew) > 1:
             raise ValueError(
                 f"Expected only one skew value for the cross section recieved: {len(skew)}. XS: {self.river_reach_rs}"
@@ -701,7 +798,9 @@ class XS:
     @property
     def number_of_mannings_points(self):
         """The number of mannings points in the cross section."""
-        return int(search_contents(self.ras_data, "#Mann", expect_one=True).split(",")[0])
+        if self.record.number_of_mannings_points is None:
+            raise ValueError(f"expected 1 #Mann result for cross section: {self.river_reach_rs}")
+        return self.record.number_of_mannings_points
 
     @property
     def mannings_code(self):
@@ -710,7 +809,9 @@ class XS:
 
         0, -1 correspond to 3 value manning's; horizontally varying manning's values, respectively.
         """
-        return int(search_contents(self.ras_data, "#Mann", expect_one=True).split(",")[1])
+        if self.record.mannings_code is None:
+            raise ValueError(f"expected 1 #Mann result for cross section: {self.river_reach_rs}")
+        return self.record.mannings_code
 
     @property
     def horizontal_varying_mannings(self):
@@ -733,31 +834,20 @@ class XS:
         return search_contents(self.ras_data, "Exp/Cntr", expect_one=True).split(",")[1]
 
     @property
-    @lru_cache
     def mannings(self):
         """The manning's values of the cross section."""
-        try:
-            lines = text_block_from_start_str_length(
-                "#Mann=" + search_contents(self.ras_data, "#Mann", expect_one=True),
-                math.ceil(self.number_of_mannings_points / 4),
-                self.ras_data,
-            )
-            return data_triplets_from_text_block(lines, 24)
-        except ValueError as e:
-            print(e)
-            return None
+        if self.record.mannings is not None:
+            return list(map(tuple, self.record.mannings.tolist()))
 
     @property
-    @lru_cache
     def max_n(self):
         """The highest manning's n value used in the cross section."""
-        return max(list(zip(*self.mannings))[1])
+        return float(self.record.mannings[:, 1].max())
 
     @property
-    @lru_cache
     def min_n(self):
         """The lowest manning's n value used in the cross section."""
-        return min(list(zip(*self.mannings))[1])
+        return float(self.record.mannings[:, 1].min())
 
     @property
     def has_levees(self):
@@ -796,7 +886,6 @@ class XS:
         """
 
     @property
-    @lru_cache
     def station_elevation_df(self):
         """A pandas DataFrame containing the station-elevation data of the cross section."""
         return pd.DataFrame(self.station_elevation_points, columns=["Station", "Elevation"])
@@ -804,15 +893,16 @@ class XS:
     @property
     def left_max_elevation(self):
         """Max Elevation on the left side of the channel."""
-        return self.station_elevation_df.loc[
-            self.station_elevation_df["Station"] <= self.left_bank_station, "Elevation"
-        ].max()
+        station, elevation = self.station_elevation_arrays
+        left = elevation[station <= self.left_bank_station]
+        return left.max() if len(left) else np.nan
 
     @property
     def right_max_elevation(self):
         """Max Elevation on the right side of the channel."""
-        df = pd.DataFrame(self.station_elevation_points, columns=["Station", "Elevation"])
-        return df.loc[df["Station"] >= self.right_bank_station, "Elevation"].max()
+        station, elevation = self.station_elevation_arrays
+        right = elevation[station >= self.right_bank_station]
+        return right.max() if len(right) else np.nan
 
     @property
     def overtop_elevation(self):
@@ -832,16 +922,14 @@ class XS:
     @property
     def left_bank_elevation(self):
         """Elevation of the left bank station."""
-        return self.station_elevation_df.loc[
-            self.station_elevation_df["Station"] == self.left_bank_station, "Elevation"
-        ].iloc[0]
+        station, elevation = self.station_elevation_arrays
+        return elevation[station == self.left_bank_station][0]
 
     @property
     def right_bank_elevation(self):
         """Elevation of the right bank station."""
-        return self.station_elevation_df.loc[
-            self.station_elevation_df["Station"] == self.right_bank_station, "Elevation"
-        ].iloc[0]
+        station, elevation = self.station_elevation_arrays
+        return elevation[station == self.right_bank_station][0]
 
     @property
     def channel_depth(self):
@@ -851,23 +939,20 @@ class XS:
     @property
     def htab_min_elevation(self):
         """The starting elevation for the cross section's htab."""
-        result = search_contents(self.ras_data, "XS HTab Starting El and Incr", expect_one=False)
-        if len(result) == 1:
-            return result[0].split(",")[0]
+        if self.htab_string is not None:
+            return self.htab_string.split(",")[0]
 
     @property
     def htab_min_increment(self):
         """The increment for the cross section's htab."""
-        result = search_contents(self.ras_data, "XS HTab Starting El and Incr", expect_one=False)
-        if len(result) == 1:
-            return result[0].split(",")[1]
+        if self.htab_string is not None:
+            return self.htab_string.split(",")[1]
 
     @property
     def htab_points(self):
         """The number of points on the cross section's htab."""
-        result = search_contents(self.ras_data, "XS HTab Starting El and Incr", expect_one=False)
-        if len(result) == 1:
-            return result[0].split(",")[2]
+        if self.htab_string is not None:
+            return self.htab_string.split(",")[2]
 
     def set_thalweg_drop(self, ds_thalweg):
         """Set the drop in thalweg elevation between this cross section and the downstream cross section."""
@@ -946,74 +1031,74 @@ class XS:
         self.bridge_xs = br
 
     @property
-    @lru_cache
+    def gdf_data_dict(self) -> dict:
+        """Cross section attributes keyed by their geodataframe column; the geometry is built separately."""
+        return {
+            "river": self.river,
+            "reach": self.reach,
+            "river_reach": self.river_reach,
+            "river_station": self.river_station,
+            "river_reach_rs": self.river_reach_rs,
+            "river_reach_rs_str": self.river_reach_rs_str,
+            "thalweg": self.thalweg,
+            "xs_max_elevation": self.xs_max_elevation,
+            "left_reach_length": self.left_reach_length,
+            "right_reach_length": self.right_reach_length,
+            "channel_reach_length": self.channel_reach_length,
+            "computed_channel_reach_length": self.computed_channel_reach_length,
+            "computed_channel_reach_length_ratio": self.computed_channel_reach_length_ratio,
+            "left_reach_length_ratio": self.left_reach_length_ratio,
+            "right_reach_length_ratio": self.right_reach_length_ratio,
+            "reach_lengths_populated": self.reach_lengths_populated,
+            "ras_data": "\n".join(self.ras_data),
+            "station_elevation_points": self.station_elevation_points,
+            "bank_stations": self.bank_stations,
+            "left_bank_station": self.left_bank_station,
+            "right_bank_station": self.right_bank_station,
+            "left_bank_elevation": self.left_bank_elevation,
+            "right_bank_elevation": self.right_bank_elevation,
+            "number_of_station_elevation_points": self.number_of_station_elevation_points,
+            "number_of_coords": self.number_of_coords,
+            "station_length": self.station_length,
+            "cutline_length": self.cutline_length,
+            "xs_length_ratio": self.xs_length_ratio,
+            "banks_encompass_channel": self.banks_encompass_channel,
+            "skew": self.skew,
+            "max_n": self.max_n,
+            "min_n": self.min_n,
+            "has_lateral_structure": self.has_lateral_structures,
+            "has_ineffective": self.has_ineffectives,
+            "has_levees": self.has_levees,
+            "has_blocks": self.has_blocks,
+            "channel_obstruction": self.channel_obstruction,
+            "thalweg_drop": self.thalweg_drop,
+            "left_max_elevation": self.left_max_elevation,
+            "right_max_elevation": self.right_max_elevation,
+            "overtop_elevation": self.overtop_elevation,
+            "min_elevation": self.min_elevation,
+            "channel_width": self.channel_width,
+            "channel_depth": self.channel_depth,
+            "station_elevation_point_density": self.station_elevation_point_density,
+            "htab_min_elevation": self.htab_min_elevation,
+            "htab_min_increment": self.htab_min_increment,
+            "htab points": self.htab_points,
+            "correct_cross_section_direction": self.correct_cross_section_direction,
+            "horizontal_varying_mannings": self.horizontal_varying_mannings,
+            "number_of_mannings_points": self.number_of_mannings_points,
+            "expansion_coefficient": self.expansion_coefficient,
+            "contraction_coefficient": self.contraction_coefficient,
+            "centerline_intersection_station": self.centerline_intersection_station,
+            "bridge_xs": self.bridge_xs,
+            "cross_section_intersects_reach": self.cross_section_intersects_reach,
+            "intersects_reach_once": self.intersects_reach_once,
+            "min_elevation_in_channel": self.min_elevation_in_channel,
+        }
+
+    @property
+    @cache_on_contents
     def gdf(self):
         """Cross section geodataframe."""
-        return gpd.GeoDataFrame(
-            {
-                "geometry": [self.geom],
-                "river": [self.river],
-                "reach": [self.reach],
-                "river_reach": [self.river_reach],
-                "river_station": [self.river_station],
-                "river_reach_rs": [self.river_reach_rs],
-                "river_reach_rs_str": [self.river_reach_rs_str],
-                "thalweg": [self.thalweg],
-                "xs_max_elevation": [self.xs_max_elevation],
-                "left_reach_length": [self.left_reach_length],
-                "right_reach_length": [self.right_reach_length],
-                "channel_reach_length": [self.channel_reach_length],
-                "computed_channel_reach_length": [self.computed_channel_reach_length],
-                "computed_channel_reach_length_ratio": [self.computed_channel_reach_length_ratio],
-                "left_reach_length_ratio": [self.left_reach_length_ratio],
-                "right_reach_length_ratio": [self.right_reach_length_ratio],
-                "reach_lengths_populated": [self.reach_lengths_populated],
-                "ras_data": ["\n".join(self.ras_data)],
-                "station_elevation_points": [self.station_elevation_points],
-                "bank_stations": [self.bank_stations],
-                "left_bank_station": [self.left_bank_station],
-                "right_bank_station": [self.right_bank_station],
-                "left_bank_elevation": [self.left_bank_elevation],
-                "right_bank_elevation": [self.right_bank_elevation],
-                "number_of_station_elevation_points": [self.number_of_station_elevation_points],
-                "number_of_coords": [self.number_of_coords],
-                "station_length": [self.station_length],
-                "cutline_length": [self.cutline_length],
-                "xs_length_ratio": [self.xs_length_ratio],
-                "banks_encompass_channel": [self.banks_encompass_channel],
-                "skew": [self.skew],
-                "max_n": [self.max_n],
-                "min_n": [self.min_n],
-                "has_lateral_structure": [self.has_lateral_structures],
-                "has_ineffective": [self.has_ineffectives],
-                "has_levees": [self.has_levees],
-                "has_blocks": [self.has_blocks],
-                "channel_obstruction": [self.channel_obstruction],
-                "thalweg_drop": [self.thalweg_drop],
-                "left_max_elevation": [self.left_max_elevation],
-                "right_max_elevation": [self.right_max_elevation],
-                "overtop_elevation": [self.overtop_elevation],
-                "min_elevation": [self.min_elevation],
-                "channel_width": [self.channel_width],
-                "channel_depth": [self.channel_depth],
-                "station_elevation_point_density": [self.station_elevation_point_density],
-                "htab_min_elevation": [self.htab_min_elevation],
-                "htab_min_increment": [self.htab_min_increment],
-                "htab points": [self.htab_points],
-                "correct_cross_section_direction": [self.correct_cross_section_direction],
-                "horizontal_varying_mannings": [self.horizontal_varying_mannings],
-                "number_of_mannings_points": [self.number_of_mannings_points],
-                "expansion_coefficient": [self.expansion_coefficient],
-                "contraction_coefficient": [self.contraction_coefficient],
-                "centerline_intersection_station": [self.centerline_intersection_station],
-                "bridge_xs": [self.bridge_xs],
-                "cross_section_intersects_reach": [self.cross_section_intersects_reach],
-                "intersects_reach_once": [self.intersects_reach_once],
-                "min_elevation_in_channel": [self.min_elevation_in_channel],
-            },
-            crs=self.crs,
-            geometry="geometry",
-        )
+        return cross_sections_gdf([self], self.crs)
 
 
 class Structure:
@@ -1167,42 +1252,53 @@ class Structure:
         return float(self.structure_data(1))
 
     @property
-    @lru_cache
+    def gdf_data_dict(self) -> dict:
+        """Structure attributes keyed by their geodataframe column; the geometry is built separately."""
+        return {
+            "river": self.river,
+            "reach": self.reach,
+            "river_reach": self.river_reach,
+            "river_station": self.river_station,
+            "river_reach_rs": self.river_reach_rs,
+            "type": self.type,
+            "distance": self.distance,
+            "width": self.width,
+            "ras_data": "\n".join(self.ras_data),
+        }
+
+    @property
+    @cache_on_contents
     def gdf(self):
         """Structure geodataframe."""
-        return gpd.GeoDataFrame(
-            {
-                "geometry": [LineString(self.us_xs.coords).offset_curve(self.distance)],
-                "river": [self.river],
-                "reach": [self.reach],
-                "river_reach": [self.river_reach],
-                "river_station": [self.river_station],
-                "river_reach_rs": [self.river_reach_rs],
-                "type": [self.type],
-                "distance": [self.distance],
-                "width": [self.width],
-                "ras_data": ["\n".join(self.ras_data)],
-            },
-            crs=self.crs,
-            geometry="geometry",
-        )
+        return structures_gdf([self], self.crs)
 
 
 class Reach:
     """HEC-RAS River Reach."""
 
-    def __init__(self, ras_data: list, river_reach: str, crs: str, units: str):
-        reach_lines = text_block_from_start_end_str(f"River Reach={river_reach}", ["River Reach"], ras_data, -1)
-        self.ras_data = reach_lines
+    def __init__(self, ras_data: list, river_reach: str, crs: str, units: str, index: GeomTextIndex = None):
+        if index is None or not index.is_current(ras_data):
+            index = GeomTextIndex(ras_data)
+        if river_reach not in index.reaches:
+            raise ValueError(f"line: River Reach={river_reach} not found in lines")
+        self._index = index
+        self._start, self._end = index.reaches[river_reach]
+        self.ras_data = ras_data[self._start : self._end]
         self.crs = crs
         self.river_reach = river_reach
         self.river = river_reach.split(",")[0].rstrip()
         self.reach = river_reach.split(",")[1].rstrip()
         self.units = units
+        self._contents_cache = {}
 
         us_connection: str = None
         ds_connection: str = None
 
+    @property
+    def contents_version(self) -> int:
+        """Contents version of the reach; its lines are fixed when the reach is built, so it never changes."""
+        return 0
+
     @property
     def us_xs(self):
         """Upstream cross section."""
@@ -1210,7 +1306,7 @@ class Reach:
             self.xs_gdf.loc[
                 self.xs_gdf["river_station"] == self.xs_gdf["river_station"].max(),
                 "river_reach_rs",
-            ][0]
+            ].iloc[0]
         ]
 
     @property
@@ -1220,7 +1316,7 @@ class Reach:
             self.xs_gdf.loc[
                 self.xs_gdf["river_station"] == self.xs_gdf["river_station"].min(),
                 "river_reach_rs",
-            ][0]
+            ].iloc[0]
         ]
 
     @property
@@ -1236,24 +1332,32 @@ class Reach:
     @property
     def coords(self):
         """Reach coordinates."""
-        lines = text_block_from_start_str_length(
-            f"Reach XY= {self.number_of_coords} ",
+        lines = data_block_from_offsets(
+            self._index.offsets(self._start, self._end),
+            "Reach XY=",
             math.ceil(self.number_of_coords / 2),
             self.ras_data,
+            f"Reach XY= {self.number_of_coords} ",
         )
         return data_pairs_from_text_block(lines, 32)
 
+    @property
+    def nodes(self) -> list[tuple[str, int, int]]:
+        """Header, start line and end line of each node (cross section or structure) in the geometry file."""
+        return self._index.nodes(self._start, self._end)
+
     @property
     def reach_nodes(self):
         """Reach nodes."""
-        return search_contents(self.ras_data, "Type RM Length L Ch R ", expect_one=False)
+        return [header for header, _, _ in self.nodes]
 
     @property
-    @lru_cache
+    @cache_on_contents
     def cross_sections(self):
         """Cross sections."""
         cross_sections, bridge_xs = [], []
-        for header in self.reach_nodes:
+        geom = self.geom
+        for header, start, end in self.nodes:
             type, _, _, _, _ = header.split(",")[:5]
 
             if int(type) in [2, 3, 4]:
@@ -1264,14 +1368,7 @@ class Reach:
                 bridge_xs = [0]
             else:
                 bridge_xs.append(max([0, bridge_xs[-1] - 1]))
-            xs_lines = text_block_from_start_end_str(
-                f"Type RM Length L Ch R ={header}",
-                ["Type RM Length L Ch R", "River Reach"],
-                self.ras_data,
-            )
-            cross_sections.append(
-                XS(xs_lines, self.river_reach, self.river, self.reach, self.crs, self.geom, self.units)
-            )
+            cross_sections.append(self._cross_section(start, end, geom))
 
         cross_sections = self.add_bridge_xs(cross_sections, bridge_xs)
         cross_sections = self.compute_multi_xs_variables(cross_sections)
@@ -1306,75 +1403,95 @@ class Reach:
     def structures(self):
         """Structures."""
         structures = {}
-        for header in self.reach_nodes:
+        geom = None
+        lines = self._index.lines
+        xs_span = None
+        for header, start, end in self.nodes:
             type, _, _, _, _ = header.split(",")[:5]
             if int(type) == 1:
-                xs_lines = text_block_from_start_end_str(
-                    f"Type RM Length L Ch R ={header}",
-                    ["Type RM Length L Ch R", "River Reach"],
-                    self.ras_data,
-                )
-                cross_section = XS(xs_lines, self.river_reach, self.river, self.reach, self.crs, self.geom, self.units)
+                xs_span = (start, end)
                 continue
             elif int(type) in [2, 3, 4, 5, 6]:  # culvert or bridge or multiple openeing
-                structure_lines = text_block_from_start_end_str(
-                    f"Type RM Length L Ch R ={header}",
-                    ["Type RM Length L Ch R", "River Reach"],
-                    self.ras_data,
-                )
+                structure_lines = lines[start:end]
             else:
                 raise TypeError(
                     f"Unsupported structure type: {int(type)}. Supported structure types are 2, 3, 4, 5, and 6 corresponding to culvert, bridge, multiple openeing, inline structure, lateral structure, respectively"
                 )
 
+            # only the cross section immediately upstream of a structure is materialized
+            cross_section = None
+            if xs_span is not None:
+                geom = geom if geom is not None else self.geom
+                cross_section = self._cross_section(*xs_span, geom)
             structure = Structure(structure_lines, self.river_reach, self.river, self.reach, self.crs, cross_section)
             structures[structure.river_reach_rs] = structure
 
         return structures
 
+    def _cross_section(self, start: int, end: int, geom: LineString) -> XS:
+        """Create the cross section between two lines, reusing its decoded record if the index already holds it."""
+        cross_section = XS(
+            self._index.lines[start:end],
+            self.river_reach,
+            self.river,
+            self.reach,
+            self.crs,
+            geom,
+            self.units,
+            offsets=self._index.offsets(start, end),
+            record=self._index.records.get(start),
+            start_line=start,
+        )
+        self._index.records[start] = cross_section.record
+        return cross_section
+
     @property
     def geom(self):
         """Geometry of the reach."""
         return LineString(self.coords)
 
     @property
-    @lru_cache
+    def gdf_data_dict(self) -> dict:
+        """Reach attributes keyed by their geodataframe column; the geometry is built separately."""
+        return {
+            "river": self.river,
+            "reach": self.reach,
+            "river_reach": self.river_reach,
+            # "number_of_coords": self.number_of_coords,
+            # "coords": self.coords,
+            "ras_data": "\n".join(self.ras_data),
+        }
+
+    @property
+    @cache_on_contents
     def gdf(self):
         """Reach geodataframe."""
-        return gpd.GeoDataFrame(
-            {
-                "geometry": [self.geom],
-                "river": [self.river],
-                "reach": [self.reach],
-                "river_reach": [self.river_reach],
-                # "number_of_coords": [self.number_of_coords],
-                # "coords": [self.coords],
-                "ras_data": ["\n".join(self.ras_data)],
-            },
-            crs=self.crs,
-            geometry="geometry",
-        )
+        return reaches_gdf([self], self.crs)
 
     @property
-    @lru_cache
+    @cache_on_contents
     def xs_gdf(self):
         """Cross section geodataframe."""
-        return pd.concat([xs.gdf for xs in self.cross_sections.values()])
+        return cross_sections_gdf(list(self.cross_sections.values()), self.crs)
 
     @property
-    @lru_cache
+    @cache_on_contents
     def structures_gdf(self):
         """Structures geodataframe."""
-        return pd.concat([structure.gdf for structure in self.structures.values()])
+        return structures_gdf(list(self.structures.values()), self.crs)
 
 
 class Junction:
     """HEC-RAS Junction."""
 
-    def __init__(self, ras_data: List[str], junct: str, crs: str):
+    def __init__(self, ras_data: List[str], junct: str, crs: str, index: GeomTextIndex = None):
         self.crs = crs
         self.name = junct
-        self.ras_data = text_block_from_start_str_to_empty_line(f"Junct Name={junct}", ras_data)
+        if index is not None and index.is_current(ras_data) and junct in index.junctions:
+            start, end = index.junctions[junct]
+            self.ras_data = ras_data[start:end]
+        else:
+            self.ras_data = text_block_from_start_str_to_empty_line(f"Junct Name={junct}", ras_data)
 
     def split_lines(self, lines: str, token: str, idx: int):
         """Split lines."""
@@ -1445,7 +1562,7 @@ class Junction:
         return ",".join(self.split_lines(search_contents(self.ras_data, "Junc L&A", expect_one=False), ",", 0))
 
     @property
-    @lru_cache
+    @cache_on_contents
     def gdf(self):
         """Junction geodataframe."""
         return gpd.GeoDataFrame(
@@ -1461,3 +1578,49 @@ class Junction:
             geometry="geometry",
             crs=self.crs,
         )
+
+
+def cross_sections_gdf(cross_sections: list[XS], crs: str) -> gpd.GeoDataFrame:
+    """Build the geodataframe of a list of cross sections in one shot from their decoded coordinate arrays."""
+    geometry = linestrings_from_coords([xs.record.coords for xs in cross_sections])
+    return gdf_from_records([xs.gdf_data_dict for xs in cross_sections], geometry, crs)
+
+
+def overtop_elevations(cross_sections: list[XS]) -> np.ndarray:
+    """
+    Compute the overtop elevation of a list of cross sections at once from their decoded station-elevation arrays.
+
+    Matches XS.overtop_elevation: the lower of the max elevations left of the left bank and right of the right bank.
+    """
+    station_elevation = [xs.station_elevation_arrays for xs in cross_sections]
+    lengths = np.array([len(station) for station, _ in station_elevation], dtype=np.int64)
+    segments = np.repeat(np.arange(len(cross_sections)), lengths)
+    stations = np.concatenate([np.empty(0)] + [station for station, _ in station_elevation])
+    elevations = np.concatenate([np.empty(0)] + [elevation for _, elevation in station_elevation])
+    left_bank = np.array([xs.left_bank_station for xs in cross_sections], dtype=float)
+    right_bank = np.array([xs.right_bank_station for xs in cross_sections], dtype=float)
+
+    def side_max(mask: np.ndarray) -> np.ndarray:
+        maxima = np.full(len(cross_sections), -np.inf)
+        np.maximum.at(maxima, segments[mask], elevations[mask])
+        return np.where(np.isneginf(maxima), np.nan, maxima)
+
+    left = side_max(stations <= left_bank[segments])
+    right = side_max(stations >= right_bank[segments])
+    # min(right, left) keeps right unless left is strictly lower, including when either is nan
+    return np.where(left < right, left, right)
+
+
+def structures_gdf(structures: list[Structure], crs: str) -> gpd.GeoDataFrame:
+    """Build the geodataframe of a list of structures in one shot by offsetting their upstream cross sections."""
+    us_xs = linestrings_from_coords([structure.us_xs.record.coords for structure in structures])
+    distances = np.array([structure.distance for structure in structures], dtype=float)
+    # match the quad_segs default of LineString.offset_curve
+    geometry = offset_curve(us_xs, distances, quad_segs=16)
+    return gdf_from_records([structure.gdf_data_dict for structure in structures], geometry, crs)
+
+
+def reaches_gdf(reaches: list[Reach], crs: str) -> gpd.GeoDataFrame:
+    """Build the geodataframe of a list of reaches in one shot."""
+    geometry = linestrings_from_coords([np.array(reach.coords, dtype=float) for reach in reaches])
+    return gdf_from_records([reach.gdf_data_dict for reach in reaches], geometry, crs)
@@ -40,6 +40,8 @@ from ripple1d.hecstac.ras.utils import (
     text_block_from_start_str_to_empty_line,
     validate_point,
 )
+from ripple1d.utils.hdf_utils import pooled_hdf
+from ripple1d.utils.ripple_utils import ReachStationIndex, linestrings_from_coords
 
 
 def name_from_suffix(fpath: str, suffix: str) -> str:
@@ -626,7 +628,7 @@ class XS:
     @cached_property
     def gdf(self):
         """Cross section geodataframe."""
-        return gpd.GeoDataFrame(self.gdf_data_dict, geometry="geometry")
+        return gpd.GeoDataFrame([self.gdf_data_dict], geometry="geometry")
 
     @cached_property
     def n_subdivisions(self) -> int:
@@ -835,24 +837,26 @@ class Structure:
         # TODO check units of the RAS model
         return float(self.structure_data(1))
 
+    @cached_property
+    def gdf_data_dict(self) -> dict:
+        """Structure geodataframe row."""
+        return {
+            "geometry": self.us_xs.geom.offset_curve(self.distance),
+            "river": self.river,
+            "reach": self.reach,
+            "river_reach": self.river_reach,
+            "river_station": self.river_station,
+            "river_reach_rs": self.river_reach_rs,
+            "type": self.type_int,
+            "distance": self.distance,
+            "width": self.width,
+            "ras_data": "\n".join(self.ras_data),
+        }
+
     @cached_property
     def gdf(self) -> gpd.GeoDataFrame:
         """Structure geodataframe."""
-        return gpd.GeoDataFrame(
-            {
-                "geometry": [LineString(self.us_xs.coords).offset_curve(self.distance)],
-                "river": [self.river],
-                "reach": [self.reach],
-                "river_reach": [self.river_reach],
-                "river_station": [self.river_station],
-                "river_reach_rs": [self.river_reach_rs],
-                "type": [self.type_int],
-                "distance": [self.distance],
-                "width": [self.width],
-                "ras_data": ["\n".join(self.ras_data)],
-            },
-            geometry="geometry",
-        )
+        return gpd.GeoDataFrame([self.gdf_data_dict], geometry="geometry")
 
     @cached_property
     def distance_to_us_xs(self):
@@ -1042,37 +1046,39 @@ class Reach:
 
         return structures
 
+    @cached_property
+    def gdf_data_dict(self) -> dict:
+        """Reach geodataframe row."""
+        return {
+            "geometry": self.geom,
+            "river": self.river,
+            "reach": self.reach,
+            "river_reach": self.river_reach,
+            # "number_of_coords": self.number_of_coords,
+            # "coords": self.coords,
+            "ras_data": "\n".join(self.ras_data),
+        }
+
     @cached_property
     def gdf(self) -> gpd.GeoDataFrame:
         """Reach geodataframe."""
-        return gpd.GeoDataFrame(
-            {
-                "geometry": [LineString(self.coords)],
-                "river": [self.river],
-                "reach": [self.reach],
-                "river_reach": [self.river_reach],
-                # "number_of_coords": [self.number_of_coords],
-                # "coords": [self.coords],
-                "ras_data": ["\n".join(self.ras_data)],
-            },
-            geometry="geometry",
-        )
+        return gpd.GeoDataFrame([self.gdf_data_dict], geometry="geometry")
 
     @cached_property
     def xs_gdf(self) -> gpd.GeoDataFrame:
         """Cross section geodataframe."""
-        gdfs = [xs.gdf for xs in self.cross_sections.values()]
-        if len(gdfs) > 0:
-            return pd.concat(gdfs)
+        if len(self.cross_sections) > 0:
+            return gpd.GeoDataFrame([xs.gdf_data_dict for xs in self.cross_sections.values()], geometry="geometry")
         else:
             return gpd.GeoDataFrame()
 
     @cached_property
     def structures_gdf(self) -> gpd.GeoDataFrame:
         """Structures geodataframe."""
-        gdfs = [structure.gdf for structure in self.structures.values()]
-        if len(gdfs) > 0:
-            return pd.concat(gdfs)
+        if len(self.structures) > 0:
+            return gpd.GeoDataFrame(
+                [structure.gdf_data_dict for structure in self.structures.values()], geometry="geometry"
+            )
         else:
             return gpd.GeoDataFrame()
 
@@ -1475,7 +1481,7 @@ class GeometryFile(CachedFile):
     def reach_gdf(self):
         """A GeodataFrame of the reaches contained in the HEC-RAS geometry file."""
         if self.reaches.values():
-            return gpd.GeoDataFrame(pd.concat([reach.gdf for reach in self.reaches.values()], ignore_index=True))
+            return gpd.GeoDataFrame([reach.gdf_data_dict for reach in self.reaches.values()], geometry="geometry")
         else:
             return None
 
@@ -1493,21 +1499,24 @@ class GeometryFile(CachedFile):
     @cached_property
     def xs_gdf(self) -> gpd.GeoDataFrame:
         """Geodataframe of all cross sections in the geometry text file."""
-        xs_gdf = pd.DataFrame([xs.gdf_data_dict for xs in self.cross_sections.values()])
+        cross_sections = list(self.cross_sections.values())
+        geometry = linestrings_from_coords(
+            [None if not xs.coords else np.array(xs.coords, dtype=float) for xs in cross_sections]
+        )
+        # seed the geometry of each cross section so deriving its attributes does not build it again
+        for xs, geom in zip(cross_sections, geometry):
+            xs.__dict__.setdefault("geom", geom)
+        xs_gdf = pd.DataFrame([xs.gdf_data_dict for xs in cross_sections])
         if len(xs_gdf) <= 0:
             return xs_gdf
         subsets = []
-        for _, reach in self.reach_gdf.iterrows():
-            subset_xs = xs_gdf.loc[xs_gdf["river_reach"] == reach["river_reach"]].copy()
-            not_reversed_xs = check_xs_direction(subset_xs, reach.geometry)
-            subset_xs["geometry"] = subset_xs.apply(
-                lambda row: (
-                    row.geometry
-                    if row["river_reach_rs"] in list(not_reversed_xs["river_reach_rs"])
-                    else reverse(row.geometry)
-                ),
-                axis=1,
-            )
+        for reach in self.reaches.values():
+            subset_xs = xs_gdf.loc[xs_gdf["river_reach"] == reach.river_reach].copy()
+            not_reversed_xs = check_xs_direction(subset_xs, reach.geom)
+            reversed_xs = ~subset_xs["river_reach_rs"].isin(not_reversed_xs["river_reach_rs"]).to_numpy()
+            geometry = subset_xs["geometry"].to_numpy(copy=True)
+            geometry[reversed_xs] = reverse(geometry[reversed_xs])
+            subset_xs["geometry"] = geometry
             subsets.append(subset_xs)
         gdf = gpd.GeoDataFrame(pd.concat(subsets))
         return self.determine_lateral_structure_xs(gdf)
@@ -1639,87 +1648,46 @@ class GeometryFile(CachedFile):
         Determine if the cross sections are connected to lateral structures,
         if they are update 'has_lateral_structures' to True.
         """
+        stations = ReachStationIndex(xs_gdf)
+        rows = []
         for structure in self.structures.values():
             if structure.type == StructureType.LATERAL_STRUCTURE:
                 try:
-                    us_rs = xs_gdf.loc[
-                        (xs_gdf["river"] == structure.river)
-                        & (xs_gdf["reach"] == structure.reach)
-                        & (xs_gdf["river_station"] > structure.river_station),
-                        "river_station",
-                    ].min()
-
-                    ds_xs = xs_gdf.loc[
-                        (xs_gdf["river"] == structure.river)
-                        & (xs_gdf["reach"] == structure.reach)
-                        & (xs_gdf["river_station"] <= us_rs)
-                    ]
-
-                    reach_len = 0
-                    river_stations = []
-                    for _, row in ds_xs.iterrows():
-                        reach_len += row["channel_reach_length"]
-                        river_stations.append(row.river_station)
-                        if reach_len > structure.distance_to_us_xs + structure.weir_length:
-                            break
-
-                    xs_gdf.loc[
-                        (xs_gdf["river"] == structure.river)
-                        & (xs_gdf["reach"] == structure.reach)
-                        & (xs_gdf["river_station"] <= max(river_stations))
-                        & (xs_gdf["river_station"] >= min(river_stations)),
-                        "has_lateral_structure",
-                    ] = True
+                    us_rs = stations.upstream_station(structure.river, structure.reach, structure.river_station)
+                    rows.append(
+                        stations.downstream_span(
+                            structure.river,
+                            structure.reach,
+                            us_rs,
+                            length=structure.distance_to_us_xs + structure.weir_length,
+                        )
+                    )
 
                     if structure.tail_water_river in xs_gdf.river:
                         if structure.multiple_xs:
-                            ds_xs = xs_gdf.loc[
-                                (xs_gdf["river"] == structure.tail_water_river)
-                                & (xs_gdf["reach"] == structure.tail_water_reach)
-                                & (xs_gdf["river_station"] <= structure.tail_water_river_station)
-                            ]
-
-                            reach_len = 0
-                            river_stations = []
-                            for _, row in ds_xs.iterrows():
-                                reach_len += row["channel_reach_length"]
-                                river_stations.append(row.river_station)
-                                if reach_len > structure.tw_distance + structure.weir_length:
-                                    break
-
-                            xs_gdf.loc[
-                                (xs_gdf["river"] == structure.tail_water_river)
-                                & (xs_gdf["reach"] == structure.tail_water_reach)
-                                & (xs_gdf["river_station"] <= max(river_stations))
-                                & (xs_gdf["river_station"] >= min(river_stations)),
-                                "has_lateral_structure",
-                            ] = True
+                            rows.append(
+                                stations.downstream_span(
+                                    structure.tail_water_river,
+                                    structure.tail_water_reach,
+                                    structure.tail_water_river_station,
+                                    length=structure.tw_distance + structure.weir_length,
+                                )
+                            )
                         else:
-                            ds_xs = xs_gdf.loc[
-                                (xs_gdf["river"] == structure.tail_water_river)
-                                & (xs_gdf["reach"] == structure.tail_water_reach)
-                                & (xs_gdf["river_station"] <= structure.tail_water_river_station)
-                            ]
-
-                            reach_len = 0
-                            river_stations = []
-                            for _, row in ds_xs.iterrows():
-                                reach_len += row["channel_reach_length"]
-                                river_stations.append(row.river_station)
-                                if len(river_stations) > 1:
-                                    break
-
-                            xs_gdf.loc[
-                                (xs_gdf["river"] == structure.tail_water_river)
-                                & (xs_gdf["reach"] == structure.tail_water_reach)
-                                & (xs_gdf["river_station"] <= max(river_stations))
-                                & (xs_gdf["river_station"] >= min(river_stations)),
-                                "has_lateral_structure",
-                            ] = True
+                            rows.append(
+                                stations.downstream_span(
+                                    structure.tail_water_river,
+                                    structure.tail_water_reach,
+                                    structure.tail_water_river_station,
+                                    count=2,
+                                )
+                            )
 
                 except InvalidStructureDataError:
                     pass
 
+        if rows:
+            xs_gdf.iloc[np.concatenate(rows), xs_gdf.columns.get_loc("has_lateral_structure")] = True
         return xs_gdf
 
     def get_subtype_gdf(self, subtype: str) -> gpd.GeoDataFrame:
@@ -1873,7 +1841,6 @@ class RASHDFFile(CachedFile):
     """Base class for parsing HDF assets (Plan and Geometry HDF files)."""
 
     _hdf_constructor = RasHdf
-    hdf_object: RasHdf
 
     def __init__(self, fpath):
         # Prevent reinitialization if the instance is already cached
@@ -1882,19 +1849,28 @@ class RASHDFFile(CachedFile):
         self._initialized = True
         self.fpath = fpath
 
-        self.hdf_object = self._hdf_constructor.open_uri(
-            fpath,
-            fsspec_kwargs={
-                "default_cache_type": "blockcache",
-                "default_block_size": 10**5,
-                "anon": (os.getenv("AWS_ACCESS_KEY_ID") is None and os.getenv("AWS_SECRET_ACCESS_KEY") is None),
-            },
-        )
+        self._remote_hdf_object = None
+        if not os.path.exists(fpath):
+            self._remote_hdf_object = self._hdf_constructor.open_uri(
+                fpath,
+                fsspec_kwargs={
+                    "default_cache_type": "blockcache",
+                    "default_block_size": 10**5,
+                    "anon": (os.getenv("AWS_ACCESS_KEY_ID") is None and os.getenv("AWS_SECRET_ACCESS_KEY") is None),
+                },
+            )
         self._root_attrs: dict | None = None
         self._geom_attrs: dict | None = None
         self._structures_attrs: dict | None = None
         self._2d_flow_attrs: dict | None = None
 
+    @property
+    def hdf_object(self) -> RasHdf:
+        """Return the open HDF file; local files are served from the shared handle pool."""
+        if self._remote_hdf_object is not None:
+            return self._remote_hdf_object
+        return pooled_hdf(self.fpath, self._hdf_constructor)
+
     @cached_property
     def file_version(self) -> str | None:
         """Return File Version."""
@@ -2098,7 +2074,6 @@ class PlanHDFFile(PlanOrGeomHDFFile):
     """Class to parse data from Plan HDF files."""
 
     _hdf_constructor = RasPlanHdf
-    hdf_object: RasPlanHdf
 
     def __init__(self, fpath: str, **kwargs):
         super().__init__(fpath, **kwargs)
@@ -2386,7 +2361,6 @@ class GeometryHDFFile(PlanOrGeomHDFFile):
     """Class to parse data from Geometry HDF files."""
 
     _hdf_constructor = RasGeomHdf
-    hdf_object: RasGeomHdf
 
     def __init__(self, fpath: str, **kwargs):
         super().__init__(fpath, **kwargs)
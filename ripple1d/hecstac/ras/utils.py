@@ -19,6 +19,7 @@ from shapely.geometry import LineString, MultiPoint, Point
 
 from ripple1d.hecstac.common.base_io import ModelFileReader
 from ripple1d.hecstac.common.s3_utils import save_bytes_s3
+from ripple1d.utils.ripple_utils import fixed_width_array
 
 
 def export_thumbnail(layers: list[Callable], title: str, crs: CRS, filepath: str):
@@ -191,16 +192,8 @@ def text_block_from_start_str_length(start_str: str, number_of_lines: int, lines
 
 def data_pairs_from_text_block(lines: list[str], width: int) -> list[tuple[float, float]]:
     """Split lines at given width to get paired data string. Split the string in half and convert to tuple of floats."""
-    pairs = []
-    for line in lines:
-        if line == "               .               .":
-            continue
-        for i in range(0, len(line), width):
-            x = line[i : int(i + width / 2)]
-            y = line[int(i + width / 2) : int(i + width)]
-            pairs.append((float(x), float(y)))
-
-    return pairs
+    lines = [line for line in lines if line != "               .               ."]
+    return list(map(tuple, fixed_width_array(lines, width // 2, 2).tolist()))
 
 
 def delimited_pairs_to_lists(lines: list[str]) -> tuple[list[float], list[float]]:
@@ -219,15 +212,7 @@ def delimited_pairs_to_lists(lines: list[str]) -> tuple[list[float], list[float]
 
 def data_triplets_from_text_block(lines: list[str], width: int) -> list[tuple[float]]:
     """Split lines at given width to get paired data string. Split the string in half and convert to tuple of floats."""
-    pairs = []
-    for line in lines:
-        for i in range(0, len(line), width):
-            x = line[i : int(i + width / 3)]
-            y = line[int(i + width / 3) : int(i + (width * 2 / 3))]
-            z = line[int(i + (width * 2 / 3)) : int(i + (width))]
-            pairs.append((float(x), float(y), float(z)))
-
-    return pairs
+    return list(map(tuple, fixed_width_array(lines, width // 3, 3).tolist()))
 
 
 def check_xs_direction(cross_sections: gpd.GeoDataFrame, reach: LineString):
@@ -4,9 +4,11 @@ import glob
 import logging
 
 from ripple1d.hecstac.ras.item import RASModelItem
+from ripple1d.utils.hdf_utils import release_hdf_pool
 from ripple1d.utils.ripple_utils import prj_is_ras
 
 
+@release_hdf_pool
 def gpkg_from_ras(source_model_directory: str, crs: str, metadata: dict):
     """Write geometry and flow data to a geopackage locally.
 
@@ -8,7 +8,7 @@ from typing import Callable
 
 from ripple1d.consts import SUPPRESS_LOGS
 from ripple1d.hecstac.ras_to_gpkg import gpkg_from_ras
-from ripple1d.ops.fim_lib import create_fim_lib, create_rating_curves_db
+from ripple1d.ops.fim_lib import consolidate_rating_curves_dbs, create_fim_lib, create_rating_curves_db
 from ripple1d.ops.metrics import compute_conflation_metrics
 from ripple1d.ops.ras_conflate import conflate_model
 from ripple1d.ops.ras_run import (
@@ -31,6 +31,7 @@ func_lookup = {
     "run_known_wse": run_known_wse,
     "create_fim_lib": create_fim_lib,
     "create_rating_curves_db": create_rating_curves_db,
+    "consolidate_rating_curves_dbs": consolidate_rating_curves_dbs,
 }
 
 
@@ -3,54 +3,57 @@
 import glob
 import json
 import logging
+import multiprocessing
 import os
 import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Iterator
 
 import rasterio
 from pyproj import CRS
 
 # from osgeo import gdal
-from rasterio.enums import Resampling
 
+from ripple1d.consts import CONSOLIDATE_SHARD_SIZE, DEPTH_GRID_GDAL_CACHE_MB, SQLITE_ATTACH_BATCH_SIZE
 from ripple1d.data_model import NwmReachModel
 from ripple1d.errors import DepthGridNotFoundError
 from ripple1d.ras import RasManager
 from ripple1d.utils.dg_utils import (
+    WarpPlan,
+    raster_content_hash,
     reproject_raster,
+    reproject_raster_to_cog,
+    write_depth_cube,
 )
+from ripple1d.utils.hdf_utils import release_hdf_pool
+from ripple1d.utils.rating_curve_utils import rating_curves_db_to_parquet
+from ripple1d.utils.ripple_utils import bounded_map
 from ripple1d.utils.sqlite_utils import (
     create_db_and_table,
+    create_rating_curves_index,
+    depth_grid_aliases_to_sqlite,
+    merge_rating_curves_dbs,
+    merge_rating_curves_shard,
+    rating_curves_db_connection,
     rating_curves_to_sqlite,
     zero_depth_to_sqlite,
 )
 
 
-def post_process_depth_grids(
-    rm: RasManager,
-    plan_name: str,
-    dest_directory: str,
-    accept_missing_grid: bool = False,
-    cog=False,
-    dest_crs: CRS = 5070,
-    resolution: float = 3,
-    resolution_units: str = "Meters",
-) -> tuple[list[str]]:
-    """Clip depth grids based on their associated NWM branch and respective cross sections."""
-    if resolution and not resolution_units:
-        raise ValueError(
-            f"The 'resolution' arg has been provided but 'resolution_units' arg has not been provided. Please provide both"
-        )
-
-    if resolution_units:
-        if resolution_units not in ["Feet", "Meters"]:
-            raise ValueError(f"Invalid resolution_units: {resolution_units}. expected 'Feet' or 'Meters'")
-
+def depth_grid_sources(rm: RasManager, plan_name: str, accept_missing_grid: bool = False) -> list[tuple[str, str, str]]:
+    """Return the HEC-RAS depth grid of each profile of a plan with its FIM library depth (z_*) and flow (f_*) names."""
     profile_name_map = json.loads(rm.plans[plan_name].flow.description)
+    src_dir = os.path.join(rm.ras_project._ras_dir, str(plan_name))
+    terrain_dir = os.path.join(rm.ras_project._ras_dir, "Terrain")
+    terrain_part = os.path.basename(glob.glob(terrain_dir + "\\*.tif")[0]).split(".")[-2]
+
+    sources = []
     for profile_name in rm.plans[plan_name].flow.profile_names:
         # construct the default path to the depth grid for this plan/profile
-        src_dir = os.path.join(rm.ras_project._ras_dir, str(plan_name))
-        terrain_dir = os.path.join(rm.ras_project._ras_dir, "Terrain")
-        terrain_part = os.path.basename(glob.glob(terrain_dir + "\\*.tif")[0]).split(".")[-2]
         src_path = os.path.join(
             src_dir,
             f"Depth ({profile_name}).{rm.ras_project.title}.{terrain_part}.tif",
@@ -70,22 +73,275 @@ def post_process_depth_grids(
         elif "nd" in plan_name:
             flow = f"f_{new_profile_name}"
             depth = "z_nd"
+        sources.append((src_path, depth, flow))
+    return sources
+
+
+def create_depth_cube(
+    rm: RasManager,
+    plan_names: list[str],
+    dest_path: str,
+    accept_missing_grid: bool = False,
+    dest_crs: CRS = 5070,
+    resolution: float = 3,
+    resolution_units: str = "Meters",
+    gdal_cache_mb: int = DEPTH_GRID_GDAL_CACHE_MB,
+    depth_scale: float = None,
+) -> str:
+    """
+    Write the depth grids of every profile of the plans of a reach into one multi-band depth cube.
+
+    Each band holds one profile, tagged with its us_flow, ds_wse (omitted for normal depth), and boundary_condition and
+    described by its FIM library path (e.g. z_nd/f_100); see read_depth_cube_profiles. Bands are ordered by boundary
+    condition, ds_wse, and us_flow. A profile produced by several plans keeps the grid of the last plan. Depths are
+    quantized to uint16 multiples of depth_scale if it is given (see reproject_raster).
+    """
+    profiles = {}
+    for plan_name in plan_names:
+        boundary_condition = "kwse" if "kwse" in plan_name else "nd"
+        for src_path, depth, flow in depth_grid_sources(rm, plan_name, accept_missing_grid):
+            tags = {"us_flow": flow[2:], "boundary_condition": boundary_condition}
+            if depth != "z_nd":
+                tags["ds_wse"] = depth[2:].replace("_", ".")
+            profiles[(depth, flow)] = (src_path, tags)
+    if not profiles:
+        logging.warning(f"No depth grids found for {plan_names}; depth cube not written")
+        return None
+
+    def band_order(key):
+        # nan never compares, so normal depth profiles (without ds_wse) sort on a flag rather than a nan ds_wse
+        tags = profiles[key][1]
+        ds_wse = tags.get("ds_wse")
+        return (tags["boundary_condition"], ds_wse is None, float(ds_wse or 0), float(tags["us_flow"]))
+
+    keys = sorted(profiles, key=band_order)
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    with rasterio.Env(GDAL_CACHEMAX=gdal_cache_mb):
+        write_depth_cube(
+            [profiles[key][0] for key in keys],
+            dest_path,
+            CRS(dest_crs),
+            [profiles[key][1] for key in keys],
+            ["/".join(key) for key in keys],
+            resolution,
+            resolution_units,
+            predictor="3" if depth_scale is None else "2",
+            depth_scale=depth_scale,
+        )
+    return dest_path
+
+
+def post_process_depth_grids(
+    rm: RasManager,
+    plan_name: str,
+    dest_directory: str,
+    accept_missing_grid: bool = False,
+    cog=False,
+    dest_crs: CRS = 5070,
+    resolution: float = 3,
+    resolution_units: str = "Meters",
+    workers: int = 1,
+    executor: str = "process",
+    gdal_cache_mb: int = DEPTH_GRID_GDAL_CACHE_MB,
+    depth_scale: float = None,
+    deduplicate: bool = False,
+    grid_hashes: dict[str, str] = None,
+    canonical_grids: dict[str, str] = None,
+) -> dict[str, str]:
+    """Clip depth grids based on their associated NWM branch and respective cross sections.
+
+    The nearest-neighbour warp shared by the depth grids of the plan is computed once (see WarpPlan). Depth grids are
+    reprojected one at a time unless workers > 1 (or None for every CPU), in which case a pool of workers ("process"
+    or "thread") reprojects them with a bounded number of grids in flight.
+    gdal_cache_mb limits the GDAL block cache of each worker process; threads share one process-wide cache of
+    workers * gdal_cache_mb. Depths are quantized to uint16 multiples of depth_scale if it is given.
+
+    If deduplicate, the pool first hashes every depth grid, and a grid bit-identical to an earlier grid (see
+    raster_content_hash) is not written. grid_hashes maps content hashes to the canonical grids written so far and
+    canonical_grids maps every grid processed so far to its canonical grid; both are updated in place and may be shared
+    across plans (see keep_overwritten_grids). Returns the canonical grid ({depth}/{flow}.tif) of every depth grid of
+    the plan.
+    """
+    if resolution and not resolution_units:
+        raise ValueError(
+            f"The 'resolution' arg has been provided but 'resolution_units' arg has not been provided. Please provide both"
+        )
+
+    if resolution_units:
+        if resolution_units not in ["Feet", "Meters"]:
+            raise ValueError(f"Invalid resolution_units: {resolution_units}. expected 'Feet' or 'Meters'")
+    if executor not in ["process", "thread"]:
+        raise ValueError(f"Invalid executor: {executor}. expected 'process' or 'thread'")
+
+    grid_hashes = {} if grid_hashes is None else grid_hashes
+    canonical_grids = {} if canonical_grids is None else canonical_grids
+    sources = [
+        (src_path, f"{depth}/{flow}.tif", os.path.join(dest_directory, depth, f"{flow}.tif"))
+        for src_path, depth, flow in depth_grid_sources(rm, plan_name, accept_missing_grid)
+    ]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(sources)))
+    # split the cores between the workers so GDAL's own compression threads do not oversubscribe them
+    num_threads = max(1, min(4, (os.cpu_count() or 1) // workers))
+    with tempfile.TemporaryDirectory() as plan_directory, depth_grid_pool(workers, executor, gdal_cache_mb) as pool_map:
+        content_hashes = [None] * len(sources)
+        if deduplicate:
+            # the source grids are read in full to hash them, so they are hashed by the pool too
+            content_hashes = list(pool_map(raster_content_hash, [(src_path,) for src_path, _, _ in sources]))
+            plan_hashes = {grid: content_hash for (_, grid, _), content_hash in zip(sources, content_hashes)}
+            keep_overwritten_grids(plan_hashes, dest_directory, grid_hashes, canonical_grids)
+
+        plan_grids = {}
+        tasks = []
+        for (src_path, grid, dest_path), content_hash in zip(sources, content_hashes):
+            plan_grids[grid] = grid
+            if deduplicate:
+                plan_grids[grid] = grid_hashes.setdefault(content_hash, grid)
+            canonical_grids[grid] = plan_grids[grid]
+            if plan_grids[grid] != grid:
+                logging.debug(f"{src_path} is identical to {plan_grids[grid]}; not writing {dest_path}")
+                # drop a copy written by an earlier run without deduplication
+                if os.path.exists(dest_path):
+                    os.remove(dest_path)
+                continue
 
-        flow_sub_directory = os.path.join(dest_directory, depth)
-        os.makedirs(flow_sub_directory, exist_ok=True)
-        dest_path = os.path.join(flow_sub_directory, f"{flow}.tif")
-        logging.debug(dest_path)
-        reproject_raster(src_path, dest_path, CRS(dest_crs), resolution, resolution_units, tiled=True)
-        logging.debug(f"Building overviews for: {dest_path}")
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            tasks.append((src_path, dest_path, dest_crs, resolution, resolution_units, cog))
+
+        warp_plan = None
+        if len(tasks) > 1:
+            # every depth grid of a plan is on the grid of its terrain, so the nearest-neighbour warp is planned once
+            warp_plan = WarpPlan.from_raster(tasks[0][0], CRS(dest_crs), resolution, resolution_units, tiled=True)
+            if workers > 1 and executor == "process":
+                warp_plan.save(os.path.join(plan_directory, "warp_plan.npy"))
+        # threads share the GDAL block cache of this process, so its limit is set once rather than per grid
+        task_cache_mb = None if workers > 1 and executor == "thread" else gdal_cache_mb
+        tasks = [task + (num_threads, task_cache_mb, warp_plan, depth_scale) for task in tasks]
+        for _ in pool_map(post_process_depth_grid, tasks):
+            pass
+    return plan_grids
+
+
+def keep_overwritten_grids(
+    plan_hashes: dict[str, str], dest_directory: str, grid_hashes: dict[str, str], canonical_grids: dict[str, str]
+):
+    """
+    Keep the content of canonical grids of earlier plans that a plan is about to overwrite with different content.
+
+    plan_hashes maps the grids of the plan to their content hashes. The earlier content of an overwritten canonical
+    grid is copied to the first of its aliases that the plan does not write, which becomes the canonical grid of the
+    others and of that content; without such an alias the content is dropped from grid_hashes.
+    """
+    for grid, content_hash in plan_hashes.items():
+        for old_hash in [h for h, canonical in grid_hashes.items() if canonical == grid and h != content_hash]:
+            aliases = [g for g, canonical in canonical_grids.items() if canonical == grid and g not in plan_hashes]
+            if not aliases:
+                del grid_hashes[old_hash]
+                continue
+            logging.info(f"{grid} is replaced by different content; keeping its earlier content as {aliases[0]}")
+            dest_path = os.path.join(dest_directory, aliases[0])
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            shutil.copyfile(os.path.join(dest_directory, grid), dest_path)
+            grid_hashes[old_hash] = aliases[0]
+            for alias in aliases:
+                canonical_grids[alias] = aliases[0]
+
+
+@contextmanager
+def depth_grid_pool(workers: int, executor: str, gdal_cache_mb: int) -> Iterator[Callable]:
+    """
+    Start the pool of depth grid workers and yield a function mapping a function over argument tuples in order.
 
+    A single worker maps in this process. Otherwise at most 2 * workers tasks are in flight (see bounded_map).
+    """
+    if workers == 1:
+        yield lambda func, tasks: (func(*args) for args in tasks)
+    elif executor == "process":
+        # spawned workers start a fresh GDAL so each one picks up its own cache limit; their log records are
+        # handled by the handlers of this process
+        context = multiprocessing.get_context("spawn")
+        log_queue = context.Queue()
+        listener = QueueListener(log_queue, *logging.getLogger().handlers, respect_handler_level=True)
+        listener.start()
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=context,
+                initializer=init_depth_grid_worker,
+                initargs=(gdal_cache_mb, log_queue, logging.getLogger().getEffectiveLevel()),
+            ) as pool:
+                yield lambda func, tasks: bounded_map(pool, func, tasks, 2 * workers)
+        finally:
+            listener.stop()
+    else:
+        with rasterio.Env(GDAL_CACHEMAX=gdal_cache_mb * workers), ThreadPoolExecutor(max_workers=workers) as pool:
+            yield lambda func, tasks: bounded_map(pool, func, tasks, 2 * workers)
+
+
+def init_depth_grid_worker(gdal_cache_mb: int, log_queue: multiprocessing.Queue = None, log_level: int = logging.INFO):
+    """Limit the GDAL block cache of a depth grid worker process before GDAL is initialized and forward its logs."""
+    os.environ["GDAL_CACHEMAX"] = str(gdal_cache_mb)
+    if log_queue is not None:
+        root = logging.getLogger()
+        root.handlers = [QueueHandler(log_queue)]
+        root.setLevel(log_level)
+
+
+def post_process_depth_grid(
+    src_path: str,
+    dest_path: str,
+    dest_crs: CRS,
+    resolution: float,
+    resolution_units: str,
+    cog: bool,
+    num_threads: int = 4,
+    gdal_cache_mb: int = DEPTH_GRID_GDAL_CACHE_MB,
+    warp_plan: WarpPlan = None,
+    depth_scale: float = None,
+):
+    """
+    Reproject one depth grid into the FIM library, as a Cloud Optimized GeoTIFF if cog.
+
+    gdal_cache_mb limits the GDAL block cache while the grid is written; None keeps the cache of the process.
+    """
+    # horizontal differencing suits quantized depths; floating point prediction suits float depths
+    predictor = "3" if depth_scale is None else "2"
+    logging.debug(dest_path)
+    with rasterio.Env(GDAL_CACHEMAX=gdal_cache_mb) if gdal_cache_mb else nullcontext():
         if cog:
-            with rasterio.open(dest_path, "r+") as dst:
-                dst.build_overviews([4, 8, 16], Resampling.nearest)
-                dst.update_tags(ns="rio_overview", resampling="nearest")
+            reproject_raster_to_cog(
+                src_path,
+                dest_path,
+                CRS(dest_crs),
+                resolution,
+                resolution_units,
+                predictor=predictor,
+                num_threads=num_threads,
+                warp_plan=warp_plan,
+                depth_scale=depth_scale,
+            )
+        else:
+            reproject_raster(
+                src_path,
+                dest_path,
+                CRS(dest_crs),
+                resolution,
+                resolution_units,
+                predictor=predictor,
+                tiled=True,
+                num_threads=num_threads,
+                warp_plan=warp_plan,
+                depth_scale=depth_scale,
+            )
 
 
+@release_hdf_pool
 def create_rating_curves_db(
-    submodel_directory: str, plans: list, ras_version: str = "631", table_name: str = "rating_curves"
+    submodel_directory: str,
+    plans: list,
+    ras_version: str = "631",
+    table_name: str = "rating_curves",
+    parquet_directory: str = None,
+    use_geom_cache: bool = False,
 ):
     """Create a new rating curve database for a NWM id.
 
@@ -103,11 +359,18 @@ def create_rating_curves_db(
     table_name : str, optional
         name for the table holding stage-discharge rating curves in the output
         database, by default "rating_curves"
+    parquet_directory : str, optional
+        root directory of a Parquet dataset (partitioned by reach_id) the rating
+        curves are also written to, by default None (SQLite only)
+    use_geom_cache : bool, optional
+        whether to read parsed geometry from, and write it to, a binary sidecar
+        cache next to each geometry file (e.g. model.g01.ripple-cache), by
+        default False
 
     Returns
     -------
     dict
-        dictionary with paths to output rating curve database
+        dictionary with paths to output rating curve database (and Parquet dataset)
     """
     logging.info(f"create_rating_curves_db starting")
 
@@ -118,42 +381,138 @@ def create_rating_curves_db(
         version=ras_version,
         terrain_path=nwm_rm.ras_terrain_hdf,
         crs=nwm_rm.crs,
+        lazy=True,
+        use_geom_cache=use_geom_cache,
     )
 
     # create dabase and table
     if not os.path.exists(nwm_rm.fim_results_database):
         create_db_and_table(nwm_rm.fim_results_database, table_name)
 
-    for plan in plans:
-        if f"{nwm_rm.model_name}_{plan}" not in rm.plans:
-            logging.error(f"Plan {nwm_rm.model_name}_{plan} not found in the model, skipping...")
-            continue
-        else:
-            missing_grids = find_missing_grids(rm, f"{nwm_rm.model_name}_{plan}")
-
-        if f"kwse" in plan:
-            rating_curves_to_sqlite(
-                rm,
-                f"{nwm_rm.model_name}_{plan}",
-                plan,
-                nwm_rm.model_name,
-                missing_grids,
-                nwm_rm.fim_results_database,
-                table_name,
-            )
-        if f"nd" in plan:
-            zero_depth_to_sqlite(
-                rm,
-                f"{nwm_rm.model_name}_{plan}",
-                plan,
-                nwm_rm.model_name,
-                missing_grids,
-                nwm_rm.fim_results_database,
-                table_name,
-            )
+    # reuse one connection across the plans so each plan is inserted in a single transaction
+    with rating_curves_db_connection(nwm_rm.fim_results_database) as conn:
+        # databases created before the lookup index existed get it here
+        create_rating_curves_index(conn, table_name)
+        for plan in plans:
+            if f"{nwm_rm.model_name}_{plan}" not in rm.plans:
+                logging.error(f"Plan {nwm_rm.model_name}_{plan} not found in the model, skipping...")
+                continue
+            else:
+                missing_grids = find_missing_grids(rm, f"{nwm_rm.model_name}_{plan}")
+
+            if f"kwse" in plan:
+                rating_curves_to_sqlite(
+                    rm,
+                    f"{nwm_rm.model_name}_{plan}",
+                    plan,
+                    nwm_rm.model_name,
+                    missing_grids,
+                    nwm_rm.fim_results_database,
+                    table_name,
+                    conn,
+                )
+            if f"nd" in plan:
+                zero_depth_to_sqlite(
+                    rm,
+                    f"{nwm_rm.model_name}_{plan}",
+                    plan,
+                    nwm_rm.model_name,
+                    missing_grids,
+                    nwm_rm.fim_results_database,
+                    table_name,
+                    conn,
+                )
+
+    # write any htab fixes made to the geometry while it was read
+    rm.save_geoms()
+
+    results = {"rating_curve_database": nwm_rm.fim_results_database}
+    if parquet_directory:
+        logging.info(f"Exporting rating curves to {parquet_directory}")
+        results["rating_curve_parquet"] = rating_curves_db_to_parquet(
+            nwm_rm.fim_results_database, parquet_directory, table_name
+        )
 
     logging.info(f"create_rating_curves_db complete")
-    return {"rating_curve_database": nwm_rm.fim_results_database}
+    return results
+
+
+def consolidate_rating_curves_dbs(
+    library_directory: str,
+    output_database: str,
+    databases: list = None,
+    table_name: str = "rating_curves",
+    workers: int = None,
+):
+    """Consolidate the rating curve databases of many NWM reaches into one regional database.
+
+    Worker processes merge shares of the per-reach databases into temporary shard databases with batched ATTACH and
+    INSERT ... SELECT; a single writer merges the shards into the regional database as they complete. The lookup
+    index is created once all rows are loaded.
+
+    Parameters
+    ----------
+    library_directory : str
+        The directory holding the per-reach rating curve databases (<nwm_id>.db)
+    output_database : str
+        The path of the regional rating curve database; rows are added to it if it already exists
+    databases : list, optional
+        Paths of the per-reach databases to consolidate, by default every .db file in library_directory
+    table_name : str, optional
+        name of the table holding stage-discharge rating curves, by default "rating_curves"
+    workers : int, optional
+        number of worker processes, by default the number of CPUs; with 1 the per-reach databases are merged directly
+        into the regional database
+
+    Returns
+    -------
+    dict
+        dictionary with the path to the regional database and the numbers of databases merged and skipped
+    """
+    logging.info(f"consolidate_rating_curves_dbs starting")
+
+    if databases is None:
+        databases = sorted(glob.glob(os.path.join(library_directory, "*.db")))
+    databases = [db for db in databases if os.path.abspath(db) != os.path.abspath(output_database)]
+    shards = [databases[i : i + CONSOLIDATE_SHARD_SIZE] for i in range(0, len(databases), CONSOLIDATE_SHARD_SIZE)]
+    workers = min(workers or os.cpu_count() or 1, len(shards))
+
+    if not os.path.exists(output_database):
+        create_db_and_table(output_database, table_name, create_index=False)
+
+    skipped = []
+    with rating_curves_db_connection(output_database) as conn:
+        if workers <= 1:
+            for i in range(0, len(databases), SQLITE_ATTACH_BATCH_SIZE):
+                skipped += merge_rating_curves_dbs(conn, databases[i : i + SQLITE_ATTACH_BATCH_SIZE], table_name)
+        else:
+            shard_directory = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_database)))
+            try:
+                shard_names = [os.path.join(shard_directory, f"shard_{i}.db") for i in range(len(shards))]
+                tasks = [(shard, shard_name, table_name) for shard, shard_name in zip(shards, shard_names)]
+                # spawn rather than fork the workers, so they do not inherit the open connection or log handlers
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                    # bound the shards in flight; merge them in submission order so results do not depend on timing
+                    results = bounded_map(executor, merge_rating_curves_shard, tasks, 2 * workers)
+                    for shard_name, shard_skipped in zip(shard_names, results):
+                        skipped += shard_skipped
+                        merge_rating_curves_dbs(conn, [shard_name], table_name)
+                        os.remove(shard_name)
+            finally:
+                shutil.rmtree(shard_directory, ignore_errors=True)
+
+        logging.info(f"Creating rating curve indexes for {output_database}")
+        create_rating_curves_index(conn, table_name)
+        conn.execute("ANALYZE")
+        conn.commit()
+
+    logging.info(f"consolidate_rating_curves_dbs complete: {len(databases) - len(skipped)} databases merged")
+    return {
+        "rating_curve_database": output_database,
+        "merged_databases": len(databases) - len(skipped),
+        "skipped_databases": skipped,
+    }
 
 
 def find_missing_grids(
@@ -182,6 +541,7 @@ def find_missing_grids(
     return missing_grids
 
 
+@release_hdf_pool
 def create_fim_lib(
     submodel_directory: str,
     plans: list,
@@ -192,6 +552,12 @@ def create_fim_lib(
     resolution: float = 3,
     resolution_units: str = "Meters",
     dest_crs: str = 5070,
+    workers: int = 1,
+    executor: str = "process",
+    depth_grid_format: str = "tif",
+    depth_scale: float = None,
+    deduplicate: bool = False,
+    use_geom_cache: bool = False,
 ):
     """Create a new FIM library for a NWM id.
 
@@ -219,6 +585,29 @@ def create_fim_lib(
         unit for resolution, by default "Meters"
     dest_crs : str, optional
         Destination crs.
+    workers : int, optional
+        number of depth grids post-processed at once; 0 or None uses the
+        number of CPUs, by default 1 (one grid at a time in this process)
+    executor : str, optional
+        run the depth grid workers as "process"es (each with its own GDAL
+        cache) or "thread"s (sharing one cache), by default "process"
+    depth_grid_format : str, optional
+        "tif" writes one GeoTIFF per profile ({depth}/{flow}.tif); "cube"
+        writes the profiles of every plan into the bands of a single tiled
+        GeoTIFF (cube/depth_cube.tif), by default "tif"
+    depth_scale : float, optional
+        store depths as uint16 multiples of depth_scale in the vertical units
+        of the model (e.g. 0.01 for hundredths of a foot), with the scale in
+        the band metadata, nodata 65535, and predictor 2; by default depths
+        are stored as float32
+    deduplicate : bool, optional
+        write depth grids bit-identical to an earlier grid of the reach only
+        once and record the others as aliases of it in the depth_grid_aliases
+        table of the rating curve database of the submodel, by default False
+    use_geom_cache : bool, optional
+        whether to read parsed geometry from, and write it to, a binary sidecar
+        cache next to each geometry file (e.g. model.g01.ripple-cache), by
+        default False
 
     Returns
     -------
@@ -226,6 +615,11 @@ def create_fim_lib(
         dictionary with paths to output rasters and rating curve database
     """
     logging.info(f"create_fim_lib starting")
+    if depth_grid_format not in ["tif", "cube"]:
+        raise ValueError(f"Invalid depth_grid_format: {depth_grid_format}. expected 'tif' or 'cube'")
+    if deduplicate and depth_grid_format != "tif":
+        raise ValueError("deduplicate is only supported for depth_grid_format 'tif'")
+
     nwm_rm = NwmReachModel(submodel_directory, library_directory)
 
     rm = RasManager(
@@ -233,13 +627,17 @@ def create_fim_lib(
         version=ras_version,
         terrain_path=nwm_rm.ras_terrain_hdf,
         crs=nwm_rm.crs,
+        lazy=True,
+        use_geom_cache=use_geom_cache,
     )
 
+    plan_names, grid_hashes, canonical_grids = [], {}, {}
     for plan in plans:
         if f"{nwm_rm.model_name}_{plan}" not in rm.plans:
             logging.error(f"Plan {nwm_rm.model_name}_{plan} not found in the model, skipping...")
             continue
-        else:
+        plan_names.append(f"{nwm_rm.model_name}_{plan}")
+        if depth_grid_format == "tif":
             post_process_depth_grids(
                 rm,
                 f"{nwm_rm.model_name}_{plan}",
@@ -249,11 +647,44 @@ def create_fim_lib(
                 resolution=resolution,
                 resolution_units=resolution_units,
                 dest_crs=dest_crs,
+                workers=workers,
+                executor=executor,
+                depth_scale=depth_scale,
+                deduplicate=deduplicate,
+                grid_hashes=grid_hashes,
+                canonical_grids=canonical_grids,
             )
-
+            if cleanup:
+                shutil.rmtree(os.path.join(rm.ras_project._ras_dir, f"{nwm_rm.model_name}_{plan}"), ignore_errors=True)
+
+    result = {"fim_results_directory": nwm_rm.fim_results_directory}
+    if deduplicate:
+        rating_curves_database = NwmReachModel(submodel_directory, submodel_directory).fim_results_database
+        if not os.path.exists(rating_curves_database):
+            create_db_and_table(rating_curves_database, "rating_curves")
+        canonical_grids = {
+            f"{nwm_rm.model_name}/{grid}": f"{nwm_rm.model_name}/{canonical}"
+            for grid, canonical in canonical_grids.items()
+        }
+        depth_grid_aliases_to_sqlite(rating_curves_database, nwm_rm.model_name, canonical_grids)
+        result["deduplicated_depth_grids"] = sum(grid != canonical for grid, canonical in canonical_grids.items())
+    if depth_grid_format == "cube":
+        result["depth_cube"] = create_depth_cube(
+            rm,
+            plan_names,
+            nwm_rm.fim_depth_cube_file,
+            accept_missing_grid=True,
+            dest_crs=dest_crs,
+            resolution=resolution,
+            resolution_units=resolution_units,
+            depth_scale=depth_scale,
+        )
+        # the depth grids of every plan are needed until the cube is written
         if cleanup:
-            shutil.rmtree(os.path.join(rm.ras_project._ras_dir, f"{nwm_rm.model_name}_{plan}"), ignore_errors=True)
+            for plan_name in plan_names:
+                shutil.rmtree(os.path.join(rm.ras_project._ras_dir, plan_name), ignore_errors=True)
 
+    rm.save_geoms()
     logging.info(f"create_fim_lib complete")
 
-    return {"fim_results_directory": nwm_rm.fim_results_directory}
+    return result
@@ -14,8 +14,10 @@ from ripple1d.consts import DEFAULT_EPSG, MIN_FLOW
 from ripple1d.data_model import FlowChangeLocation, NwmReachModel
 from ripple1d.errors import UnitsError
 from ripple1d.ras import RasManager
+from ripple1d.utils.hdf_utils import release_hdf_pool
 
 
+@release_hdf_pool
 def create_model_run_normal_depth(
     submodel_directory: str,
     plan_suffix: str,
@@ -118,6 +120,7 @@ def create_model_run_normal_depth(
     return {f"{nwm_rm.model_name}_{plan_suffix}": asdict(fcl), "pid": pid}
 
 
+@release_hdf_pool
 def run_incremental_normal_depth(
     submodel_directory: str,
     plan_suffix: str,
@@ -125,6 +128,7 @@ def run_incremental_normal_depth(
     depth_increment=0.5,
     write_depth_grids: str = True,
     show_ras: bool = False,
+    use_geom_cache: bool = False,
 ):
     """Write and compute incremental normal depth runs to develop rating curves and depth grids.
 
@@ -145,6 +149,10 @@ def run_incremental_normal_depth(
         whether to run HEC-RAS headless or not, by default False
     task_id : str, optional
         Task ID to use for logging, by default ""
+    use_geom_cache : bool, optional
+        whether to read parsed geometry from, and write it to, a binary sidecar
+        cache next to each geometry file (e.g. model.g01.ripple-cache), by
+        default False
 
     Returns
     -------
@@ -182,6 +190,7 @@ def run_incremental_normal_depth(
         version=ras_version,
         terrain_path=nwm_rm.ras_terrain_hdf,
         crs=nwm_rm.crs,
+        use_geom_cache=use_geom_cache,
     )
 
     # determine flow increments
@@ -214,10 +223,12 @@ def run_incremental_normal_depth(
         run_ras=True,
         flow_file_description=json.dumps(profile_name_map),
     )
+    rm.save_geoms()
     logging.info("run_incremental_normal_depth complete")
     return {f"{nwm_rm.model_name}_{plan_suffix}": asdict(fcl), "pid": pid}
 
 
+@release_hdf_pool
 def run_known_wse(
     submodel_directory: str,
     plan_suffix: str,
@@ -227,6 +238,7 @@ def run_known_wse(
     ras_version: str = "631",
     write_depth_grids: str = True,
     show_ras: bool = False,
+    use_geom_cache: bool = False,
 ):
     """Write and compute known water surface elevation runs to develop rating curves and depth grids.
 
@@ -250,6 +262,10 @@ def run_known_wse(
         whether to run HEC-RAS headless or not, by default False
     task_id : str, optional
         Task ID to use for logging, by default ""
+    use_geom_cache : bool, optional
+        whether to read parsed geometry from, and write it to, a binary sidecar
+        cache next to each geometry file (e.g. model.g01.ripple-cache), by
+        default False
 
     Returns
     -------
@@ -281,7 +297,13 @@ def run_known_wse(
     known_water_surface_elevations = np.arange(start_elevation, max_elevation + depth_increment, depth_increment)
 
     # write and compute flow/plans for known water surface elevation runs
-    rm = RasManager(nwm_rm.ras_project_file, version=ras_version, terrain_path=nwm_rm.ras_terrain_hdf, crs=nwm_rm.crs)
+    rm = RasManager(
+        nwm_rm.ras_project_file,
+        version=ras_version,
+        terrain_path=nwm_rm.ras_terrain_hdf,
+        crs=nwm_rm.crs,
+        use_geom_cache=use_geom_cache,
+    )
 
     # get resulting depths from the second normal depth runs_nd
     rm.plan = rm.plans[f"{nwm_rm.model_name}_nd"]
@@ -326,6 +348,7 @@ def run_known_wse(
             show_ras=show_ras,
             run_ras=True,
         )
+    rm.save_geoms()
     logging.info("run_known_wse complete")
     return {f"{nwm_rm.model_name}_{plan_suffix}": {"kwse": known_water_surface_elevations.tolist()}, "pid": pid}
 
@@ -334,13 +357,13 @@ def get_flow_depth_arrays(
     rm: RasManager, river: str, reach: str, river_station: str, thalweg: float
 ) -> tuple[pd.Series]:
     """Create new flow, depth,wse arrays from rating curve-plans results."""
-    # read in flow/wse
-    profile_name_map = json.loads(rm.plan.flow.description)
-    wses, flows = rm.plan.read_rating_curves(profile_name_map)
-
     # get the river_reach_rs for the cross section representing the upstream end of this reach
     river_reach_rs = f"{river} {reach} {str(river_station)}"
 
+    # read in flow/wse
+    profile_name_map = json.loads(rm.plan.flow.description)
+    wses, flows = rm.plan.read_rating_curves(profile_name_map, [river_reach_rs])
+
     wse = wses.loc[river_reach_rs, :]
     flow = flows.loc[river_reach_rs, :]
     df = pd.DataFrame({"wse": wse.round(1), "flow": flow.astype(int)}).drop_duplicates()
@@ -408,7 +431,7 @@ def create_flow_depth_combinations(
 
 def get_kwse_from_ds_model(ds_nwm_id: str, ds_nwm_ras_project_file: str, plan_names: str) -> tuple[float]:
     """Get the kwse values from the downstream model."""
-    rm = RasManager(ds_nwm_ras_project_file, crs=DEFAULT_EPSG)
+    rm = RasManager(ds_nwm_ras_project_file, crs=DEFAULT_EPSG, lazy=True)
     wses = []
     for plan_name in plan_names:
         if plan_name not in rm.plans.keys():
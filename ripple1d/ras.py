@@ -1,22 +1,23 @@
 """RAS Class and functions."""
 
 import glob
+import io
 import json
 import logging
 import os
 import platform
-import re
 import subprocess
 import time
 import warnings
-from functools import lru_cache
+from functools import wraps
 from pathlib import Path
-from typing import List
+from typing import List, TextIO
 
 import fiona
 import geopandas as gpd
-import h5py
+import numpy as np
 import pandas as pd
+import xarray as xr
 from pyproj import CRS
 
 from ripple1d.consts import (
@@ -24,13 +25,22 @@ from ripple1d.consts import (
     NORMAL_DEPTH,
     PROFILE_NAMES_HDF_PATH,
     SHOW_RAS,
+    STEADY_RESULT_VARIABLES,
     SUPPORTED_LAYERS,
     TERRAIN_NAME,
     TERRAIN_PATH,
     WSE_HDF_PATH,
     XS_NAMES_HDF_PATH,
 )
-from ripple1d.data_model import FlowChangeLocation, Junction, Reach
+from ripple1d.data_model import (
+    FlowChangeLocation,
+    Junction,
+    Reach,
+    cross_sections_gdf,
+    overtop_elevations,
+    reaches_gdf,
+    structures_gdf,
+)
 from ripple1d.errors import (
     FlowTitleAlreadyExistsError,
     HECRASVersionNotInstalledError,
@@ -46,12 +56,21 @@ from ripple1d.errors import (
 # ToManyPlansError,
 from ripple1d.rasmap import PLAN, RASMAP_631, TERRAIN
 from ripple1d.utils.dg_utils import get_terrain_exe_path
+from ripple1d.utils.cache_utils import read_geom_cache, write_geom_cache
+from ripple1d.utils.hdf_utils import HDF_POOL, pooled_hdf
 from ripple1d.utils.ripple_utils import (
+    GeomTextIndex,
+    ReachStationIndex,
     assert_no_mesh_error,
     assert_no_ras_compute_error_message,
     assert_no_ras_geometry_error,
     assert_no_store_all_maps_error_message,
+    cache_on_contents,
     decode,
+    fixed_width_array,
+    fixed_width_lines,
+    hdf_xs_names,
+    read_steady_results,
     replace_line_in_contents,
     resample_vertices,
     search_contents,
@@ -71,6 +90,7 @@ VALID_QUASISTEADY_FLOWS = [f".q{i:02d}" for i in range(1, 100)] + [f".Q{i:02d}"
 def check_crs(func):
     """Check CRS decorator."""
 
+    @wraps(func)
     def wrapper(self, *args, **kwargs):
         if self.crs is None:
             raise ValueError("Projection cannot be None")
@@ -132,9 +152,13 @@ class RasManager:
         terrain_path: str = None,
         crs: CRS = None,
         new_project: bool = False,
+        lazy: bool = False,
+        use_geom_cache: bool = False,
     ):
         self.version = version
         self.terrain_path = terrain_path
+        self.lazy = lazy
+        self.use_geom_cache = use_geom_cache
         self.ras_project = RasProject(ras_text_file_path, new_file=new_project)
 
         self.crs = CRS(crs)
@@ -142,6 +166,7 @@ class RasManager:
         self.geoms = self.get_geoms()
         self.flows = self.get_flows()
         self.plan = self.current_plan
+        self._results_cache = {}
 
     def __repr__(self):
         """Representation of the RasManager class."""
@@ -176,6 +201,15 @@ class RasManager:
             if plan.file_extension == self.ras_project.current_plan:
                 return plan
 
+    def plan_geom(self, plan: "RasPlanText") -> "RasGeomText":
+        """Return the geometry of a plan from geoms, sharing its cached products, rather than parsing a new copy."""
+        # plan_geom_file has a lower case extension; RAS file names are case insensitive
+        plan_geom_file = os.path.normpath(plan.plan_geom_file).lower()
+        for geom in self.geoms.values():
+            if os.path.normpath(geom._ras_text_file_path).lower() == plan_geom_file:
+                return geom
+        return plan.geom
+
     @property
     def projection_file(self):
         """Write the current projection to file and return the file path."""
@@ -189,7 +223,7 @@ class RasManager:
         plans = {}
         for plan_file in self.ras_project.plans:
             try:
-                plan = RasPlanText(plan_file, self.crs, units=self.ras_project.units)
+                plan = RasPlanText(plan_file, self.crs, units=self.ras_project.units, lazy=self.lazy)
                 plans[plan.title] = plan
             except FileNotFoundError:
                 logging.info(f"Could not find plan file: {plan_file}")
@@ -201,23 +235,106 @@ class RasManager:
         geoms = {}
         for geom_file in self.ras_project.geoms:
             try:
-                geom = RasGeomText(geom_file, self.crs, units=self.ras_project.units)
+                geom = RasGeomText(
+                    geom_file, self.crs, units=self.ras_project.units, lazy=self.lazy, use_cache=self.use_geom_cache
+                )
                 geoms[geom.title] = geom
             except FileNotFoundError:
                 logging.warning(f"Could not find geom file: {geom_file}")
         return geoms
 
+    def save_geoms(self):
+        """Write the htab fixes of the loaded geometries to their files and refresh their sidecar caches."""
+        for geom in self.geoms.values():
+            if geom.is_loaded:
+                geom.save()
+
     def get_flows(self):
         """Create flow objects for each flow."""
         flows = {}
         for flow_file in self.ras_project.steady_flows:
             try:
-                flow = RasFlowText(flow_file)
+                flow = RasFlowText(flow_file, lazy=self.lazy)
                 flows[flow.title] = flow
             except FileNotFoundError:
                 logging.warning(f"Could not find flow file: {flow_file}")
         return flows
 
+    def _plan_results(
+        self, plan_name: str, variables: list[str]
+    ) -> tuple[list[str], np.ndarray, dict[str, np.ndarray]]:
+        """Read the given steady results of a plan once; re-read only if its results HDF changed."""
+        plan = self.plans[plan_name]
+        stat = os.stat(plan.hdf_file)
+        key = (plan.hdf_file, stat.st_size, stat.st_mtime_ns)
+        cached = self._results_cache.get(plan_name)
+        if cached is None or cached[0] != key:
+            cached = (key, None, None, {}, set())
+            self._results_cache[plan_name] = cached
+        _, profile_names, xs_names, results, read_variables = cached
+
+        # variables missing from the HDF are remembered as read so they are not looked up again
+        unread = {name: STEADY_RESULT_VARIABLES[name] for name in variables if name not in read_variables}
+        if unread or profile_names is None:
+            profile_names, xs_names, new_results = read_steady_results(plan.hdf_file, unread)
+            profile_name_map = json.loads(plan.flow.description)
+            profile_names = [profile_name_map.get(name, name) for name in profile_names]
+            results.update(new_results)
+            read_variables.update(unread)
+            self._results_cache[plan_name] = (key, profile_names, xs_names, results, read_variables)
+        return profile_names, xs_names, results
+
+    def results(self, plan_names: list[str] = None, variables: list[str] = None) -> xr.Dataset:
+        """
+        Steady cross section results of several plans as one labeled (plan, profile, xs) dataset.
+
+        Each variable of a plan's results HDF is read once and cached on this manager. Plans have different numbers of
+        profiles, so the profile dimension is padded with nan and labeled by the 2-d "profile_name"
+        coordinate. Variables missing from a plan's HDF are nan for that plan.
+
+        Parameters
+        ----------
+            plan_names (list[str], optional): Titles of the plans to include. Defaults to every plan with results.
+            variables (list[str], optional): Keys of STEADY_RESULT_VARIABLES to include. Defaults to all of them.
+
+        Returns
+        -------
+            xr.Dataset: A float32 (plan, profile, xs) array for each variable
+        """
+        if plan_names is None:
+            plan_names = [name for name, plan in self.plans.items() if os.path.exists(plan.hdf_file)]
+        if variables is None:
+            variables = list(STEADY_RESULT_VARIABLES)
+
+        plan_results = [self._plan_results(plan_name, variables) for plan_name in plan_names]
+        xs_names = list(dict.fromkeys(name for _, names, _ in plan_results for name in names))
+        xs_positions = {name: i for i, name in enumerate(xs_names)}
+        n_profiles = max((len(profile_names) for profile_names, _, _ in plan_results), default=0)
+
+        shape = (len(plan_names), n_profiles, len(xs_names))
+        cube = {variable: np.full(shape, np.nan, dtype=np.float32) for variable in variables}
+        profile_name = np.full((len(plan_names), n_profiles), "", dtype=object)
+        for i, (profile_names, names, results) in enumerate(plan_results):
+            profile_name[i, : len(profile_names)] = profile_names
+            columns = [xs_positions[name] for name in names]
+            for variable in variables:
+                if variable in results:
+                    cube[variable][i][: len(profile_names), columns] = results[variable]
+
+        return xr.Dataset(
+            {variable: (("plan", "profile", "xs"), values) for variable, values in cube.items()},
+            coords={"plan": plan_names, "xs": xs_names, "profile_name": (("plan", "profile"), profile_name)},
+        )
+
+    def plan_results(self, plan_name: str, variables: list[str] = ("wse", "flow")) -> list[pd.DataFrame]:
+        """
+        Steady cross section results of one plan; one frame per variable, in the layout of read_rating_curves.
+
+        The frames are indexed by cross section and their columns are the profile names.
+        """
+        profile_names, xs_names, results = self._plan_results(plan_name, variables)
+        return [pd.DataFrame(results[variable].T, index=xs_names, columns=profile_names) for variable in variables]
+
     def normal_depth_run(
         self,
         plan_flow_title: str,
@@ -389,6 +506,9 @@ class RasManager:
         # write content
         rpt.write_contents()
 
+        # write any htab fixes made to the geometry before it is computed
+        self.geoms[geom_title].save()
+
         # add new plan to the ras class
         self.plans[plan_flow_title] = rpt
         self.plan = rpt
@@ -406,6 +526,8 @@ class RasManager:
             self.update_rasmapper_for_mapping()
 
         if run_ras:
+            # release pooled read handles so HEC-RAS can overwrite the results
+            HDF_POOL.close(self.plan.hdf_file)
             runRAS = f'C:\\Program Files (x86)\\HEC\\HEC-RAS\\6.3.1\\Ras.exe "{self.ras_project._ras_text_file_path}" \
                 "{self.ras_project._ras_root_path}{self.plan.file_extension}" -c'
             p = subprocess.Popen(runRAS)
@@ -415,8 +537,10 @@ class RasManager:
 class RasTextFile:
     """Represents a HEC-RAS text file."""
 
-    def __init__(self, ras_text_file_path, new_file=False):
+    def __init__(self, ras_text_file_path, new_file=False, lazy=False):
         self._ras_text_file_path = ras_text_file_path
+        self._contents = None
+        self.invalidate_cache()
 
         if not new_file and not os.path.exists(ras_text_file_path):
             raise FileNotFoundError(f"could not find {ras_text_file_path}")
@@ -424,15 +548,65 @@ class RasTextFile:
             self._ras_text_file_path = ras_text_file_path
             self._ras_root_path = os.path.splitext(self._ras_text_file_path)[0]
 
-        if not new_file:
-            self.read_contents()
-        else:
+        if new_file:
             self.contents = []
+        elif not lazy:
+            self.read_contents()
 
     def __repr__(self):
         """Representation of the RasTextFile class."""
         return f"RasTextFile({self._ras_text_file_path})"
 
+    @property
+    def contents(self) -> list[str]:
+        """Lines of the text file; read on first access when the file was opened lazily."""
+        if self._contents is None:
+            self.load()
+        return self._contents
+
+    @contents.setter
+    def contents(self, contents: list[str]):
+        self._contents = contents
+        self.invalidate_cache()
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the contents of the text file have been read."""
+        return self._contents is not None
+
+    @property
+    def contents_version(self) -> int:
+        """Counter incremented whenever the contents change; derived products are cached per version."""
+        return self._contents_version
+
+    def invalidate_cache(self):
+        """Discard the products derived from the contents. Call after editing contents in place or writing them."""
+        self._contents_version = getattr(self, "_contents_version", 0) + 1
+        self._contents_cache = {}
+        self._header_values = {}
+
+    def load(self):
+        """Read the contents of a lazily opened text file."""
+        self.read_contents()
+
+    def read_header_value(self, search_string: str) -> str:
+        """
+        Return the value of a header line, reading only up to that line if the contents have not been loaded.
+
+        Values read from the file are kept until the contents are loaded.
+        """
+        if self.is_loaded:
+            return search_contents(self.contents, search_string)
+        if search_string not in self._header_values:
+            with open(self._ras_text_file_path) as f:
+                for line in f:
+                    if f"{search_string}=" in line:
+                        self._header_values[search_string] = line.rstrip("\n").split("=")[1]
+                        break
+                else:
+                    raise ValueError("expected 1 result, no results found")
+        return self._header_values[search_string]
+
     def read_contents(self):
         """Read the contents of the text file."""
         if not os.path.exists(self._ras_text_file_path):
@@ -448,6 +622,7 @@ class RasTextFile:
         logging.info(f"writing: {os.path.basename(self._ras_text_file_path)}")
         with open(self._ras_text_file_path, "w") as f:
             f.write("\n".join(self.contents))
+        self.invalidate_cache()
 
     def write_updated_contents(self):
         """Write the updated contents of the text file."""
@@ -457,6 +632,7 @@ class RasTextFile:
         logging.info(f"updating: {os.path.basename(self._ras_text_file_path)}")
         with open(self._ras_text_file_path, "w") as f:
             f.write("\n".join(self.contents))
+        self.invalidate_cache()
 
     @property
     def file_extension(self):
@@ -574,8 +750,10 @@ class RasProject(RasTextFile):
 class RasPlanText(RasTextFile):
     """Represents a HEC-RAS plan file."""
 
-    def __init__(self, ras_text_file_path: str, crs: str = None, new_file: bool = False, units: str = "English"):
-        super().__init__(ras_text_file_path, new_file)
+    def __init__(
+        self, ras_text_file_path: str, crs: str = None, new_file: bool = False, units: str = "English", lazy=False
+    ):
+        super().__init__(ras_text_file_path, new_file, lazy)
         if self.file_extension not in VALID_PLANS:
             raise TypeError(f"Plan extenstion must be one of .p01-.p99, not {self.file_extension}")
         self.crs = crs
@@ -596,7 +774,7 @@ class RasPlanText(RasTextFile):
     @property
     def title(self):
         """Title of this HEC-RAS plan."""
-        return search_contents(self.contents, "Plan Title")
+        return self.read_header_value("Plan Title")
 
     @property
     def version(self):
@@ -665,7 +843,10 @@ class RasPlanText(RasTextFile):
     @check_crs
     def geom(self):
         """Represents the HEC-RAS geometry file associated with this plan."""
-        return RasGeomText(self.plan_geom_file, self.crs, units=self.units)
+        geom = RasGeomText(self.plan_geom_file, self.crs, units=self.units)
+        # write any htab fixes made while reading the geometry
+        geom.save()
+        return geom
 
     @property
     def flow(self):
@@ -737,13 +918,20 @@ class RasPlanText(RasTextFile):
         else:
             self.contents.append("Run RASMapper= 0 ")
 
-    def read_rating_curves(self, profile_name_map: dict) -> dict:
+    def read_rating_curves(self, profile_name_map: dict, river_reach_rs: list[str] = None) -> dict:
         """
         Read the flow and water surface elevations resulting from the computed plan.
 
+        Parameters
+        ----------
+            profile_name_map (dict): Map of the HDF profile names to the names used for the results
+            river_reach_rs (list[str], optional): Cross sections to read; e.g., ["river reach 1234.5"]. Only the
+                results of these cross sections are read from the HDF. Defaults to all cross sections.
+
         Raises
         ------
             FileNotFoundError: _description_
+            KeyError: if a requested cross section is not in the results
 
         Returns
         -------
@@ -756,25 +944,26 @@ class RasPlanText(RasTextFile):
             if not os.path.exists(self.hdf_file):
                 raise FileNotFoundError(f'The file "{self.hdf_file}" does not exists')
 
-        def remove_multiple_spaces(x):
-            return re.sub(" +", " ", x)
+        # get the cross section names (with multiple spaces between the river-reach-riverstation ids removed)
+        xs_names, xs_positions = hdf_xs_names(self.hdf_file, os.stat(self.hdf_file).st_mtime_ns, XS_NAMES_HDF_PATH)
+        if river_reach_rs is not None:
+            positions = [xs_positions[name] for name in river_reach_rs]
+            columns, order = np.unique(positions, return_inverse=True)
+            xs_names = xs_names[positions]
 
         # read the hdf file
-        with h5py.File(self.hdf_file) as hdf:
-            # get columns and indexes for the wse and flow arrays
-            columns = decode(pd.DataFrame(hdf[XS_NAMES_HDF_PATH]))
-            index = decode(pd.DataFrame(hdf[PROFILE_NAMES_HDF_PATH]))
-
-            # remove multiple spaces in between the river-reach-riverstation ids.
-            columns[0] = columns[0].apply(remove_multiple_spaces)
-
-            # create dataframes for the wse and flow results
-            wse = pd.DataFrame(
-                hdf.get(WSE_HDF_PATH), columns=columns[0].values, index=[profile_name_map[i] for i in index[0].values]
-            ).T
-            flow = pd.DataFrame(
-                hdf.get(FLOW_HDF_PATH), columns=columns[0].values, index=[profile_name_map[i] for i in index[0].values]
-            ).T
+        hdf = pooled_hdf(self.hdf_file)
+        index = [profile_name_map[i] for i in decode(pd.DataFrame(hdf[PROFILE_NAMES_HDF_PATH]))[0].values]
+
+        # create dataframes for the wse and flow results; only read the requested columns
+        results = []
+        for path in [WSE_HDF_PATH, FLOW_HDF_PATH]:
+            if river_reach_rs is None:
+                values = hdf[path][:]
+            else:
+                values = hdf[path][:, columns.tolist()][:, order]
+            results.append(pd.DataFrame(values, columns=xs_names, index=index).T)
+        wse, flow = results
 
         return wse, flow
 
@@ -782,22 +971,46 @@ class RasPlanText(RasTextFile):
 class RasGeomText(RasTextFile):
     """Represents a HEC-RAS geometry text file."""
 
-    def __init__(self, ras_text_file_path: str, crs: str = None, new_file=False, units: str = "English"):
-        super().__init__(ras_text_file_path, new_file)
+    def __init__(
+        self,
+        ras_text_file_path: str,
+        crs: str = None,
+        new_file=False,
+        units: str = "English",
+        lazy=False,
+        use_cache: bool = False,
+    ):
+        super().__init__(ras_text_file_path, new_file, lazy)
         if not new_file and self.file_extension not in VALID_GEOMS:
             raise TypeError(f"Geometry extenstion must be one of .g01-.g99, not {self.file_extension}")
 
         self.crs = CRS(crs)
         self.units = units
         self.hdf_file = self._ras_text_file_path + ".hdf"
+        self.use_cache = use_cache and not new_file
+        self.needs_save = False
 
-        if len(ras_text_file_path) > 0:
+        if len(ras_text_file_path) > 0 and self.is_loaded:
             self.fix_htab_errors()
+            self.save_cache()
 
     def __repr__(self):
         """Representation of the RasGeomText class."""
         return f"RasGeomText({self._ras_text_file_path})"
 
+    def load(self):
+        """Read the contents of a lazily opened geometry file and fix any htab errors."""
+        super().load()
+        self.fix_htab_errors()
+        self.save_cache()
+
+    def save_cache(self):
+        """Write the parsed geometry to its sidecar cache file if caching is enabled and the cache is out of date."""
+        if self.use_cache and not self.needs_save and not self.text_index.persisted:
+            # decode every cross section so their records are written along with the index
+            self.cross_sections
+            write_geom_cache(self._ras_text_file_path, self.contents, self.text_index)
+
     @classmethod
     def from_str(cls, text_string: str, crs, ras_text_file_path: str = ""):
         """Initiate the RASGeomText class from a string."""
@@ -828,8 +1041,10 @@ class RasGeomText(RasTextFile):
 
         self._check_layers()
         xs_gdf = gpd.read_file(self._gpkg_path, layer="XS", driver="GPKG")
+        gpkg_data = io.StringIO()
+
         # headers
-        gpkg_data = (
+        gpkg_data.write(
             f"Geom Title={self._title}\nProgram Version={self._version}\nViewing Rectangle={self._bbox(xs_gdf)}\n\n"
         )
 
@@ -839,41 +1054,36 @@ class RasGeomText(RasTextFile):
             junction_gdf["ras_data"].str.cat(sep="\n")
 
         # river reach data
-        gpkg_data += self._river_reach_data_from_gpkg
+        self._write_river_reach_data_from_gpkg(gpkg_data, xs_gdf)
 
-        return gpkg_data.splitlines()
+        return gpkg_data.getvalue().splitlines()
 
-    @property
-    def _river_reach_data_from_gpkg(self):
+    def _write_river_reach_data_from_gpkg(self, f: TextIO, xs_gdf: gpd.GeoDataFrame):
+        """Stream the reach headers, reach coordinates and the cross section and structure data to a text buffer."""
         river_gdf = gpd.read_file(self._gpkg_path, layer="River", driver="GPKG")
-        xs_gdf = gpd.read_file(self._gpkg_path, layer="XS", driver="GPKG")
 
         if "Structure" in fiona.listlayers(self._gpkg_path):
             structure_gdf = gpd.read_file(self._gpkg_path, layer="Structure", driver="GPKG")
             node_gdf = pd.concat([xs_gdf, structure_gdf]).sort_values(by="river_station", ascending=False)
         else:
             node_gdf = xs_gdf.sort_values(by="river_station", ascending=False)
+        node_data = node_gdf.groupby("river_reach", sort=False)["ras_data"]
 
-        data = ""
-        for _, row in river_gdf.iterrows():
+        for row in river_gdf.itertuples():
             centroid = row.geometry.centroid
+            coords = np.asarray(row.geometry.coords)
 
-            coords = row["geometry"].coords
-
-            data += f"River Reach={row['river'].ljust(16)},{row['reach'].ljust(16)}\n"
-            data += f"Reach XY= {len(coords)} \n"
+            f.write(f"River Reach={row.river.ljust(16)},{row.reach.ljust(16)}\n")
+            f.write(f"Reach XY= {len(coords)} \n")
+            for line in fixed_width_lines(coords, 16, 4):
+                # two x, y pairs per line; an odd number of pairs leaves the last line open
+                f.write(line + "\n" if len(line) == 64 else line)
 
-            for i, (x, y) in enumerate(coords):
-                data += str(x)[:16].rjust(16) + str(y)[:16].rjust(16)
-                if i % 2 != 0:
-                    data += "\n"
-
-            data += f"\nRch Text X Y={centroid.x},{centroid.y}\nReverse River Text= 0 \n\n"
+            f.write(f"\nRch Text X Y={centroid.x},{centroid.y}\nReverse River Text= 0 \n\n")
 
             # cross section and structures data
-            data += node_gdf.loc[node_gdf["river_reach"] == row["river_reach"], "ras_data"].str.cat(sep="\n")
-
-        return data
+            if row.river_reach in node_data.groups:
+                f.write(node_data.get_group(row.river_reach).str.cat(sep="\n"))
 
     def _bbox(self, gdf):
         bounds = gdf.total_bounds
@@ -889,12 +1099,16 @@ class RasGeomText(RasTextFile):
             raise NoRiverLayerError(f"Could not find a layer called River in {self._gpkg_path}")
 
     def fix_htab_errors(self):
-        """Update any htab values lower than the section invert to the section invert."""
-        working_string = "\n".join(self.contents.copy())
-        needs_save = False
+        """
+        Update any htab values lower than the section invert to the section invert.
+
+        The corrections are applied to the htab lines of the affected cross sections only and are written to the
+        geometry file by save() (or RasManager.save_geoms); the sidecar cache is only written once the file on disk
+        matches the corrected contents.
+        """
+        patches = {}
         for xs in self.cross_sections.values():
             if xs.has_htab_error:
-                needs_save = True
                 logging.info(f"Fixing htab error for {xs.river_reach}")
                 old_htab_str = xs.htab_string
                 # HEC-RAS default handling:
@@ -902,19 +1116,39 @@ class RasGeomText(RasTextFile):
                 # increment that will yield 20 pts between start and section max elevations
                 # We want to preserve engineer-specified increments, so we don't do that
                 new_htab_str = old_htab_str.replace(str(xs.htab_starting_el), str(xs.thalweg))
+                for i, line in enumerate(xs.ras_data):
+                    if "XS HTab Starting El and Incr=" in line and old_htab_str != new_htab_str:
+                        patches[xs.start_line + i] = line.replace(old_htab_str, new_htab_str)
+        if patches:
+            contents = self.contents.copy()
+            for i, line in patches.items():
+                contents[i] = line
+            self.contents = contents
+            self.needs_save = True
 
-                old_xs_str = "\n".join(xs.ras_data)
-                new_xs_str = old_xs_str.replace(old_htab_str, new_htab_str)
-                working_string = working_string.replace(old_xs_str, new_xs_str)
-        if needs_save:
-            with open(self._ras_text_file_path, "w") as f:
-                f.write(working_string)
-            self.contents = working_string.splitlines()
+    def write_contents(self):
+        """Write the contents of the geometry file."""
+        super().write_contents()
+        self.needs_save = False
+
+    def write_updated_contents(self):
+        """Write the updated contents of the geometry file."""
+        super().write_updated_contents()
+        self.needs_save = False
+
+    def save(self):
+        """Write the contents to the geometry file if they were updated since the file was read."""
+        if self.needs_save:
+            if os.path.exists(self._ras_text_file_path):
+                self.write_updated_contents()
+            else:
+                self.write_contents()
+        self.save_cache()
 
     @property
     def title(self):
         """Title of the HEC-RAS Geometry file."""
-        return search_contents(self.contents, "Geom Title")
+        return self.read_header_value("Geom Title")
 
     @property
     def version(self):
@@ -922,16 +1156,28 @@ class RasGeomText(RasTextFile):
         return search_contents(self.contents, "Program Version", expect_one=False)
 
     @property
+    @cache_on_contents
+    def text_index(self) -> GeomTextIndex:
+        """Line-offset index of the geometry file contents; restored from the sidecar cache when it is valid."""
+        if self.use_cache:
+            index = read_geom_cache(self._ras_text_file_path, self.contents)
+            if index is not None:
+                return index
+        return GeomTextIndex(self.contents)
+
+    @property
+    @cache_on_contents
     @check_crs
     def reaches(self) -> dict:
         """A dictionary of the reaches contained in the HEC-RAS geometry file."""
-        river_reaches = search_contents(self.contents, "River Reach", expect_one=False)
+        index = self.text_index
         reaches = {}
-        for river_reach in river_reaches:
-            reaches[river_reach] = Reach(self.contents, river_reach, self.crs, self.units)
+        for river_reach in index.reaches:
+            reaches[river_reach] = Reach(self.contents, river_reach, self.crs, self.units, index)
         return reaches
 
     @property
+    @cache_on_contents
     @check_crs
     def rivers(self) -> dict:
         """A nested river-reach dictionary of the rivers/reaches contained in the HEC-RAS geometry file."""
@@ -942,17 +1188,18 @@ class RasGeomText(RasTextFile):
         return rivers
 
     @property
+    @cache_on_contents
     @check_crs
     def junctions(self) -> dict:
         """A dictionary of the junctions contained in the HEC-RAS geometry file."""
-        juncts = search_contents(self.contents, "Junct Name", expect_one=False)
+        index = self.text_index
         junctions = {}
-        for junct in juncts:
-            junctions[junct] = Junction(self.contents, junct, self.crs)
+        for junct in index.junctions:
+            junctions[junct] = Junction(self.contents, junct, self.crs, index)
         return junctions
 
     @property
-    @lru_cache
+    @cache_on_contents
     @check_crs
     def cross_sections(self) -> dict:
         """A dictionary of the cross sections contained in the HEC-RAS geometry file."""
@@ -963,6 +1210,7 @@ class RasGeomText(RasTextFile):
         return cross_sections
 
     @property
+    @cache_on_contents
     @check_crs
     def structures(self) -> dict:
         """A dictionary of the structures contained in the HEC-RAS geometry file."""
@@ -979,101 +1227,57 @@ class RasGeomText(RasTextFile):
         Determine if the cross sections are connected to lateral structures,
         if they are update 'has_lateral_structures' to True.
         """
+        stations = ReachStationIndex(xs_gdf)
+        rows = []
         for structure in self.structures.values():
             if int(structure.type) == 6:
                 try:
-                    us_rs = xs_gdf.loc[
-                        (xs_gdf["river"] == structure.river)
-                        & (xs_gdf["reach"] == structure.reach)
-                        & (xs_gdf["river_station"] > structure.river_station),
-                        "river_station",
-                    ].min()
-
-                    ds_xs = xs_gdf.loc[
-                        (xs_gdf["river"] == structure.river)
-                        & (xs_gdf["reach"] == structure.reach)
-                        & (xs_gdf["river_station"] <= us_rs)
-                    ]
-
-                    reach_len = 0
-                    river_stations = []
-                    for _, row in ds_xs.iterrows():
-                        reach_len += row["channel_reach_length"]
-                        river_stations.append(row.river_station)
-                        if reach_len > structure.distance_to_us_xs + structure.weir_length:
-                            break
-
-                    xs_gdf.loc[
-                        (xs_gdf["river"] == structure.river)
-                        & (xs_gdf["reach"] == structure.reach)
-                        & (xs_gdf["river_station"] <= max(river_stations))
-                        & (xs_gdf["river_station"] >= min(river_stations)),
-                        "has_lateral_structure",
-                    ] = True
+                    us_rs = stations.upstream_station(structure.river, structure.reach, structure.river_station)
+                    rows.append(
+                        stations.downstream_span(
+                            structure.river,
+                            structure.reach,
+                            us_rs,
+                            length=structure.distance_to_us_xs + structure.weir_length,
+                        )
+                    )
 
                     if structure.tail_water_river in xs_gdf.river:
-
                         if structure.multiple_xs:
-
-                            ds_xs = xs_gdf.loc[
-                                (xs_gdf["river"] == structure.tail_water_river)
-                                & (xs_gdf["reach"] == structure.tail_water_reach)
-                                & (xs_gdf["river_station"] <= structure.tail_water_river_station)
-                            ]
-
-                            reach_len = 0
-                            river_stations = []
-                            for _, row in ds_xs.iterrows():
-                                reach_len += row["channel_reach_length"]
-                                river_stations.append(row.river_station)
-                                if reach_len > structure.tw_distance + structure.weir_length:
-                                    break
-
-                            xs_gdf.loc[
-                                (xs_gdf["river"] == structure.tail_water_river)
-                                & (xs_gdf["reach"] == structure.tail_water_reach)
-                                & (xs_gdf["river_station"] <= max(river_stations))
-                                & (xs_gdf["river_station"] >= min(river_stations)),
-                                "has_lateral_structure",
-                            ] = True
+                            rows.append(
+                                stations.downstream_span(
+                                    structure.tail_water_river,
+                                    structure.tail_water_reach,
+                                    structure.tail_water_river_station,
+                                    length=structure.tw_distance + structure.weir_length,
+                                )
+                            )
                         else:
-
-                            ds_xs = xs_gdf.loc[
-                                (xs_gdf["river"] == structure.tail_water_river)
-                                & (xs_gdf["reach"] == structure.tail_water_reach)
-                                & (xs_gdf["river_station"] <= structure.tail_water_river_station)
-                            ]
-
-                            reach_len = 0
-                            river_stations = []
-                            for _, row in ds_xs.iterrows():
-                                reach_len += row["channel_reach_length"]
-                                river_stations.append(row.river_station)
-                                if len(river_stations) > 1:
-                                    break
-
-                            xs_gdf.loc[
-                                (xs_gdf["river"] == structure.tail_water_river)
-                                & (xs_gdf["reach"] == structure.tail_water_reach)
-                                & (xs_gdf["river_station"] <= max(river_stations))
-                                & (xs_gdf["river_station"] >= min(river_stations)),
-                                "has_lateral_structure",
-                            ] = True
+                            rows.append(
+                                stations.downstream_span(
+                                    structure.tail_water_river,
+                                    structure.tail_water_reach,
+                                    structure.tail_water_river_station,
+                                    count=2,
+                                )
+                            )
 
                 except InvalidStructureDataError as e:
                     pass
 
+        if rows:
+            xs_gdf.iloc[np.concatenate(rows), xs_gdf.columns.get_loc("has_lateral_structure")] = True
         return xs_gdf
 
     @property
-    @lru_cache
+    @cache_on_contents
     @check_crs
     def reach_gdf(self):
         """A GeodataFrame of the reaches contained in the HEC-RAS geometry file."""
-        return pd.concat([reach.gdf for reach in self.reaches.values()], ignore_index=True)
+        return reaches_gdf(list(self.reaches.values()), self.crs)
 
     @property
-    @lru_cache
+    @cache_on_contents
     @check_crs
     def junction_gdf(self):
         """A GeodataFrame of the junctions contained in the HEC-RAS geometry file."""
@@ -1084,19 +1288,29 @@ class RasGeomText(RasTextFile):
             )
 
     @property
-    @lru_cache
+    @cache_on_contents
     @check_crs
     def xs_gdf(self):
         """Geodataframe of all cross sections in the geometry text file."""
-        gdf = pd.concat([xs.gdf for xs in self.cross_sections.values()], ignore_index=True)
+        gdf = cross_sections_gdf(list(self.cross_sections.values()), self.crs)
         return self.determine_lateral_structure_xs(gdf)
 
     @property
-    @lru_cache
+    @cache_on_contents
+    @check_crs
+    def xs_overtop_elevations(self) -> pd.Series:
+        """Overtop elevations of all cross sections in the geometry text file, indexed by river_reach_rs_str."""
+        cross_sections = list(self.cross_sections.values())
+        return pd.Series(
+            overtop_elevations(cross_sections), index=[xs.river_reach_rs_str for xs in cross_sections], dtype=float
+        )
+
+    @property
+    @cache_on_contents
     @check_crs
     def structures_gdf(self):
         """Geodataframe of all structures in the geometry text file."""
-        return pd.concat([structure.gdf for structure in self.structures.values()], ignore_index=True)
+        return structures_gdf(list(self.structures.values()), self.crs)
 
     @property
     @check_crs
@@ -1142,8 +1356,8 @@ class RasGeomText(RasTextFile):
 class RasFlowText(RasTextFile):
     """Represents a HEC-RAS flow text file."""
 
-    def __init__(self, ras_text_file_path: str, new_file: bool = False):
-        super().__init__(ras_text_file_path, new_file)
+    def __init__(self, ras_text_file_path: str, new_file: bool = False, lazy: bool = False):
+        super().__init__(ras_text_file_path, new_file, lazy)
         if self.file_extension in VALID_UNSTEADY_FLOWS or self.file_extension in VALID_QUASISTEADY_FLOWS:
             raise NotImplementedError("only steady flow (.f**) supported")
 
@@ -1164,7 +1378,7 @@ class RasFlowText(RasTextFile):
     @property
     def title(self):
         """Title of the flow File."""
-        return search_contents(self.contents, "Flow Title")
+        return self.read_header_value("Flow Title")
 
     @property
     def version(self):
@@ -1278,27 +1492,26 @@ class RasFlowText(RasTextFile):
             lines = text_block_from_start_end_str(
                 f"River Rch & RM={location}", ["River Rch & RM", "Boundary for River Rch & Prof#"], self.contents
             )
-            flows = []
-
+            flow_lines = []
             for line in lines[1:]:
-
                 if "River Rch & RM" in line:
                     break
-                for i in range(0, len(line), 8):
-                    flows.append(float(line[i : i + 8].lstrip(" ")))
-                    if len(flows) == self.n_profiles:
-                        flow_change_locations.append(
-                            FlowChangeLocation(
-                                river,
-                                reach.rstrip(" "),
-                                float(rs.replace("*", "")),
-                                flows,
-                                self.profile_names,
-                            )
-                        )
+                flow_lines.append(line)
+            flows = fixed_width_array(flow_lines, 8).ravel().tolist()
+
+            if len(flows) >= self.n_profiles:
+                flow_change_locations.append(
+                    FlowChangeLocation(
+                        river,
+                        reach.rstrip(" "),
+                        float(rs.replace("*", "")),
+                        flows,
+                        self.profile_names,
+                    )
+                )
 
-                    if len(flow_change_locations) == self.n_flow_change_locations:
-                        return flow_change_locations
+            if len(flow_change_locations) == self.n_flow_change_locations:
+                return flow_change_locations
 
     @property
     def description(self):
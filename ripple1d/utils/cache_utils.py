@@ -0,0 +1,103 @@
+"""Utils for the persistent sidecar cache of parsed HEC-RAS geometry files."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import zipfile
+
+import numpy as np
+
+from ripple1d.consts import GEOM_CACHE_SUFFIX, GEOM_CACHE_VERSION
+from ripple1d.data_model import XSRecord
+from ripple1d.utils.ripple_utils import GeomTextIndex
+
+
+def geom_cache_path(geom_file: str) -> str:
+    """Return the path of the sidecar cache file of a geometry file; e.g., model.g01 -> model.g01.ripple-cache."""
+    return f"{geom_file}{GEOM_CACHE_SUFFIX}"
+
+
+def geom_cache_key(geom_file: str, contents: list[str]) -> dict:
+    """Key a cache on the size and modification time of the geometry file and a hash of its contents."""
+    stat = os.stat(geom_file)
+    return {
+        "version": GEOM_CACHE_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": hashlib.sha256("\n".join(contents).encode()).hexdigest(),
+    }
+
+
+def records_to_arrays(records: dict[int, XSRecord]) -> dict[str, np.ndarray]:
+    """Pack the decoded cross section records of a geometry into flat arrays."""
+    starts = sorted(records)
+    scalar_fields = [name for name in XSRecord.__slots__ if name not in XSRecord.ARRAY_FIELDS]
+    arrays = {
+        "record_starts": np.array(starts, dtype=np.int64),
+        "record_fields": np.array(
+            [json.dumps([getattr(records[start], name) for name in scalar_fields]) for start in starts], dtype=str
+        ),
+    }
+    for name, n_columns in zip(XSRecord.ARRAY_FIELDS, [2, 3, 2]):
+        values = [getattr(records[start], name) for start in starts]
+        arrays[f"{name}_present"] = np.array([value is not None for value in values], dtype=bool)
+        lengths = [0 if value is None else len(value) for value in values]
+        arrays[f"{name}_offsets"] = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        arrays[name] = np.concatenate([np.empty((0, n_columns))] + [value for value in values if value is not None])
+    return arrays
+
+
+def records_from_arrays(arrays: dict[str, np.ndarray]) -> dict[int, XSRecord]:
+    """Unpack the cross section records packed by records_to_arrays."""
+    scalar_fields = [name for name in XSRecord.__slots__ if name not in XSRecord.ARRAY_FIELDS]
+    records = {}
+    for i, (start, fields) in enumerate(zip(arrays["record_starts"].tolist(), arrays["record_fields"].tolist())):
+        fields = dict(zip(scalar_fields, json.loads(fields)))
+        for name in XSRecord.ARRAY_FIELDS:
+            offsets = arrays[f"{name}_offsets"]
+            fields[name] = arrays[name][offsets[i] : offsets[i + 1]] if arrays[f"{name}_present"][i] else None
+        records[start] = XSRecord.from_fields(**fields)
+    return records
+
+
+def write_geom_cache(geom_file: str, contents: list[str], index: GeomTextIndex):
+    """Write the text index and decoded cross section records of a geometry file to its sidecar cache file."""
+    key = geom_cache_key(geom_file, contents)
+    cache_file = geom_cache_path(geom_file)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "wb") as f:
+            np.savez(f, key=np.array(json.dumps(key)), **index.to_arrays(), **records_to_arrays(index.records))
+        os.replace(tmp_file, cache_file)
+        index.persisted = True
+    except OSError as e:
+        logging.warning(f"Could not write geometry cache {cache_file}: {e}")
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def read_geom_cache(geom_file: str, contents: list[str]) -> GeomTextIndex | None:
+    """
+    Read the text index and decoded cross section records of a geometry file from its sidecar cache file.
+
+    Returns None if there is no cache file or if it was written for a different version of the geometry file.
+    """
+    cache_file = geom_cache_path(geom_file)
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with np.load(cache_file, allow_pickle=False) as cache:
+            if json.loads(cache["key"].item()) != geom_cache_key(geom_file, contents):
+                logging.info(f"Geometry cache {cache_file} is out of date")
+                return None
+            arrays = {name: cache[name] for name in cache.files}
+        index = GeomTextIndex.from_arrays(contents, arrays)
+        index.records = records_from_arrays(arrays)
+        index.persisted = True
+        return index
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        logging.warning(f"Could not read geometry cache {cache_file}: {e}")
+        return None
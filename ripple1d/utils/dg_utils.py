@@ -1,26 +1,33 @@
 """Utils for working with raster data."""
 
+import hashlib
 import json
 import logging
 import os
+import tempfile
+import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Tuple
+from typing import Iterator, Tuple
 
 import numpy as np
 import pystac
 import rasterio
+import rasterio.shutil
 import rasterio.warp
 import shapely
 import shapely.ops
 from mypy_boto3_s3.service_resource import Object
 from pyproj import CRS
-from rasterio import mask
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask, geometry_window
 from rasterio.session import AWSSession
+from rasterio.vrt import WarpedVRT
 from rasterio.warp import Resampling, calculate_default_transform, reproject
+from rasterio.windows import Window
 from shapely import Polygon
 
-from ripple1d.consts import METERS_PER_FOOT
+from ripple1d.consts import COG_OVERVIEW_LEVELS, METERS_PER_FOOT, QUANTIZED_DEPTH_NODATA, RASTER_MEMORY_BUDGET_MB
 from ripple1d.errors import NullTerrainError, UnknownVerticalUnits
 
 from .s3_utils import *
@@ -114,6 +121,228 @@ def convert_units(dst_crs: CRS, resolution: float, resolution_units: str) -> flo
     return resolution
 
 
+def default_transform(
+    src: rasterio.DatasetReader, dst_crs: CRS, resolution: float = None, resolution_units: str = None
+) -> tuple[rasterio.Affine, int, int, float]:
+    """Return the destination transform, width, height, and resolution of a raster reprojected to dst_crs."""
+    if not resolution and not resolution_units:
+        resolution = src.res[0]
+        transform, width, height = calculate_default_transform(src.crs, dst_crs, src.width, src.height, *src.bounds)
+    else:
+        resolution = convert_units(dst_crs, resolution, resolution_units)
+        transform, width, height = calculate_default_transform(
+            src.crs, dst_crs, src.width, src.height, *src.bounds, resolution=resolution
+        )
+    return transform, width, height, resolution
+
+
+def block_row_windows(
+    height: int, width: int, block_height: int, row_bytes: int, memory_budget_mb: int = RASTER_MEMORY_BUDGET_MB
+) -> Iterator[Window]:
+    """Yield full-width windows of whole rows of blocks, each holding at most memory_budget_mb of row_bytes rows."""
+    rows = (memory_budget_mb * 2**20 // max(row_bytes, 1)) // block_height * block_height
+    rows = max(rows, block_height)
+    for row in range(0, height, rows):
+        yield Window(0, row, width, min(rows, height - row))
+
+
+def staging_raster_path(nbytes: int, directory: str, memory_budget_mb: int = RASTER_MEMORY_BUDGET_MB) -> str:
+    """Return a path for a temporary raster of nbytes: in memory (/vsimem) within memory_budget_mb, else in directory."""
+    if nbytes <= memory_budget_mb * 2**20:
+        return f"/vsimem/{uuid.uuid4().hex}.tif"
+    return os.path.join(directory, f"{uuid.uuid4().hex}.tmp.tif")
+
+
+class WarpPlan:
+    """
+    Nearest-neighbour reprojection of one source grid, reusable across every raster on that grid.
+
+    The plan holds the destination grid and a gather index giving, for each destination pixel, the flat position of
+    the source pixel GDAL's nearest-neighbour warp samples (-1 where no source pixel is sampled). Applying the plan is
+    a numpy take, so warping the depth grids of every profile of a plan costs a single GDAL warp.
+    """
+
+    def __init__(
+        self,
+        src_crs: CRS,
+        src_transform: rasterio.Affine,
+        src_shape: tuple[int, int],
+        dst_crs: CRS,
+        dst_transform: rasterio.Affine,
+        dst_shape: tuple[int, int],
+        index: np.ndarray,
+    ):
+        self.src_crs = src_crs
+        self.src_transform = src_transform
+        self.src_shape = src_shape
+        self.dst_crs = dst_crs
+        self.dst_transform = dst_transform
+        self.dst_shape = dst_shape
+        self._index = index
+        self.index_path = None
+
+    @classmethod
+    def from_raster(
+        cls,
+        src_path: str,
+        dst_crs: CRS,
+        resolution: float = None,
+        resolution_units: str = None,
+        tiled: bool = False,
+        blocksize: int = 512,
+        memory_budget_mb: int = RASTER_MEMORY_BUDGET_MB,
+    ) -> "WarpPlan":
+        """
+        Plan the reprojection of the grid of a raster; arguments are those of reproject_raster.
+
+        The flat position of each source pixel is warped between rasters laid out like the source and destination
+        rasters of reproject_raster, so GDAL splits the warp into the same chunks and samples the same source pixels as
+        it does for the depth grids themselves. The positions are generated one row of blocks at a time, and the
+        position rasters are staged on disk rather than in memory if together they are larger than memory_budget_mb;
+        the gather index itself (4 bytes per destination pixel) is the only full-size array.
+        """
+        with rasterio.open(src_path) as src:
+            transform, width, height, resolution = default_transform(src, dst_crs, resolution, resolution_units)
+            src_crs, src_transform, src_shape = src.crs, src.transform, src.shape
+            src_block_height = src.block_shapes[0][0]
+            profile = src.profile.copy()
+
+        # float64 holds the positions of grids too large for int32
+        dtype = "int32" if src_shape[0] * src_shape[1] < np.iinfo(np.int32).max else "float64"
+        itemsize = np.dtype(dtype).itemsize
+        profile.update({"driver": "GTiff", "count": 1, "dtype": dtype, "nodata": -1, "compress": None})
+        dst_profile = profile.copy()
+        dst_profile.update({"crs": dst_crs, "transform": transform, "width": width, "height": height, "tiled": tiled})
+        if tiled:
+            dst_profile.update({"blockxsize": blocksize, "blockysize": blocksize})
+        dst_block_height = blocksize if tiled else 1
+
+        index = np.empty((height, width), dtype=np.int32 if dtype == "int32" else np.int64)
+        # both position rasters are staged in memory only if together they fit in the budget
+        nbytes = (src_shape[0] * src_shape[1] + height * width) * itemsize
+        src_tmp = staging_raster_path(nbytes, tempfile.gettempdir(), memory_budget_mb)
+        dst_tmp = staging_raster_path(nbytes, tempfile.gettempdir(), memory_budget_mb)
+        try:
+            with rasterio.open(src_tmp, "w", **profile) as src:
+                # positions are generated one row of blocks at a time
+                for row in range(0, src_shape[0], src_block_height):
+                    window = Window(0, row, src_shape[1], min(src_block_height, src_shape[0] - row))
+                    start = row * src_shape[1]
+                    positions = np.arange(start, start + window.height * src_shape[1], dtype=dtype)
+                    src.write(positions.reshape(window.height, src_shape[1]), 1, window=window)
+            with rasterio.open(src_tmp) as src, rasterio.open(dst_tmp, "w", **dst_profile) as dst:
+                reproject(
+                    source=rasterio.band(src, 1),
+                    destination=rasterio.band(dst, 1),
+                    src_transform=src_transform,
+                    src_crs=src_crs,
+                    dst_transform=transform,
+                    dst_crs=dst_crs,
+                    dst_resolution=resolution,
+                    resampling=Resampling.nearest,
+                )
+            with rasterio.open(dst_tmp) as dst:
+                for window in block_row_windows(height, width, dst_block_height, width * itemsize, memory_budget_mb):
+                    rows = slice(window.row_off, window.row_off + window.height)
+                    if index.dtype == dtype:
+                        dst.read(1, window=window, out=index[rows])
+                    else:
+                        index[rows] = dst.read(1, window=window)
+        finally:
+            for path in [src_tmp, dst_tmp]:
+                if rasterio.shutil.exists(path):
+                    rasterio.shutil.delete(path)
+        return cls(src_crs, src_transform, src_shape, dst_crs, transform, (height, width), index)
+
+    @property
+    def index(self) -> np.ndarray:
+        """Gather index of the plan; memory-mapped read-only once the plan has been saved."""
+        if self._index is None:
+            self._index = np.load(self.index_path, mmap_mode="r")
+        return self._index
+
+    def save(self, index_path: str):
+        """Save the gather index so pickled copies of the plan (e.g. sent to worker processes) share it."""
+        np.save(index_path, self.index)
+        self.index_path = index_path
+
+    def __getstate__(self) -> dict:
+        """Leave a saved gather index out of the pickled plan; it is memory-mapped again on use."""
+        state = self.__dict__.copy()
+        if self.index_path is not None:
+            state["_index"] = None
+        return state
+
+    def matches(self, src: rasterio.DatasetReader) -> bool:
+        """Whether a raster is on the source grid of the plan."""
+        return src.shape == tuple(self.src_shape) and src.transform == self.src_transform and src.crs == self.src_crs
+
+    def warp(self, src: rasterio.DatasetReader, band: int, window: Window) -> np.ndarray:
+        """
+        Warp a window of the destination grid from a band of a raster on the source grid.
+
+        Only the source rows sampled by the window are read. Unsampled pixels are nodata (0 if the raster has none).
+        """
+        index = np.asarray(self.index[window.row_off : window.row_off + window.height])
+        nodata = 0 if src.nodata is None else src.nodata
+        warped = np.full(index.shape, nodata, dtype=src.dtypes[band - 1])
+        sampled = index >= 0
+        if sampled.any():
+            index = index[sampled]
+            first_row, last_row = index.min() // self.src_shape[1], index.max() // self.src_shape[1]
+            rows = src.read(band, window=Window(0, first_row, self.src_shape[1], last_row - first_row + 1))
+            warped[sampled] = rows.reshape(-1)[index - first_row * self.src_shape[1]]
+        return warped
+
+
+def quantize_depth(depth: np.ndarray, nodata: float, scale: float) -> np.ndarray:
+    """
+    Encode depths as uint16 multiples of scale.
+
+    nodata (and nan) depths become QUANTIZED_DEPTH_NODATA; depths are rounded to the nearest multiple of scale and
+    clipped to the range of uint16 below it.
+    """
+    valid = ~np.isnan(depth)
+    if nodata is not None:
+        valid &= depth != nodata
+    quantized = np.full(depth.shape, QUANTIZED_DEPTH_NODATA, dtype=np.uint16)
+    steps = np.rint(depth[valid] / scale)
+    if (steps >= QUANTIZED_DEPTH_NODATA).any():
+        logging.warning(f"Depths above {(QUANTIZED_DEPTH_NODATA - 1) * scale} were clipped by quantization")
+    quantized[valid] = np.clip(steps, 0, QUANTIZED_DEPTH_NODATA - 1)
+    return quantized
+
+
+def read_depth_grid(path: str, band: int = 1, window: Window = None) -> np.ndarray:
+    """Read the depths of a float or quantized depth grid as float32 with nan for nodata."""
+    with rasterio.open(path) as src:
+        values = src.read(band, window=window)
+        nodata, scale, offset = src.nodata, src.scales[band - 1], src.offsets[band - 1]
+    depth = values.astype(np.float32)
+    if scale != 1 or offset != 0:
+        depth = depth * np.float32(scale) + np.float32(offset)
+    if nodata is not None:
+        depth[values == nodata] = np.nan
+    return depth
+
+
+def raster_content_hash(path: str, memory_budget_mb: int = RASTER_MEMORY_BUDGET_MB) -> str:
+    """
+    Hash the grid (crs, transform, and shape), data type, nodata, and pixel values of a raster.
+
+    Rasters with equal hashes are bit-identical on the same grid, so their reprojections are identical too. Pixels are
+    read in windows of whole block rows of at most memory_budget_mb.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with rasterio.open(path) as src:
+        crs = src.crs.to_wkt() if src.crs else None
+        digest.update(json.dumps([crs, list(src.transform)[:6], src.shape, src.dtypes, src.nodatavals]).encode())
+        row_bytes = src.width * sum(np.dtype(dtype).itemsize for dtype in src.dtypes)
+        for window in block_row_windows(src.height, src.width, src.block_shapes[0][0], row_bytes, memory_budget_mb):
+            digest.update(np.ascontiguousarray(src.read(window=window)).data)
+    return digest.hexdigest()
+
+
 def reproject_raster(
     src_path: str,
     dest_path: str,
@@ -125,19 +354,35 @@ def reproject_raster(
     num_threads=4,
     tiled=False,
     blocksize=512,
+    warp_plan: WarpPlan = None,
+    memory_budget_mb: int = RASTER_MEMORY_BUDGET_MB,
+    depth_scale: float = None,
 ):
-    """Reproject/resample raster."""
+    """
+    Reproject/resample raster.
+
+    If a warp_plan of the grid of the source raster is given, the raster is warped with it rather than with GDAL; the
+    plan must have been made for the same dst_crs and resolution. Planned warps are written in windows of whole block
+    rows of at most memory_budget_mb; GDAL warps are chunked by GDAL itself.
+
+    If depth_scale is given, values are stored as uint16 multiples of depth_scale (see quantize_depth) with the scale
+    in the band metadata; use an integer predictor ("2"). Without a warp plan, such a raster is warped through a GDAL
+    WarpedVRT in the same windows.
+    """
     with rasterio.open(src_path) as src:
-        if not resolution and not resolution_units:
-            resolution = src.res[0]
-            transform, width, height = calculate_default_transform(src.crs, dst_crs, src.width, src.height, *src.bounds)
+        if warp_plan is not None and not warp_plan.matches(src):
+            logging.warning(f"{src_path} is not on the grid of the warp plan; warping it with GDAL")
+            warp_plan = None
+
+    with rasterio.open(src_path) as src:
+        if warp_plan is None:
+            transform, width, height, resolution = default_transform(src, dst_crs, resolution, resolution_units)
         else:
-            resolution = convert_units(dst_crs, resolution, resolution_units)
-            transform, width, height = calculate_default_transform(
-                src.crs, dst_crs, src.width, src.height, *src.bounds, resolution=resolution
-            )
+            transform, (height, width) = warp_plan.dst_transform, warp_plan.dst_shape
         kwargs = src.meta.copy()
         kwargs.update({"crs": dst_crs, "transform": transform, "width": width, "height": height})
+        if depth_scale is not None:
+            kwargs.update({"dtype": "uint16", "nodata": QUANTIZED_DEPTH_NODATA})
 
         kwargs.update(
             {
@@ -150,6 +395,31 @@ def reproject_raster(
             }
         )
         with rasterio.open(dest_path, "w", **kwargs) as dst:
+            if warp_plan is not None or depth_scale is not None:
+                vrt = None
+                if warp_plan is None:
+                    vrt = WarpedVRT(
+                        src, crs=dst_crs, transform=transform, width=width, height=height, resampling=Resampling.nearest
+                    )
+                # index, sampled mask, and warped values of each destination pixel, and their quantized copies
+                row_bytes = width * np.dtype(src.dtypes[0]).itemsize
+                if warp_plan is not None:
+                    row_bytes += width * (warp_plan.index.itemsize + 1)
+                if depth_scale is not None:
+                    row_bytes += width * (1 + 8 + 2)
+                block_height = dst.block_shapes[0][0]
+                for window in block_row_windows(height, width, block_height, row_bytes, memory_budget_mb):
+                    for i in range(1, src.count + 1):
+                        values = warp_plan.warp(src, i, window) if vrt is None else vrt.read(i, window=window)
+                        if depth_scale is not None:
+                            values = quantize_depth(values, src.nodata, depth_scale)
+                        dst.write(values, i, window=window)
+                if vrt is not None:
+                    vrt.close()
+                if depth_scale is not None:
+                    dst.scales = [depth_scale] * src.count
+                    dst.offsets = [0] * src.count
+                return
             for i in range(1, src.count + 1):
                 reproject(
                     source=rasterio.band(src, i),
@@ -164,44 +434,230 @@ def reproject_raster(
                 )
 
 
-def clip_raster(src_path: str, dst_path: str, mask_polygon: Polygon, vertical_units: str):
-    """Clip a raster file to a polygon and save the result to a new file."""
+def reproject_raster_to_cog(
+    src_path: str,
+    dest_path: str,
+    dst_crs: CRS,
+    resolution: float = None,
+    resolution_units: str = None,
+    compress="DEFLATE",
+    predictor="3",
+    num_threads=4,
+    blocksize=512,
+    overview_levels: list[int] = COG_OVERVIEW_LEVELS,
+    warp_plan: WarpPlan = None,
+    memory_budget_mb: int = RASTER_MEMORY_BUDGET_MB,
+    depth_scale: float = None,
+):
+    """
+    Reproject/resample a raster into a Cloud Optimized GeoTIFF in a single write.
+
+    The raster is warped (see reproject_raster) into an uncompressed in-memory GeoTIFF whose nearest-neighbour
+    overviews are built in memory; the COG driver then writes the tiles, overviews, and IFDs in COG order to
+    dest_path with the requested compression and predictor. Rasters larger than memory_budget_mb are staged in a
+    temporary file next to dest_path instead. See reproject_raster for depth_scale.
+    """
+    with rasterio.open(src_path) as src:
+        if warp_plan is not None and warp_plan.matches(src):
+            height, width = warp_plan.dst_shape
+        else:
+            _, width, height, _ = default_transform(src, dst_crs, resolution, resolution_units)
+        itemsize = np.dtype(src.dtypes[0]).itemsize if depth_scale is None else 2
+        nbytes = width * height * src.count * itemsize
+    tmp_path = staging_raster_path(nbytes, os.path.dirname(os.path.abspath(dest_path)), memory_budget_mb)
+    try:
+        reproject_raster(
+            src_path,
+            tmp_path,
+            dst_crs,
+            resolution,
+            resolution_units,
+            compress="NONE",
+            predictor="1",
+            num_threads=num_threads,
+            tiled=True,
+            blocksize=blocksize,
+            warp_plan=warp_plan,
+            memory_budget_mb=memory_budget_mb,
+            depth_scale=depth_scale,
+        )
+        with rasterio.open(tmp_path, "r+") as tmp:
+            tmp.build_overviews(overview_levels, Resampling.nearest)
+        rasterio.shutil.copy(
+            tmp_path,
+            dest_path,
+            driver="COG",
+            COMPRESS=compress,
+            PREDICTOR=predictor,
+            BLOCKSIZE=blocksize,
+            OVERVIEWS="FORCE_USE_EXISTING",
+            NUM_THREADS=num_threads,
+        )
+    finally:
+        if rasterio.shutil.exists(tmp_path):
+            rasterio.shutil.delete(tmp_path)
+
+
+def write_depth_cube(
+    src_paths: list[str],
+    dest_path: str,
+    dst_crs: CRS,
+    band_tags: list[dict],
+    band_descriptions: list[str],
+    resolution: float = None,
+    resolution_units: str = None,
+    compress="DEFLATE",
+    predictor="3",
+    num_threads=4,
+    blocksize=256,
+    memory_budget_mb: int = RASTER_MEMORY_BUDGET_MB,
+    depth_scale: float = None,
+):
+    """
+    Reproject single-band rasters into the bands of one tiled, compressed, band-interleaved GeoTIFF.
+
+    The destination grid is that of the first raster (see reproject_raster); every raster on its grid is warped with
+    one WarpPlan and the others are warped onto the same grid through a GDAL WarpedVRT. Each band gets its tags and
+    description. See reproject_raster for depth_scale.
+    """
+    warp_plan = WarpPlan.from_raster(src_paths[0], dst_crs, resolution, resolution_units, True, blocksize)
+    height, width = warp_plan.dst_shape
+    with rasterio.open(src_paths[0]) as src:
+        kwargs = src.meta.copy()
+    src_itemsize = np.dtype(kwargs["dtype"]).itemsize
+    kwargs.update(
+        {
+            "driver": "GTiff",
+            "count": len(src_paths),
+            "crs": dst_crs,
+            "transform": warp_plan.dst_transform,
+            "width": width,
+            "height": height,
+            "blockysize": blocksize,
+            "blockxsize": blocksize,
+            "tiled": True,
+            "interleave": "band",
+            "COMPRESS": compress,
+            "PREDICTOR": predictor,
+            "BIGTIFF": "IF_SAFER",
+            "num_threads": num_threads,
+        }
+    )
+    if depth_scale is not None:
+        kwargs.update({"dtype": "uint16", "nodata": QUANTIZED_DEPTH_NODATA})
+    with rasterio.open(dest_path, "w", **kwargs) as dst:
+        row_bytes = width * (warp_plan.index.itemsize + 1 + src_itemsize)
+        if depth_scale is not None:
+            row_bytes += width * (1 + 8 + 2)
+        for band, (src_path, tags, description) in enumerate(zip(src_paths, band_tags, band_descriptions), start=1):
+            with rasterio.open(src_path) as src:
+                vrt = None
+                if not warp_plan.matches(src):
+                    logging.warning(f"{src_path} is not on the grid of {src_paths[0]}; warping it with GDAL")
+                    vrt = WarpedVRT(
+                        src,
+                        crs=dst_crs,
+                        transform=warp_plan.dst_transform,
+                        width=width,
+                        height=height,
+                        resampling=Resampling.nearest,
+                    )
+                for window in block_row_windows(height, width, blocksize, row_bytes, memory_budget_mb):
+                    values = warp_plan.warp(src, 1, window) if vrt is None else vrt.read(1, window=window)
+                    if depth_scale is not None:
+                        values = quantize_depth(values, src.nodata, depth_scale)
+                    dst.write(values, band, window=window)
+                if vrt is not None:
+                    vrt.close()
+            dst.update_tags(band, **tags)
+            dst.set_band_description(band, description)
+        if depth_scale is not None:
+            dst.scales = [depth_scale] * len(src_paths)
+            dst.offsets = [0] * len(src_paths)
+
+
+def read_depth_cube_profiles(cube_path: str) -> dict[str, np.ndarray]:
+    """Return the band, us_flow, and ds_wse (nan for normal depth) of each profile of a depth cube."""
+    with rasterio.open(cube_path) as src:
+        tags = [src.tags(band) for band in src.indexes]
+    return {
+        "band": np.arange(1, len(tags) + 1),
+        "us_flow": np.array([float(t["us_flow"]) for t in tags]),
+        "ds_wse": np.array([float(t.get("ds_wse", "nan")) for t in tags]),
+    }
+
+
+def clip_raster(
+    src_path: str,
+    dst_path: str,
+    mask_polygon: Polygon,
+    vertical_units: str,
+    memory_budget_mb: int = RASTER_MEMORY_BUDGET_MB,
+):
+    """
+    Clip a raster file to a polygon and save the result to a new file.
+
+    The raster is cropped to the polygon and processed in windows of whole block rows of at most memory_budget_mb;
+    pixels outside the polygon are set to nodata and Meters are converted to Feet in place.
+    """
     if os.path.exists(dst_path):
         raise FileExistsError(dst_path)
     if not isinstance(mask_polygon, Polygon):
         raise TypeError(mask_polygon)
+    if vertical_units not in ["Feet", "Meters"]:
+        raise UnknownVerticalUnits(f"Expected Feet or Meters recieved {vertical_units}")
     os.makedirs(os.path.dirname(dst_path), exist_ok=True)
 
     logging.info(f"Reading: {src_path}")
     with rasterio.open(src_path) as src:
-        out_meta = src.meta
-        out_image, out_transform = mask.mask(src, [mask_polygon], all_touched=True, crop=True)
+        try:
+            crop = geometry_window(src, [mask_polygon])
+        except WindowError:
+            raise ValueError("Input shapes do not overlap raster.")
+        height, width = int(crop.height), int(crop.width)
         nd = src.nodata
+        fill = 0 if nd is None else nd
 
-    if np.all(out_image == nd):
-        raise NullTerrainError(f"Terrain downloaded from {src_path} was all nodata values.")
-
-    out_meta.update(
-        {
-            "driver": "GTiff",
-            "height": out_image.shape[1],
-            "width": out_image.shape[2],
-            "transform": out_transform,
-            "compress": "LZW",
-            "predictor": 3,
-            "tiled": True,
-        }
-    )
+        out_meta = src.meta
+        out_meta.update(
+            {
+                "driver": "GTiff",
+                "height": height,
+                "width": width,
+                "transform": src.window_transform(crop),
+                "compress": "LZW",
+                "predictor": 3,
+                "tiled": True,
+            }
+        )
 
-    logging.info(f"Writing as masked: {dst_path}")
-    with rasterio.open(dst_path, "w", **out_meta) as dest:
-        if vertical_units == "Meters":
-            out_image_ft = np.where(out_image == out_meta["nodata"], out_meta["nodata"], out_image / METERS_PER_FOOT)
-            dest.write(out_image_ft)
-        elif vertical_units == "Feet":
-            dest.write(out_image)
-        else:
-            raise UnknownVerticalUnits(f"Expected Feet or Meters recieved {vertical_units}")
+        logging.info(f"Writing as masked: {dst_path}")
+        all_nodata = True
+        with rasterio.open(dst_path, "w", **out_meta) as dest:
+            # values and masks (read as uint8, then bool) of each band, plus the polygon mask and its combination
+            row_bytes = width * (src.count * (np.dtype(src.dtypes[0]).itemsize + 2) + 3)
+            for window in block_row_windows(height, width, dest.block_shapes[0][0], row_bytes, memory_budget_mb):
+                polygon_mask = geometry_mask(
+                    [mask_polygon],
+                    out_shape=(window.height, width),
+                    transform=dest.window_transform(window),
+                    all_touched=True,
+                )
+                src_window = Window(crop.col_off, crop.row_off + window.row_off, width, window.height)
+                image = src.read(window=src_window, masked=True)
+                values = image.data
+                np.copyto(values, fill, where=image.mask | polygon_mask)
+                if nd is not None:
+                    all_nodata = all_nodata and bool(np.all(values == nd))
+                else:
+                    all_nodata = False
+                if vertical_units == "Meters":
+                    np.divide(values, METERS_PER_FOOT, out=values, where=values != nd if nd is not None else True)
+                dest.write(values, window=window)
+
+    if all_nodata:
+        os.remove(dst_path)
+        raise NullTerrainError(f"Terrain downloaded from {src_path} was all nodata values.")
 
 
 def get_terrain_exe_path(ras_ver: str) -> str:
@@ -194,7 +194,7 @@ def get_asset_info(asset_key: str, rms: RasModelStructure, bucket: str = None) -
             string = str_from_s3(rms.ras_project_file, client, bucket)
             rp = RasProject.from_str(string, rms.ras_project_file)
         else:
-            rm = RasManager(rms.ras_project_file, crs=rms.crs)
+            rm = RasManager(rms.ras_project_file, crs=rms.crs, lazy=True)
 
     description = ""
     roles = []
@@ -224,6 +224,9 @@ def get_asset_info(asset_key: str, rms: RasModelStructure, bucket: str = None) -
         extra_fields["Number of reaches"] = geom.n_reaches
         extra_fields["Number of cross sections"] = geom.n_cross_sections
         extra_fields["Number of junctions"] = geom.n_junctions
+        if not bucket:
+            # write any htab fixes made while reading the geometry
+            geom.save()
 
     elif re.match(".p[0-9]{2}", file_extension):
         roles.extend(["plan", "hec-ras", pystac.MediaType.TEXT])
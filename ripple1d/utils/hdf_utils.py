@@ -0,0 +1,118 @@
+"""Utils for reading HEC-RAS HDF files through a shared pool of open read-only handles."""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+import h5py
+
+from ripple1d.consts import HDF_POOL_FD_FRACTION, HDF_POOL_MAX_HANDLES, HDF_RDCC_NBYTES, HDF_RDCC_NSLOTS
+
+
+def fd_budget(fraction: float = HDF_POOL_FD_FRACTION) -> int | None:
+    """Return the share of the process's soft open file limit the pool may use; None if the limit is unknown."""
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return None
+    return max(1, int(soft * fraction))
+
+
+class HdfHandlePool:
+    """
+    Process-wide LRU pool of open read-only h5py file handles.
+
+    Handles are keyed by path, file class, size, and modification time, so a file rewritten by HEC-RAS is reopened
+    rather than served stale. The pool is bounded by a handle count and by a share of the open file limit; the least
+    recently used handle is closed when either is exceeded. Pooled handles must not be closed by callers; close them
+    through the pool (e.g. before HEC-RAS overwrites a file).
+    """
+
+    def __init__(
+        self,
+        max_handles: int = HDF_POOL_MAX_HANDLES,
+        rdcc_nbytes: int = HDF_RDCC_NBYTES,
+        rdcc_nslots: int = HDF_RDCC_NSLOTS,
+    ):
+        self._handles = OrderedDict()
+        self._lock = threading.RLock()
+        self.configure(max_handles, rdcc_nbytes, rdcc_nslots)
+
+    def configure(self, max_handles: int = None, rdcc_nbytes: int = None, rdcc_nslots: int = None):
+        """Update the pool limits and chunk cache settings; open handles are closed so new settings apply."""
+        with self._lock:
+            self.close()
+            if max_handles is not None:
+                budget = fd_budget()
+                self.max_handles = max_handles if budget is None else min(max_handles, budget)
+            if rdcc_nbytes is not None:
+                self.rdcc_nbytes = rdcc_nbytes
+            if rdcc_nslots is not None:
+                self.rdcc_nslots = rdcc_nslots
+
+    def get(self, path: str, file_class: type = h5py.File) -> h5py.File:
+        """Return an open read-only handle of an HDF file, opening it if it is not already pooled."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (path, file_class, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None and handle.id.valid:
+                self._handles.move_to_end(key)
+                return handle
+
+            self.close(path)
+            # h5py opens read-only by default; rashdf classes fix the mode themselves
+            handle = file_class(path, rdcc_nbytes=self.rdcc_nbytes, rdcc_nslots=self.rdcc_nslots)
+            self._handles[key] = handle
+            while len(self._handles) > self.max_handles:
+                _, evicted = self._handles.popitem(last=False)
+                self._close_handle(evicted)
+            return handle
+
+    def close(self, path: str = None):
+        """Close the pooled handles of a file, or of every file if no path is given."""
+        with self._lock:
+            if path is not None:
+                path = os.path.abspath(path)
+            for key in [key for key in self._handles if path is None or key[0] == path]:
+                self._close_handle(self._handles.pop(key))
+
+    def __len__(self) -> int:
+        """Return the number of pooled handles."""
+        return len(self._handles)
+
+    @staticmethod
+    def _close_handle(handle: h5py.File):
+        try:
+            handle.close()
+        except Exception as e:
+            logging.debug(f"Could not close pooled HDF handle: {e}")
+
+
+HDF_POOL = HdfHandlePool()
+
+
+def pooled_hdf(path: str, file_class: type = h5py.File) -> h5py.File:
+    """Return an open read-only handle of an HDF file from the process-wide pool; do not close it."""
+    return HDF_POOL.get(path, file_class)
+
+
+def release_hdf_pool(func):
+    """Close every pooled HDF handle when the decorated op returns, so files are not held open between tasks."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            HDF_POOL.close()
+
+    return wrapper
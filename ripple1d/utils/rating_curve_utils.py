@@ -0,0 +1,469 @@
+"""Utils for querying and interpolating the rating curves stored in FIM rating curve databases."""
+
+from __future__ import annotations
+
+import math
+import os
+import shutil
+import sqlite3
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# columns of the rating curve table read by the query layer; covered by the lookup index of the table
+RATING_CURVE_COLUMNS = ["reach_id", "boundary_condition", "ds_wse", "us_flow", "us_wse", "us_depth", "map_exist"]
+
+# columnar layout of the rating curve table: float32 values and dictionary-encoded strings
+RATING_CURVES_ARROW_SCHEMA = pa.schema(
+    [
+        ("reach_id", pa.int64()),
+        ("ds_depth", pa.float32()),
+        ("ds_wse", pa.float32()),
+        ("us_flow", pa.float32()),
+        ("us_depth", pa.float32()),
+        ("us_wse", pa.float32()),
+        ("boundary_condition", pa.dictionary(pa.int8(), pa.string())),
+        ("plan_suffix", pa.dictionary(pa.int8(), pa.string())),
+        ("map_exist", pa.bool_()),
+        ("xs_overtopped", pa.bool_()),
+    ]
+)
+
+# dataset of the depth grid aliases within a rating curve Parquet dataset; pyarrow skips paths starting with "_" when
+# discovering the rating curve files
+DEPTH_GRID_ALIASES_DATASET = "_depth_grid_aliases"
+DEPTH_GRID_ALIASES_ARROW_SCHEMA = pa.schema(
+    [("reach_id", pa.int64()), ("grid", pa.string()), ("canonical_grid", pa.string())]
+)
+
+
+def read_rating_curves_db(
+    db_name: str, reach_ids: list[int] = None, boundary_condition: str = None, table_name: str = "rating_curves"
+) -> dict[str, np.ndarray]:
+    """
+    Read rating curves from a rating curve database into typed arrays.
+
+    Parameters
+    ----------
+    db_name : str
+        Path to the rating curve database.
+    reach_ids : list[int], optional
+        Reaches to read, by default all reaches in the table.
+    boundary_condition : str, optional
+        Boundary condition to read (kwse or nd), by default both.
+    table_name : str, optional
+        Name of the rating curve table, by default "rating_curves".
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        One array per column of RATING_CURVE_COLUMNS, ordered by reach_id, boundary_condition, ds_wse, and us_flow.
+    """
+    if not os.path.exists(db_name):
+        raise FileNotFoundError(f"rating curve database does not exist: {db_name}")
+
+    query = f"SELECT {', '.join(f't.{column}' for column in RATING_CURVE_COLUMNS)} FROM {table_name} t"
+    conditions, parameters = [], []
+    if reach_ids is not None:
+        query += " JOIN temp.query_reaches q ON q.reach_id = t.reach_id"
+    if boundary_condition is not None:
+        conditions.append("t.boundary_condition = ?")
+        parameters.append(boundary_condition)
+    if conditions:
+        query += f" WHERE {' AND '.join(conditions)}"
+    query += " ORDER BY t.reach_id, t.boundary_condition, t.ds_wse, t.us_flow"
+
+    with sqlite3.connect(db_name) as conn:
+        if reach_ids is not None:
+            # join against a temporary table rather than binding an unbounded IN list
+            conn.execute("CREATE TEMP TABLE query_reaches (reach_id INTEGER PRIMARY KEY)")
+            conn.executemany(
+                "INSERT OR IGNORE INTO temp.query_reaches VALUES (?)", ((int(i),) for i in np.asarray(reach_ids))
+            )
+        rows = conn.execute(query, parameters).fetchall()
+    conn.close()
+
+    columns = list(zip(*rows)) if rows else [[] for _ in RATING_CURVE_COLUMNS]
+    curves = dict(zip(RATING_CURVE_COLUMNS, columns))
+    return {
+        "reach_id": np.array(curves["reach_id"], dtype=np.int64),
+        "boundary_condition": np.array(curves["boundary_condition"], dtype=str),
+        "ds_wse": np.array(curves["ds_wse"], dtype=float),
+        "us_flow": np.array(curves["us_flow"], dtype=float),
+        "us_wse": np.array(curves["us_wse"], dtype=float),
+        "us_depth": np.array(curves["us_depth"], dtype=float),
+        "map_exist": np.array(curves["map_exist"], dtype=bool),
+    }
+
+
+def rating_curves_db_to_parquet(
+    db_name: str,
+    parquet_directory: str,
+    table_name: str = "rating_curves",
+    partition_cols: list[str] = None,
+    batch_rows: int = 1_000_000,
+) -> str:
+    """
+    Export the rows of a rating curve database to a hive-partitioned Parquet dataset.
+
+    Rows are streamed in batches of batch_rows, ordered by the partition columns, and written with the
+    RATING_CURVES_ARROW_SCHEMA layout. Partitions written by an earlier export of the same reaches are replaced.
+    The depth grid aliases of the exported reaches, if any, are written to the DEPTH_GRID_ALIASES_DATASET dataset
+    (partitioned by reach_id) within the dataset; see read_depth_grid_aliases.
+
+    Parameters
+    ----------
+    db_name : str
+        Path to the rating curve database.
+    parquet_directory : str
+        Root directory of the Parquet dataset; e.g., one dataset per HUC.
+    table_name : str, optional
+        Name of the rating curve table, by default "rating_curves".
+    partition_cols : list[str], optional
+        Columns to partition the dataset by, by default reach_id.
+    batch_rows : int, optional
+        Number of rows read from the database per batch, by default 1,000,000.
+
+    Returns
+    -------
+    str
+        The root directory of the Parquet dataset.
+    """
+    if not os.path.exists(db_name):
+        raise FileNotFoundError(f"rating curve database does not exist: {db_name}")
+    schema = RATING_CURVES_ARROW_SCHEMA
+    partition_cols = partition_cols or ["reach_id"]
+
+    with sqlite3.connect(db_name) as conn:
+        n_partitions = conn.execute(
+            f"SELECT COUNT(*) FROM (SELECT DISTINCT {', '.join(partition_cols)} FROM {table_name})"
+        ).fetchone()[0]
+    conn.close()
+
+    def record_batches():
+        with sqlite3.connect(db_name) as conn:
+            # rows of a partition are contiguous, so its file is complete when the writer moves on and can be closed
+            cursor = conn.execute(
+                f"SELECT {', '.join(schema.names)} FROM {table_name} ORDER BY {', '.join(partition_cols)}"
+            )
+            while rows := cursor.fetchmany(batch_rows):
+                columns = []
+                for field, values in zip(schema, zip(*rows)):
+                    if pa.types.is_boolean(field.type):
+                        columns.append(pa.array(values, type=pa.int8()).cast(pa.bool_()))
+                    else:
+                        columns.append(pa.array(values, type=field.type))
+                yield pa.RecordBatch.from_arrays(columns, schema=schema)
+        conn.close()
+
+    ds.write_dataset(
+        record_batches(),
+        parquet_directory,
+        schema=schema,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([schema.field(name) for name in partition_cols]), flavor="hive"),
+        existing_data_behavior="delete_matching",
+        # a regional database has a partition per reach; pyarrow allows 1024 per batch by default
+        max_partitions=max(n_partitions, 1),
+    )
+    depth_grid_aliases_to_parquet(db_name, parquet_directory, table_name)
+    return parquet_directory
+
+
+def depth_grid_aliases_to_parquet(
+    db_name: str,
+    parquet_directory: str,
+    table_name: str = "rating_curves",
+    aliases_table_name: str = "depth_grid_aliases",
+):
+    """Replace the depth grid aliases of the reaches of a rating curve database in a rating curve Parquet dataset."""
+    aliases_directory = os.path.join(parquet_directory, DEPTH_GRID_ALIASES_DATASET)
+    with sqlite3.connect(db_name) as conn:
+        reach_ids = [reach_id for (reach_id,) in conn.execute(f"SELECT DISTINCT reach_id FROM {table_name}")]
+        rows = []
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (aliases_table_name,)).fetchone():
+            rows = conn.execute(f"SELECT reach_id, grid, canonical_grid FROM {aliases_table_name}").fetchall()
+    conn.close()
+
+    # reaches exported again without deduplicated grids have no aliases to replace their stale ones
+    for reach_id in reach_ids:
+        shutil.rmtree(os.path.join(aliases_directory, f"reach_id={reach_id}"), ignore_errors=True)
+    if rows:
+        schema = DEPTH_GRID_ALIASES_ARROW_SCHEMA
+        table = pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for field, values in zip(schema, zip(*rows))], schema=schema
+        )
+        ds.write_dataset(
+            table,
+            aliases_directory,
+            format="parquet",
+            partitioning=ds.partitioning(pa.schema([schema.field("reach_id")]), flavor="hive"),
+            existing_data_behavior="delete_matching",
+            max_partitions=max(len(set(table["reach_id"].to_pylist())), 1),
+        )
+
+
+def segment_searchsorted(
+    segments: np.ndarray, values: np.ndarray, query_segments: np.ndarray, query_values: np.ndarray
+) -> np.ndarray:
+    """
+    Find insertion indices of many queries into many sorted segments of one array at once.
+
+    segments and values must be sorted by segment and then by value. Each query is inserted (side="left") into the
+    values of its own segment; the returned indices are positions in the full array.
+    """
+    n = len(segments)
+    keys = np.concatenate([segments, query_segments])
+    order = np.lexsort(
+        (
+            np.concatenate([np.ones(n, dtype=np.int8), np.zeros(len(query_segments), dtype=np.int8)]),
+            np.concatenate([values, query_values]),
+            keys,
+        )
+    )
+    # the number of segment values ahead of a query in the merged order is its insertion index
+    is_value = order < n
+    preceding = np.cumsum(is_value) - is_value
+    indices = np.empty(len(query_segments), dtype=np.int64)
+    indices[order[~is_value] - n] = preceding[~is_value]
+    return indices
+
+
+def read_depth_grid_aliases(
+    db_name: str, reach_ids: list[int] = None, table_name: str = "depth_grid_aliases"
+) -> dict[str, str]:
+    """
+    Return the canonical grid of each depth grid stored as an identical grid; empty if none were deduplicated.
+
+    db_name is a rating curve database or a rating curve Parquet dataset (see rating_curves_db_to_parquet).
+    """
+    if not os.path.exists(db_name):
+        raise FileNotFoundError(f"rating curve database does not exist: {db_name}")
+    if os.path.isdir(db_name):
+        aliases_directory = os.path.join(db_name, DEPTH_GRID_ALIASES_DATASET)
+        if not os.path.isdir(aliases_directory):
+            return {}
+        dataset = ds.dataset(
+            aliases_directory, schema=DEPTH_GRID_ALIASES_ARROW_SCHEMA, format="parquet", partitioning="hive"
+        )
+        query_filter = None if reach_ids is None else ds.field("reach_id").isin(np.asarray(reach_ids).astype(np.int64))
+        table = dataset.to_table(columns=["grid", "canonical_grid"], filter=query_filter)
+        return dict(zip(table["grid"].to_pylist(), table["canonical_grid"].to_pylist()))
+    with sqlite3.connect(db_name) as conn:
+        rows = []
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table_name,)).fetchone():
+            query = f"SELECT a.grid, a.canonical_grid FROM {table_name} a"
+            if reach_ids is not None:
+                conn.execute("CREATE TEMP TABLE query_reaches (reach_id INTEGER PRIMARY KEY)")
+                conn.executemany(
+                    "INSERT OR IGNORE INTO temp.query_reaches VALUES (?)", ((int(i),) for i in np.asarray(reach_ids))
+                )
+                query += " JOIN temp.query_reaches q ON q.reach_id = a.reach_id"
+            rows = conn.execute(query).fetchall()
+    conn.close()
+    return dict(rows)
+
+
+def depth_grid_paths(
+    reach_ids: np.ndarray, grid_flows: np.ndarray, grid_ds_wses: np.ndarray, aliases: dict[str, str] = None
+) -> list[str]:
+    """
+    Return FIM library paths ({reach_id}/z_{ds_wse}/f_{flow}.tif) of depth grids; z_nd where ds_wse is nan.
+
+    Grids stored as an identical canonical grid resolve to the canonical grid if aliases (see read_depth_grid_aliases)
+    are given.
+    """
+    aliases = aliases or {}
+    paths = []
+    for reach_id, flow, ds_wse in zip(np.asarray(reach_ids).tolist(), grid_flows.tolist(), grid_ds_wses.tolist()):
+        if math.isnan(flow):
+            paths.append(None)
+        else:
+            depth = "z_nd" if math.isnan(ds_wse) else f"z_{str(ds_wse).replace('.', '_')}"
+            path = f"{reach_id}/{depth}/f_{int(flow)}.tif"
+            paths.append(aliases.get(path, path))
+    return paths
+
+
+def depth_cube_bands(
+    cube_profiles: dict[str, np.ndarray], grid_flows: np.ndarray, grid_ds_wses: np.ndarray
+) -> np.ndarray:
+    """Return the depth cube bands (see read_depth_cube_profiles) of depth grids; 0 where a grid is not in the cube."""
+    bands = {
+        (flow, None if math.isnan(ds_wse) else ds_wse): band
+        for band, flow, ds_wse in zip(
+            cube_profiles["band"].tolist(), cube_profiles["us_flow"].tolist(), cube_profiles["ds_wse"].tolist()
+        )
+    }
+    return np.array(
+        [
+            bands.get((flow, None if math.isnan(ds_wse) else ds_wse), 0)
+            for flow, ds_wse in zip(np.asarray(grid_flows, dtype=float).tolist(), np.asarray(grid_ds_wses).tolist())
+        ],
+        dtype=np.int64,
+    )
+
+
+class RatingCurveLookup:
+    """
+    Vectorized rating curve lookups for many reaches.
+
+    Normal depth (nd) curves give the upstream stage of a reach from its flow. Known water surface elevation (kwse)
+    curves are used when a downstream water surface elevation is given; the curve of the nearest downstream water
+    surface elevation is interpolated by flow. Flows outside a curve are clamped to its ends.
+    """
+
+    def __init__(self, curves: dict[str, np.ndarray]):
+        reach_ids = np.asarray(curves["reach_id"], dtype=np.int64)
+        self.reach_ids = np.unique(reach_ids)
+        reach_index = np.searchsorted(self.reach_ids, reach_ids)
+        is_kwse = np.asarray(curves["boundary_condition"]) == "kwse"
+        ds_wse = np.asarray(curves["ds_wse"], dtype=float)
+        us_flow = np.asarray(curves["us_flow"], dtype=float)
+        map_exist = np.asarray(curves["map_exist"], dtype=bool)
+
+        # normal depth curves: one per reach, sorted by flow; duplicate flows keep the mapped row
+        nd = self._sorted(reach_index, np.zeros(len(reach_index)), us_flow, map_exist, ~is_kwse)
+        self.nd = self._curves(nd, curves)
+        self.nd["segment"] = reach_index[nd]
+        self.nd["ds_wse"] = np.full(len(nd), np.nan)
+
+        # known water surface curves: one per reach and downstream water surface elevation, sorted by flow
+        kwse = self._sorted(reach_index, ds_wse, us_flow, map_exist, is_kwse)
+        self.kwse = self._curves(kwse, curves)
+        new_curve = np.ones(len(kwse), dtype=bool)
+        new_curve[1:] = (np.diff(reach_index[kwse]) != 0) | (np.diff(ds_wse[kwse]) != 0)
+        self.kwse["segment"] = np.cumsum(new_curve) - 1
+        self.kwse["ds_wse"] = ds_wse[kwse]
+        self.curve_reach = reach_index[kwse][new_curve]
+        self.curve_ds_wse = ds_wse[kwse][new_curve]
+
+    @classmethod
+    def from_db(cls, db_name: str, reach_ids: list[int] = None, table_name: str = "rating_curves") -> RatingCurveLookup:
+        """Build a lookup from the rating curves of a rating curve database."""
+        return cls(read_rating_curves_db(db_name, reach_ids, table_name=table_name))
+
+    @staticmethod
+    def _sorted(
+        reach_index: np.ndarray, ds_wse: np.ndarray, us_flow: np.ndarray, map_exist: np.ndarray, mask: np.ndarray
+    ) -> np.ndarray:
+        """Return row positions sorted by reach, downstream water surface elevation, and flow without duplicates."""
+        rows = np.flatnonzero(mask)
+        rows = rows[np.lexsort((~map_exist[rows], us_flow[rows], ds_wse[rows], reach_index[rows]))]
+        duplicate = np.ones(len(rows), dtype=bool)
+        duplicate[:1] = False
+        for values in [reach_index, ds_wse, us_flow]:
+            duplicate[1:] &= values[rows][1:] == values[rows][:-1]
+        return rows[~duplicate]
+
+    @staticmethod
+    def _curves(rows: np.ndarray, curves: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+        """Return the stage and depth grid columns of the given rows."""
+        return {
+            "us_flow": np.asarray(curves["us_flow"], dtype=float)[rows],
+            "us_wse": np.asarray(curves["us_wse"], dtype=float)[rows],
+            "us_depth": np.asarray(curves["us_depth"], dtype=float)[rows],
+            "map_exist": np.asarray(curves["map_exist"], dtype=bool)[rows],
+        }
+
+    def lookup(self, reach_ids: np.ndarray, flows: np.ndarray, ds_wses: np.ndarray = None) -> dict[str, np.ndarray]:
+        """
+        Interpolate the upstream stage and find the nearest mapped depth grid for many reaches at once.
+
+        Parameters
+        ----------
+        reach_ids : np.ndarray
+            NWM reach id of each query.
+        flows : np.ndarray
+            Upstream flow of each query.
+        ds_wses : np.ndarray, optional
+            Downstream water surface elevation of each query; nan (or None for all queries) uses normal depth.
+
+        Returns
+        -------
+        dict[str, np.ndarray]
+            us_wse and us_depth interpolated from the rating curves, and grid_flow and grid_ds_wse of the nearest
+            mapped depth grid (grid_ds_wse is nan for normal depth grids). Values are nan for unknown reaches.
+        """
+        reach_ids = np.asarray(reach_ids, dtype=np.int64)
+        flows = np.asarray(flows, dtype=float)
+        ds_wses = np.full(len(flows), np.nan) if ds_wses is None else np.asarray(ds_wses, dtype=float)
+
+        reach_index = np.searchsorted(self.reach_ids, reach_ids)
+        found = reach_index < len(self.reach_ids)
+        found[found] = self.reach_ids[reach_index[found]] == reach_ids[found]
+
+        results = {name: np.full(len(flows), np.nan) for name in ["us_wse", "us_depth", "grid_flow", "grid_ds_wse"]}
+
+        # pick the kwse curve of each query with the nearest downstream water surface elevation
+        kwse = found & ~np.isnan(ds_wses)
+        curve = self._nearest(self.curve_reach, self.curve_ds_wse, reach_index[kwse], ds_wses[kwse])
+        kwse[kwse] = curve >= 0
+        self._interpolate(self.kwse, curve[curve >= 0], flows[kwse], kwse, results)
+
+        nd = found & ~kwse
+        self._interpolate(self.nd, reach_index[nd], flows[nd], nd, results)
+        return results
+
+    @staticmethod
+    def _bounds(segments: np.ndarray, query_segments: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return the start and end positions of the segments of the queries."""
+        return np.searchsorted(segments, query_segments, "left"), np.searchsorted(segments, query_segments, "right")
+
+    def _nearest(
+        self, segments: np.ndarray, values: np.ndarray, query_segments: np.ndarray, query_values: np.ndarray
+    ) -> np.ndarray:
+        """Return the position of the nearest value in the segment of each query; -1 if the segment is empty."""
+        start, end = self._bounds(segments, query_segments)
+        index = segment_searchsorted(segments, values, query_segments, query_values)
+        below = np.clip(index - 1, 0, max(len(values) - 1, 0))
+        above = np.clip(index, 0, max(len(values) - 1, 0))
+        has_below = index > start
+        has_above = index < end
+        if len(values):
+            use_above = has_above & (~has_below | (values[above] - query_values < query_values - values[below]))
+        else:
+            use_above = has_above
+        nearest = np.where(use_above, above, np.where(has_below, below, -1))
+        nearest[np.isnan(query_values)] = -1
+        return nearest
+
+    def _interpolate(
+        self,
+        curves: dict[str, np.ndarray],
+        query_segments: np.ndarray,
+        flows: np.ndarray,
+        mask: np.ndarray,
+        results: dict[str, np.ndarray],
+    ):
+        """Interpolate stages along flow in the curves of the queries and find their nearest mapped grids."""
+        start, end = self._bounds(curves["segment"], query_segments)
+        has_curve = end > start
+        mask = mask.copy()
+        mask[mask] = has_curve
+        query_segments, flows, start, end = (
+            query_segments[has_curve],
+            flows[has_curve],
+            start[has_curve],
+            end[has_curve],
+        )
+        if not len(query_segments):
+            return
+
+        index = segment_searchsorted(curves["segment"], curves["us_flow"], query_segments, flows)
+        hi = np.minimum(np.maximum(index, start + 1), end - 1)
+        lo = np.maximum(hi - 1, start)
+        x_lo, x_hi = curves["us_flow"][lo], curves["us_flow"][hi]
+        span = x_hi - x_lo
+        weight = np.clip(np.divide(flows - x_lo, span, out=np.zeros_like(flows), where=span > 0), 0, 1)
+        weight[np.isnan(flows)] = np.nan
+        for name in ["us_wse", "us_depth"]:
+            results[name][mask] = curves[name][lo] + weight * (curves[name][hi] - curves[name][lo])
+
+        mapped = np.flatnonzero(curves["map_exist"])
+        grid = self._nearest(curves["segment"][mapped], curves["us_flow"][mapped], query_segments, flows)
+        grid_rows = mapped[grid[grid >= 0]]
+        has_grid = np.flatnonzero(mask)[grid >= 0]
+        results["grid_flow"][has_grid] = curves["us_flow"][grid_rows]
+        results["grid_ds_wse"][has_grid] = curves["ds_wse"][grid_rows]
@@ -2,14 +2,17 @@
 
 from __future__ import annotations
 
+import bisect
 import glob
 import logging
 import os
-from collections import defaultdict
+import warnings
+from collections import defaultdict, deque
+from concurrent.futures import Executor
 from copy import copy
-from functools import lru_cache
+from functools import lru_cache, wraps
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Iterable, Iterator, Optional
 
 import boto3
 import fiona
@@ -28,13 +31,20 @@ from shapely import (
     buffer,
     concave_hull,
     line_merge,
+    linestrings,
     make_valid,
     reverse,
     union_all,
 )
 from shapely.ops import split, substring
 
-from ripple1d.consts import DEFAULT_MAX_WALK
+from ripple1d.consts import (
+    BULK_DECODE_MIN_FIELDS,
+    DEFAULT_MAX_WALK,
+    PROFILE_NAMES_HDF_PATH,
+    STEADY_XS_RESULTS_HDF_PATH,
+    XS_NAMES_HDF_PATH,
+)
 from ripple1d.errors import (
     InvalidNetworkPath,
     RASComputeError,
@@ -42,6 +52,7 @@ from ripple1d.errors import (
     RASGeometryError,
     RASStoreAllMapsError,
 )
+from ripple1d.utils.hdf_utils import pooled_hdf
 from ripple1d.utils.s3_utils import list_keys
 
 load_dotenv(find_dotenv())
@@ -106,6 +117,44 @@ def decode(df: pd.DataFrame):
     return df
 
 
+def normalize_xs_names(names: np.ndarray) -> np.ndarray:
+    """Decode the cross section names of a HEC-RAS results HDF and collapse the runs of spaces between their parts."""
+    return pd.Series(names, dtype=object).str.decode("utf-8").str.replace(" +", " ", regex=True).to_numpy()
+
+
+@lru_cache(maxsize=16)
+def hdf_xs_names(hdf_file: str, mtime_ns: int, names_path: str) -> tuple[np.ndarray, dict[str, int]]:
+    """
+    Read and normalize the cross section names of a HEC-RAS results HDF.
+
+    Returns the names and a mapping of each name to its column in the results datasets. Results are cached per
+    file and modification time.
+    """
+    names = normalize_xs_names(pooled_hdf(hdf_file)[names_path][:])
+    positions = {}
+    for i, name in enumerate(names):
+        positions.setdefault(name, i)
+    return names, positions
+
+
+def read_steady_results(
+    hdf_file: str, variables: dict[str, str]
+) -> tuple[list[str], np.ndarray, dict[str, np.ndarray]]:
+    """
+    Read steady cross section results from a HEC-RAS plan results HDF.
+
+    variables maps result names to their datasets relative to the steady cross section results group; variables
+    missing from the file are skipped. Returns the profile names, the normalized cross section names, and a
+    (profile, cross section) array for each variable.
+    """
+    xs_names, _ = hdf_xs_names(hdf_file, os.stat(hdf_file).st_mtime_ns, XS_NAMES_HDF_PATH)
+    hdf = pooled_hdf(hdf_file)
+    profile_names = [name.decode("utf-8") for name in hdf[PROFILE_NAMES_HDF_PATH][:]]
+    group = hdf[STEADY_XS_RESULTS_HDF_PATH]
+    results = {name: group[path][:] for name, path in variables.items() if path in group}
+    return profile_names, xs_names, results
+
+
 def get_path(expected_path: str, client: boto3.client = None, bucket: str = None) -> str:
     """Get the path for a file."""
     if client and bucket:
@@ -195,6 +244,86 @@ def check_xs_direction(cross_sections: gpd.GeoDataFrame, reach: LineString):
     return cross_sections.loc[cross_sections["river_reach_rs"].isin(river_reach_rs)]
 
 
+def linestrings_from_coords(coords: list[np.ndarray]) -> np.ndarray:
+    """
+    Build an array of LineStrings from a list of (n, 2) coordinate arrays with a single vectorized shapely call.
+
+    Missing (None) or empty coordinate arrays result in an empty LineString.
+    """
+    geoms = np.array([LineString()] * len(coords), dtype=object)
+    present = [c for c in coords if c is not None and len(c) > 0]
+    if present:
+        lengths = [0 if c is None else len(c) for c in coords]
+        linestrings(np.concatenate(present), indices=np.repeat(np.arange(len(coords)), lengths), out=geoms)
+    return geoms
+
+
+def gdf_from_records(records: list[dict], geometry: np.ndarray, crs: str = None) -> gpd.GeoDataFrame:
+    """Build a geodataframe in one shot from an array of geometries and a list of per-feature attribute dicts."""
+    columns = {"geometry": geometry}
+    for name in records[0] if records else []:
+        values = [record[name] for record in records]
+        # keep None as None instead of letting pandas coerce a partially missing numeric column to NaN
+        columns[name] = pd.Series(values, dtype=object) if any(value is None for value in values) else values
+    return gpd.GeoDataFrame(columns, crs=crs, geometry="geometry")
+
+
+class ReachStationIndex:
+    """
+    Cross sections of a cross section geodataframe grouped by river and reach and sorted from upstream to downstream.
+
+    Each group holds the row positions of its cross sections in the geodataframe, their negated river stations (so
+    that they ascend from upstream to downstream and can be searched with searchsorted), and their cumulative
+    channel reach lengths.
+    """
+
+    def __init__(self, xs_gdf: pd.DataFrame):
+        river_stations = xs_gdf["river_station"].to_numpy(dtype=float)
+        channel_reach_lengths = xs_gdf["channel_reach_length"].to_numpy(dtype=float)
+        self.groups = {}
+        for key, positions in xs_gdf.groupby(["river", "reach"], sort=False).indices.items():
+            positions = positions[np.argsort(-river_stations[positions], kind="stable")]
+            self.groups[key] = (
+                positions,
+                -river_stations[positions],
+                np.cumsum(channel_reach_lengths[positions]),
+            )
+
+    def upstream_station(self, river: str, reach: str, river_station: float) -> float:
+        """Return the river station of the first cross section upstream of a river station; nan if there is none."""
+        if (river, reach) not in self.groups:
+            return np.nan
+        _, neg_stations, _ = self.groups[(river, reach)]
+        i = np.searchsorted(neg_stations, -river_station, side="left")
+        return -neg_stations[i - 1] if i > 0 else np.nan
+
+    def downstream_span(
+        self, river: str, reach: str, river_station: float, length: float = None, count: int = None
+    ) -> np.ndarray:
+        """
+        Return the row positions of the cross sections spanned downstream of a river station.
+
+        The span starts at the first cross section at or downstream of the river station and ends at the first cross
+        section where the channel reach lengths accumulated from the start exceed length, or at the count-th cross
+        section. Every cross section whose river station falls within the span is included.
+        """
+        if (river, reach) not in self.groups or np.isnan(river_station):
+            raise ValueError(f"no cross sections at or downstream of {river} {reach} {river_station}")
+        positions, neg_stations, cum_lengths = self.groups[(river, reach)]
+        start = np.searchsorted(neg_stations, -river_station, side="left")
+        if start == len(positions):
+            raise ValueError(f"no cross sections at or downstream of {river} {reach} {river_station}")
+        if length is not None:
+            base = cum_lengths[start - 1] if start > 0 else 0
+            end = np.searchsorted(cum_lengths, base + length, side="right")
+        else:
+            end = start + count - 1
+        end = min(max(end, start), len(positions) - 1)
+        first = np.searchsorted(neg_stations, neg_stations[start], side="left")
+        last = np.searchsorted(neg_stations, neg_stations[end], side="right")
+        return positions[first:last]
+
+
 def xs_concave_hull(xs_df: gpd.GeoDataFrame, junction: gpd.GeoDataFrame = None) -> gpd.GeoDataFrame:
     """Compute and return the concave hull (polygon) for a set of cross sections (lines all facing the same direction)."""
     polygons = []
@@ -391,32 +520,247 @@ def text_block_from_start_str_length(start_str: str, number_of_lines: int, lines
                 results.append(line)
 
 
+class GeomTextIndex:
+    """
+    Line-offset index of the blocks contained in a HEC-RAS geometry text file.
+
+    The index is built in a single pass over the lines. Reaches, nodes (cross sections and structures),
+    junctions and the data blocks of each node are then sliced from the recorded offsets instead of
+    searching the full list of lines for every block. Decoded node records are kept in `records`, keyed
+    by the node's start line, so they are parsed once per version of the lines.
+    """
+
+    DATA_KEYS = ["Reach XY=", "#Sta/Elev=", "XS GIS Cut Line=", "#Mann="]
+
+    def __init__(self, lines: list[str], build: bool = True):
+        self.lines = lines
+        self.n_lines = len(lines)
+        self.reaches = {}
+        self.junctions = {}
+        self.records = {}
+        self.persisted = False
+        self._node_starts = []
+        self._node_headers = []
+        self._node_breaks = []
+        self._data_offsets = {key: [] for key in self.DATA_KEYS}
+        if build:
+            self._build()
+
+    def _build(self):
+        """Index the lines in a single pass."""
+        reach_starts, reach_breaks, junction_starts, empty_lines = [], [], [], []
+        for i, line in enumerate(self.lines):
+            if "River Reach" in line:
+                reach_breaks.append(i)
+                self._node_breaks.append(i)
+                if line.startswith("River Reach="):
+                    reach_starts.append((line.split("=")[1], i))
+            elif "Type RM Length L Ch R" in line:
+                self._node_breaks.append(i)
+                if "Type RM Length L Ch R =" in line:
+                    self._node_starts.append(i)
+                    self._node_headers.append(line.split("=")[1])
+            elif line == "":
+                empty_lines.append(i)
+            elif "Junct Name=" in line:
+                junction_starts.append((line.split("=")[1], i))
+            else:
+                for key in self.DATA_KEYS:
+                    if line.startswith(key):
+                        self._data_offsets[key].append(i)
+                        break
+
+        for river_reach, start in reach_starts:
+            if river_reach in self.reaches:
+                continue
+            i = bisect.bisect_right(reach_breaks, start)
+            end = reach_breaks[i] - 1 if i < len(reach_breaks) else self.n_lines
+            self.reaches[river_reach] = (start, end)
+
+        for junct, start in junction_starts:
+            if junct in self.junctions:
+                continue
+            i = bisect.bisect_right(empty_lines, start)
+            end = empty_lines[i] + 1 if i < len(empty_lines) else self.n_lines
+            self.junctions[junct] = (start, end)
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """Return the index as a dictionary of numpy arrays that can be saved to disk."""
+        arrays = {
+            "reach_names": np.array(list(self.reaches), dtype=str),
+            "reach_spans": np.array(list(self.reaches.values()), dtype=np.int64).reshape(-1, 2),
+            "junction_names": np.array(list(self.junctions), dtype=str),
+            "junction_spans": np.array(list(self.junctions.values()), dtype=np.int64).reshape(-1, 2),
+            "node_starts": np.array(self._node_starts, dtype=np.int64),
+            "node_headers": np.array(self._node_headers, dtype=str),
+            "node_breaks": np.array(self._node_breaks, dtype=np.int64),
+        }
+        for i, key in enumerate(self.DATA_KEYS):
+            arrays[f"data_offsets_{i}"] = np.array(self._data_offsets[key], dtype=np.int64)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, lines: list[str], arrays: dict[str, np.ndarray]) -> GeomTextIndex:
+        """Restore an index of lines from the arrays returned by to_arrays."""
+        index = cls(lines, build=False)
+        index.reaches = {
+            name: tuple(span) for name, span in zip(arrays["reach_names"].tolist(), arrays["reach_spans"].tolist())
+        }
+        index.junctions = {
+            name: tuple(span)
+            for name, span in zip(arrays["junction_names"].tolist(), arrays["junction_spans"].tolist())
+        }
+        index._node_starts = arrays["node_starts"].tolist()
+        index._node_headers = arrays["node_headers"].tolist()
+        index._node_breaks = arrays["node_breaks"].tolist()
+        for i, key in enumerate(cls.DATA_KEYS):
+            index._data_offsets[key] = arrays[f"data_offsets_{i}"].tolist()
+        return index
+
+    def is_current(self, lines: list[str]) -> bool:
+        """Check if the index was built from the given list of lines and the list has not been resized."""
+        return self.lines is lines and self.n_lines == len(lines)
+
+    def nodes(self, start: int, end: int) -> list[tuple[str, int, int]]:
+        """Return the header, start and end line of each node (cross section or structure) between start and end."""
+        nodes = []
+        first = bisect.bisect_left(self._node_starts, start)
+        last = bisect.bisect_left(self._node_starts, end)
+        for header, node_start in zip(self._node_headers[first:last], self._node_starts[first:last]):
+            i = bisect.bisect_right(self._node_breaks, node_start)
+            node_end = self._node_breaks[i] if i < len(self._node_breaks) else self.n_lines
+            nodes.append((header, node_start, min(node_end, end)))
+        return nodes
+
+    def find(self, key: str, start: int, end: int) -> int | None:
+        """Return the first line between start and end that begins with one of the indexed data keys."""
+        offsets = self._data_offsets[key]
+        i = bisect.bisect_left(offsets, start)
+        if i < len(offsets) and offsets[i] < end:
+            return offsets[i]
+
+    def offsets(self, start: int, end: int) -> dict:
+        """Return the data block offsets between start and end relative to start."""
+        offsets = {}
+        for key in self.DATA_KEYS:
+            line = self.find(key, start, end)
+            if line is not None:
+                offsets[key] = line - start
+        return offsets
+
+
+def data_block_from_offsets(
+    offsets: dict, key: str, number_of_lines: int, lines: list[str], start_str: str = None
+) -> list[str]:
+    """Return the lines following an indexed data key; fall back to searching for start_str if it was not indexed."""
+    if offsets and key in offsets:
+        start = offsets[key] + 1
+        return lines[start : start + number_of_lines]
+    return text_block_from_start_str_length(start_str, number_of_lines, lines)
+
+
+def cache_on_contents(func):
+    """Cache a property on the instance until the instance's contents version changes."""
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        version, value = self._contents_cache.get(func, (None, None))
+        if version != self.contents_version:
+            value = func(self, *args, **kwargs)
+            self._contents_cache[func] = (self.contents_version, value)
+        return value
+
+    return wrapper
+
+
+def fixed_width_array(lines: list[str], field_width: int, n_columns: int = 1, skip_invalid: bool = False) -> np.ndarray:
+    """
+    Decode a block of fixed-width numeric fields into a float array with n_columns columns.
+
+    The lines are padded to whole records, joined into one buffer and converted with NumPy in bulk.
+    A record containing a blank or non-numeric field raises a ValueError, or is dropped if skip_invalid is True.
+    """
+    record_width = field_width * n_columns
+    text = "".join(line.ljust(-(-len(line) // record_width) * record_width) for line in lines)
+    if not text:
+        return np.empty((0, n_columns))
+
+    values, invalid = _decode_fixed_width_fields(text, field_width)
+    values, invalid = values.reshape(-1, n_columns), invalid.reshape(-1, n_columns).any(axis=1)
+    if invalid.any():
+        if not skip_invalid:
+            raise ValueError(f"could not convert fixed-width field to float in record {int(invalid.argmax())}")
+        values = values[~invalid]
+    return values
+
+
+def fixed_width_lines(values: np.ndarray, field_width: int, fields_per_line: int) -> list[str]:
+    """
+    Format values as right-aligned fixed-width fields with fields_per_line fields per line.
+
+    This is the inverse of fixed_width_array. Each value is written as str(value)[:field_width].rjust(field_width);
+    the values are converted to truncated strings in bulk with NumPy.
+    """
+    fields = np.asarray(values, dtype=float).ravel().astype(str).astype(f"U{field_width}").tolist()
+    text = "".join([field.rjust(field_width) for field in fields])
+    line_width = field_width * fields_per_line
+    return [text[i : i + line_width] for i in range(0, len(text), line_width)]
+
+
+def _decode_fixed_width_fields(text: str, field_width: int) -> tuple[np.ndarray, np.ndarray]:
+    """Convert each field of a fixed-width text buffer to float; return the values and a mask of invalid fields."""
+    fields = None
+    if len(text) // field_width >= BULK_DECODE_MIN_FIELDS:
+        try:
+            fields = np.frombuffer(text.encode("ascii"), dtype="S1").reshape(-1, field_width)
+        except UnicodeEncodeError:
+            pass
+
+    if fields is not None:
+        # separate the fields with a space and fill blank fields with nan so every field yields exactly one value
+        blank = (fields == b" ").all(axis=1)
+        buffer = np.full((len(fields), field_width + 1), b" ", dtype="S1")
+        buffer[:, :field_width] = fields
+        buffer[blank, : min(3, field_width)] = np.frombuffer(b"nan"[:field_width], dtype="S1")
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", DeprecationWarning)
+            try:
+                values = np.fromstring(buffer.tobytes(), sep=" ")
+            except (DeprecationWarning, ValueError):
+                values = None
+        if values is not None and len(values) == len(fields):
+            return values, blank
+
+    # small blocks, or buffers holding text numpy cannot parse, are converted field by field
+    values, invalid = [], []
+    for i in range(0, len(text), field_width):
+        try:
+            values.append(float(text[i : i + field_width]))
+            invalid.append(False)
+        except ValueError:
+            values.append(np.nan)
+            invalid.append(True)
+    return np.array(values, dtype=float), np.array(invalid, dtype=bool)
+
+
 def data_pairs_from_text_block(lines: list[str], width: int) -> list[tuple[float]]:
     """Split lines at given width to get paired data string. Split the string in half and convert to tuple of floats."""
-    pairs = []
-    for line in lines:
-        for i in range(0, len(line), width):
-            x = line[i : int(i + width / 2)]
-            y = line[int(i + width / 2) : int(i + width)]
-            try:
-                pairs.append((float(x), float(y)))
-            except ValueError:  # If a user has left a coordinate blank, skip point
-                continue
+    return list(map(tuple, data_pairs_array_from_text_block(lines, width).tolist()))
+
 
-    return pairs
+def data_pairs_array_from_text_block(lines: list[str], width: int) -> np.ndarray:
+    """Decode paired data of the given width into an (n, 2) array, skipping pairs a user has left blank."""
+    return fixed_width_array(lines, width // 2, 2, skip_invalid=True)
 
 
 def data_triplets_from_text_block(lines: list[str], width: int) -> list[tuple[float]]:
     """Split lines at given width to get paired data string. Split the string in half and convert to tuple of floats."""
-    pairs = []
-    for line in lines:
-        for i in range(0, len(line), width):
-            x = line[i : int(i + width / 3)]
-            y = line[int(i + width / 3) : int(i + (width * 2 / 3))]
-            z = line[int(i + (width * 2 / 3)) : int(i + (width))]
-            pairs.append((float(x), float(y), float(z)))
+    return list(map(tuple, data_triplets_array_from_text_block(lines, width).tolist()))
+
 
-    return pairs
+def data_triplets_array_from_text_block(lines: list[str], width: int) -> np.ndarray:
+    """Decode triplet data of the given width into an (n, 3) array."""
+    return fixed_width_array(lines, width // 3, 3)
 
 
 def handle_spaces(line: str, lines: list[str]):
@@ -508,6 +852,22 @@ def resample_vertices(stations: np.ndarray, max_interval: float) -> np.ndarray:
     return stations
 
 
+def bounded_map(executor: Executor, func: Callable, tasks: Iterable[tuple], max_pending: int) -> Iterator:
+    """
+    Map a function over argument tuples with an executor, keeping at most max_pending tasks in flight.
+
+    Results are yielded in task order; tasks are submitted only as earlier results are consumed, so a slow consumer
+    bounds the memory held by pending results.
+    """
+    pending = deque()
+    for args in tasks:
+        pending.append(executor.submit(func, *args))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
 class NetworkWalker:
     """Walks networks from upstream to downstream (Parent class)."""
 
@@ -1,16 +1,36 @@
 """Utils for working with sqlite databases."""
 
-import json
+import logging
 import os
 import sqlite3
+from contextlib import contextmanager, nullcontext
+from itertools import repeat
+from pathlib import Path
+from typing import Iterator
 
 import pandas as pd
 
+from ripple1d.consts import SQLITE_ATTACH_BATCH_SIZE
 from ripple1d.ras import RasManager
-
-
-def create_db_and_table(db_name: str, table_name: str):
-    """Create sqlite database and table."""
+from ripple1d.utils.rating_curve_utils import RATING_CURVE_COLUMNS
+
+# columns of the rating curve table in the order they are inserted
+RATING_CURVES_TABLE_COLUMNS = [
+    "reach_id",
+    "ds_depth",
+    "ds_wse",
+    "us_flow",
+    "us_depth",
+    "us_wse",
+    "boundary_condition",
+    "plan_suffix",
+    "map_exist",
+    "xs_overtopped",
+]
+
+
+def create_db_and_table(db_name: str, table_name: str, create_index: bool = True):
+    """Create sqlite database and table; bulk loads may skip the lookup index and create it after loading."""
     os.makedirs(os.path.dirname(os.path.abspath(db_name)), exist_ok=True)
     sql_query = f"""
         CREATE TABLE {table_name}(
@@ -30,54 +50,222 @@ def create_db_and_table(db_name: str, table_name: str):
     conn = sqlite3.connect(db_name)
     c = conn.cursor()
     c.execute(sql_query)
+    if create_index:
+        create_rating_curves_index(conn, table_name)
     conn.commit()
     conn.close()
 
 
+def create_rating_curves_index(conn: sqlite3.Connection, table_name: str):
+    """Create the index covering rating curve lookups by reach, boundary condition, downstream wse, and flow."""
+    conn.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS {table_name}_lookup
+        ON {table_name}({", ".join(RATING_CURVE_COLUMNS)})
+    """
+    )
+
+
+def rating_curves_insert_sql(table_name: str) -> str:
+    """Return the statement inserting (or replacing) rows of RATING_CURVES_TABLE_COLUMNS into a rating curve table."""
+    return f"""
+        INSERT OR REPLACE INTO {table_name} ({", ".join(RATING_CURVES_TABLE_COLUMNS)})
+        VALUES ({", ".join("?" * len(RATING_CURVES_TABLE_COLUMNS))})
+    """
+
+
+@contextmanager
+def rating_curves_db_connection(db_name: str) -> Iterator[sqlite3.Connection]:
+    """
+    Open a connection to a rating curve database tuned for bulk inserts.
+
+    The database is written in WAL mode with synchronous=NORMAL and switched back to a rollback journal when the
+    connection is closed so the database remains a single self-contained file. URI filenames are enabled so other
+    databases can be attached read-only.
+    """
+    conn = sqlite3.connect(db_name, uri=True)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    try:
+        yield conn
+    finally:
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+
 def insert_data(
-    db_name: str, table_name: str, data: pd.DataFrame, plan_suffix: str, missing_grids: list, boundary_condition: str
+    db_name: str,
+    table_name: str,
+    data: pd.DataFrame,
+    plan_suffix: str,
+    missing_grids: list,
+    boundary_condition: str,
+    conn: sqlite3.Connection = None,
 ):
-    """Insert data into the sqlite database."""
-    conn = sqlite3.connect(db_name)
-    c = conn.cursor()
+    """Insert data into the sqlite database in one transaction; an open connection to the database may be reused."""
+    us_flow = data["us_flow"].astype(int).astype(str)
+    if boundary_condition == "kwse":
+        keys = "f_" + us_flow + "-z_" + data["ds_wse"].astype(str).str.replace(".", "_", regex=False)
+    elif boundary_condition == "nd":
+        keys = us_flow
+    else:
+        raise ValueError(f"Could not detemine boundary condition type for {boundary_condition}; expected kwse or nd")
+    map_exist = (~keys.isin(set(missing_grids))).astype(int)
+
+    rows = zip(
+        data["reach_id"].astype(int).tolist(),
+        # round as before; np.round scales before rounding, so values such as 0.15 and 1.05 round differently
+        *[
+            [round(value, 1) for value in data[column].astype(float).tolist()]
+            for column in ["ds_depth", "ds_wse", "us_flow", "us_depth", "us_wse"]
+        ],
+        repeat(str(boundary_condition)),
+        repeat(str(plan_suffix)),
+        map_exist.tolist(),
+        data["xs_overtopped"].astype(int).tolist(),
+    )
+
+    connection = rating_curves_db_connection(db_name) if conn is None else nullcontext(conn)
+    with connection as conn, conn:
+        conn.executemany(rating_curves_insert_sql(table_name), rows)
+
+
+def create_depth_grid_aliases_table(conn: sqlite3.Connection, table_name: str = "depth_grid_aliases"):
+    """Create the table mapping FIM library depth grids ({reach_id}/{depth}/{flow}.tif) to identical canonical grids."""
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {table_name}(
+            reach_id INTEGER,
+            grid TEXT,
+            canonical_grid TEXT,
+            PRIMARY KEY(reach_id, grid)
+        )
+    """
+    )
+
+
+def depth_grid_aliases_to_sqlite(
+    db_name: str,
+    reach_id: int,
+    canonical_grids: dict[str, str],
+    table_name: str = "depth_grid_aliases",
+    conn: sqlite3.Connection = None,
+):
+    """
+    Record which depth grids of a reach are stored as an identical canonical grid.
 
-    for row in data.itertuples():
-        if boundary_condition == "kwse":
-            if f'f_{int(row.us_flow)}-z_{str(row.ds_wse).replace(".","_")}' in missing_grids:
-                map_exist = 0
-            else:
-                map_exist = 1
-        elif boundary_condition == "nd":
-            if str(int(row.us_flow)) in missing_grids:
-                map_exist = 0
-            else:
-                map_exist = 1
+    canonical_grids maps each written or skipped grid to its canonical grid (itself if it was written). Earlier
+    records of these grids are replaced; only grids stored as another grid are recorded.
+    """
+    connection = rating_curves_db_connection(db_name) if conn is None else nullcontext(conn)
+    with connection as conn, conn:
+        create_depth_grid_aliases_table(conn, table_name)
+        conn.executemany(
+            f"DELETE FROM {table_name} WHERE reach_id = ? AND grid = ?",
+            ((int(reach_id), grid) for grid in canonical_grids),
+        )
+        conn.executemany(
+            f"INSERT INTO {table_name} (reach_id, grid, canonical_grid) VALUES (?, ?, ?)",
+            ((int(reach_id), grid, canonical) for grid, canonical in canonical_grids.items() if grid != canonical),
+        )
+
+
+def attach_rating_curves_dbs(conn: sqlite3.Connection, db_names: list[str], table_name: str) -> tuple[list, list]:
+    """
+    Attach a batch of rating curve databases read-only to a connection.
+
+    Databases that cannot be opened or have no rating curve table are logged and skipped. Returns the schema names of
+    the attached databases and the paths of the skipped databases.
+    """
+    schemas, skipped = [], []
+    for i, db_name in enumerate(db_names):
+        schema = f"source_{i}"
+        try:
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (f"{Path(db_name).absolute().as_uri()}?mode=ro",))
+        except sqlite3.DatabaseError as e:
+            logging.warning(f"Could not attach rating curve database {db_name}: {e}")
+            skipped.append(db_name)
+            continue
+        try:
+            tables = conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type='table'").fetchall()
+        except sqlite3.DatabaseError as e:
+            tables = []
+            logging.warning(f"Could not read rating curve database {db_name}: {e}")
+        if (table_name,) in tables:
+            schemas.append(schema)
         else:
-            raise ValueError(
-                f"Could not detemine boundary condition type for {boundary_condition}; expected kwse or nd"
+            logging.warning(f"Rating curve database {db_name} has no {table_name} table; skipping")
+            conn.execute(f"DETACH DATABASE {schema}")
+            skipped.append(db_name)
+    return schemas, skipped
+
+
+def select_attached_rating_curves_sql(schemas: list[str], table_name: str) -> str:
+    """Return a query selecting the rating curve rows of all attached databases."""
+    columns = ", ".join(RATING_CURVES_TABLE_COLUMNS)
+    return " UNION ALL ".join(f"SELECT {columns} FROM {schema}.{table_name}" for schema in schemas)
+
+
+def detach_dbs(conn: sqlite3.Connection, schemas: list[str]):
+    """Detach databases from a connection."""
+    for schema in schemas:
+        conn.execute(f"DETACH DATABASE {schema}")
+
+
+def merge_rating_curves_dbs(conn: sqlite3.Connection, db_names: list[str], table_name: str) -> list[str]:
+    """Attach a batch of rating curve databases and copy their rows with one INSERT ... SELECT; returns skipped dbs."""
+    schemas, skipped = attach_rating_curves_dbs(conn, db_names, table_name)
+    if schemas:
+        with conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {table_name} ({', '.join(RATING_CURVES_TABLE_COLUMNS)}) "
+                + select_attached_rating_curves_sql(schemas, table_name)
             )
+            merge_depth_grid_aliases(conn, schemas, table_name)
+    detach_dbs(conn, schemas)
+    return skipped
 
-        c.execute(
-            f"""
-            INSERT OR REPLACE INTO {table_name} (reach_id, ds_depth, ds_wse, us_flow, us_depth, us_wse, boundary_condition,  plan_suffix, map_exist,xs_overtopped)
-            VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?,?)
-        """,
-            (
-                int(row.reach_id),
-                round(float(row.ds_depth), 1),
-                round(float(row.ds_wse), 1),
-                round(float(row.us_flow), 1),
-                round(float(row.us_depth), 1),
-                round(float(row.us_wse), 1),
-                str(boundary_condition),
-                str(plan_suffix),
-                str(map_exist),
-                str(row.xs_overtopped),
-            ),
+
+def merge_depth_grid_aliases(
+    conn: sqlite3.Connection, schemas: list[str], table_name: str, aliases_table_name: str = "depth_grid_aliases"
+):
+    """
+    Copy the depth grid aliases of attached rating curve databases.
+
+    The aliases of the reaches in the attached rating curve tables replace earlier aliases of those reaches, so a
+    reach merged again without deduplicated grids drops its stale aliases.
+    """
+    sources = [
+        schema
+        for schema in schemas
+        if conn.execute(
+            f"SELECT 1 FROM {schema}.sqlite_master WHERE type='table' AND name=?", (aliases_table_name,)
+        ).fetchone()
+    ]
+    exists = conn.execute(
+        "SELECT 1 FROM main.sqlite_master WHERE type='table' AND name=?", (aliases_table_name,)
+    ).fetchone()
+    if exists:
+        reaches = " UNION ".join(f"SELECT reach_id FROM {schema}.{table_name}" for schema in schemas)
+        conn.execute(f"DELETE FROM main.{aliases_table_name} WHERE reach_id IN ({reaches})")
+    if sources:
+        create_depth_grid_aliases_table(conn, aliases_table_name)
+        conn.execute(
+            f"INSERT OR REPLACE INTO main.{aliases_table_name} (reach_id, grid, canonical_grid) "
+            + " UNION ALL ".join(
+                f"SELECT reach_id, grid, canonical_grid FROM {schema}.{aliases_table_name}" for schema in sources
+            )
         )
 
-    conn.commit()
-    conn.close()
+
+def merge_rating_curves_shard(db_names: list[str], shard_name: str, table_name: str) -> list[str]:
+    """Merge rating curve databases into a new unindexed shard database in batches; returns skipped dbs."""
+    create_db_and_table(shard_name, table_name, create_index=False)
+    skipped = []
+    with rating_curves_db_connection(shard_name) as conn:
+        for i in range(0, len(db_names), SQLITE_ATTACH_BATCH_SIZE):
+            skipped += merge_rating_curves_dbs(conn, db_names[i : i + SQLITE_ATTACH_BATCH_SIZE], table_name)
+    return skipped
 
 
 def parse_stage_flow(wses: pd.DataFrame) -> pd.DataFrame:
@@ -108,14 +296,14 @@ def zero_depth_to_sqlite(
     missing_grids: list,
     database_path: str,
     table_name: str,
+    conn: sqlite3.Connection = None,
 ):
     """Export zero depth (normal depth) results to sqlite."""
     # set the plan
     rm.plan = rm.plans[plan_name]
 
-    profile_name_map = json.loads(rm.plans[plan_name].flow.description)
     # read in flow/wse
-    wses, flows = rm.plan.read_rating_curves(profile_name_map)
+    wses, flows = rm.plan_results(plan_name)
 
     # get river-reach-rs
     us_river_reach_rs = rm.plan.geom.rivers[nwm_id][nwm_id].us_xs.river_reach_rs_str
@@ -143,18 +331,25 @@ def zero_depth_to_sqlite(
     df["reach_id"] = [nwm_id] * len(df)
 
     df["xs_overtopped"] = check_overtopping(rm, wses)
-    insert_data(database_path, table_name, df, plan_suffix, missing_grids, boundary_condition="nd")
+    insert_data(database_path, table_name, df, plan_suffix, missing_grids, boundary_condition="nd", conn=conn)
 
 
 def check_overtopping(rm: RasManager, wses: pd.DataFrame):
     """Check if the crossection was overopped."""
-    gdf = rm.current_plan.geom.xs_gdf
-    gdf["river_reach_rs"] = gdf.apply(lambda x: rs_float(x.river_reach_rs), axis=1)
-    if not (gdf.river_reach_rs_str.values == wses.index.values).any():
+    overtop_elevations = rm.plan_geom(rm.plan).xs_overtop_elevations
+    for source, index in [("geometry", overtop_elevations.index), ("plan hdf", wses.index)]:
+        if index.has_duplicates:
+            raise ValueError(
+                f"Cannot safely check overtopping of cross sections. The river_reach_rs {list(index[index.duplicated()].unique())} are duplicated in the {source}."
+            )
+    missing = ~wses.index.isin(overtop_elevations.index)
+    if missing.any():
         raise ValueError(
-            f"Cannot safely check overtopping of cross sections. The river_reach_rs of the geometry xs_gdf does not match the river_reach_rs from the plan hdf. The order of the cross sections may have changed."
+            f"Cannot safely check overtopping of cross sections. The river_reach_rs {list(wses.index[missing])} from the plan hdf are not in the geometry. The cross sections may have changed."
         )
-    return wses.gt(gdf["overtop_elevation"].values, axis=0).any().astype(int)
+    # one broadcast comparison of every profile against the overtop elevations aligned to the hdf cross section order
+    overtopped = wses.to_numpy() > overtop_elevations.loc[wses.index].to_numpy()[:, None]
+    return pd.Series(overtopped.any(axis=0).astype(int), index=wses.columns)
 
 
 def rating_curves_to_sqlite(
@@ -165,6 +360,7 @@ def rating_curves_to_sqlite(
     missing_grids: list,
     database_path: str,
     table_name: str,
+    conn: sqlite3.Connection = None,
 ):
     """Export rating curves to sqlite."""
     # set the plan
@@ -172,9 +368,8 @@ def rating_curves_to_sqlite(
         return
     rm.plan = rm.plans[plan_name]
 
-    profile_name_map = json.loads(rm.plans[plan_name].flow.description)
     # read in flow/wse
-    wses, flows = rm.plan.read_rating_curves(profile_name_map)
+    wses, flows = rm.plan_results(plan_name)
     wses_t = wses.T
     wses_t["xs_overtopped"] = check_overtopping(rm, wses)
 
@@ -200,7 +395,7 @@ def rating_curves_to_sqlite(
     thalweg = rm.plan.geom.rivers[nwm_id][nwm_id].ds_xs.thalweg
     df["ds_depth"] = df["ds_wse"] - thalweg
 
-    insert_data(database_path, table_name, df, plan_suffix, missing_grids, boundary_condition="kwse")
+    insert_data(database_path, table_name, df, plan_suffix, missing_grids, boundary_condition="kwse", conn=conn)
 
 
 def create_non_spatial_table(gpkg_path: str, metadata: dict) -> None:
@@ -0,0 +1,270 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import rasterio
+from pyproj import CRS
+from rasterio.vrt import WarpedVRT
+from shapely import Polygon
+
+from ripple1d.consts import METERS_PER_FOOT, QUANTIZED_DEPTH_NODATA
+from ripple1d.errors import NullTerrainError
+from ripple1d.utils.dg_utils import (
+    WarpPlan,
+    clip_raster,
+    quantize_depth,
+    raster_content_hash,
+    read_depth_cube_profiles,
+    read_depth_grid,
+    reproject_raster,
+    reproject_raster_to_cog,
+    write_depth_cube,
+)
+from ripple1d.utils.rating_curve_utils import depth_cube_bands
+
+SRC_CRS = "EPSG:2277"
+SRC_TRANSFORM = rasterio.Affine(2, 0, 2300000, 0, -2, 13900000)
+NODATA = -9999
+
+
+def write_depth_grid(path: str, shape: tuple[int, int], seed: int, transform: rasterio.Affine = SRC_TRANSFORM):
+    """Write a random float32 depth grid with nodata gaps."""
+    depth = np.random.default_rng(seed).random(shape).astype(np.float32) * 10
+    depth[depth < 2] = NODATA
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=shape[1],
+        height=shape[0],
+        count=1,
+        dtype="float32",
+        crs=SRC_CRS,
+        transform=transform,
+        nodata=NODATA,
+    ) as dst:
+        dst.write(depth, 1)
+
+
+class TestWarpPlan(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_paths = [os.path.join(self.tmp_dir, f"depth_{i}.tif") for i in range(2)]
+        for i, path in enumerate(self.src_paths):
+            write_depth_grid(path, (700, 900), i)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assert_same_raster(self, path_a: str, path_b: str):
+        with rasterio.open(path_a) as a, rasterio.open(path_b) as b:
+            self.assertEqual(a.profile, b.profile)
+            np.testing.assert_array_equal(a.read(), b.read())
+
+    def test_warp_plan(self):
+        dst_crs = CRS(5070)
+        # a budget below the size of the position rasters stages them on disk
+        with patch("ripple1d.utils.dg_utils.tempfile.gettempdir", return_value=self.tmp_dir):
+            plan = WarpPlan.from_raster(self.src_paths[0], dst_crs, 1, "Meters", tiled=True, memory_budget_mb=1)
+        self.assertEqual([f for f in os.listdir(self.tmp_dir) if f.endswith(".tmp.tif")], [])
+        plan.save(os.path.join(self.tmp_dir, "warp_plan.npy"))
+        plan = pickle.loads(pickle.dumps(plan))
+        for path in self.src_paths:
+            gdal_path = path.replace(".tif", "_gdal.tif")
+            plan_path = path.replace(".tif", "_plan.tif")
+            reproject_raster(path, gdal_path, dst_crs, 1, "Meters", tiled=True)
+            reproject_raster(path, plan_path, dst_crs, 1, "Meters", tiled=True, warp_plan=plan, memory_budget_mb=1)
+            self.assert_same_raster(gdal_path, plan_path)
+
+    def test_warp_plan_other_grid(self):
+        dst_crs = CRS(5070)
+        plan = WarpPlan.from_raster(self.src_paths[0], dst_crs, 1, "Meters", tiled=True)
+        path = os.path.join(self.tmp_dir, "shifted.tif")
+        write_depth_grid(path, (700, 900), 2, SRC_TRANSFORM * rasterio.Affine.translation(5, 5))
+        reproject_raster(path, path.replace(".tif", "_gdal.tif"), dst_crs, 1, "Meters", tiled=True)
+        reproject_raster(path, path.replace(".tif", "_plan.tif"), dst_crs, 1, "Meters", tiled=True, warp_plan=plan)
+        self.assert_same_raster(path.replace(".tif", "_gdal.tif"), path.replace(".tif", "_plan.tif"))
+
+
+class TestReprojectRasterToCog(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_path = os.path.join(self.tmp_dir, "depth.tif")
+        write_depth_grid(self.src_path, (1500, 1800), 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_reproject_raster_to_cog(self):
+        dst_crs = CRS(5070)
+        gdal_path = os.path.join(self.tmp_dir, "gdal.tif")
+        cog_path = os.path.join(self.tmp_dir, "cog.tif")
+        reproject_raster(self.src_path, gdal_path, dst_crs, 1, "Meters", tiled=True)
+        reproject_raster_to_cog(self.src_path, cog_path, dst_crs, 1, "Meters", compress="LZW", predictor="2")
+        with rasterio.open(gdal_path) as gdal, rasterio.open(cog_path) as cog:
+            self.assertEqual(cog.tags(ns="IMAGE_STRUCTURE")["LAYOUT"], "COG")
+            self.assertEqual(cog.tags(ns="IMAGE_STRUCTURE")["COMPRESSION"], "LZW")
+            self.assertEqual(cog.tags(ns="IMAGE_STRUCTURE")["PREDICTOR"], "2")
+            self.assertEqual(cog.overviews(1), [4, 8, 16])
+            self.assertEqual(cog.block_shapes, [(512, 512)])
+            self.assertEqual(cog.transform, gdal.transform)
+            np.testing.assert_array_equal(cog.read(1), gdal.read(1))
+
+
+class TestClipRaster(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_path = os.path.join(self.tmp_dir, "dem.tif")
+        write_depth_grid(self.src_path, (1500, 1800), 0)
+        with rasterio.open(self.src_path) as src:
+            self.src = src.read(1)
+            self.transform = src.transform
+        t = np.linspace(0, 2 * np.pi, 100)
+        x, y = self.transform * (900 + 700 * np.cos(t), 700 + 600 * np.sin(t))
+        self.polygon = Polygon(np.c_[x, y])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_clip_raster(self):
+        feet_path = os.path.join(self.tmp_dir, "clip", "feet.tif")
+        meters_path = os.path.join(self.tmp_dir, "clip", "meters.tif")
+        clip_raster(self.src_path, feet_path, self.polygon, "Feet", memory_budget_mb=1)
+        clip_raster(self.src_path, meters_path, self.polygon, "Meters")
+        with rasterio.open(feet_path) as feet, rasterio.open(meters_path) as meters:
+            self.assertEqual(feet.block_shapes, [(256, 256)])
+            self.assertEqual(feet.transform, self.transform * rasterio.Affine.translation(200, 100))
+            feet, meters = feet.read(1), meters.read(1)
+        self.assertEqual(feet.shape, (1200, 1400))
+        # pixels outside the polygon are nodata; others are the source values
+        self.assertTrue((feet[0, :500] == NODATA).all())
+        np.testing.assert_array_equal(feet[600, 100:1300], self.src[700, 300:1500])
+        np.testing.assert_array_equal(meters == NODATA, feet == NODATA)
+        valid = feet != NODATA
+        np.testing.assert_allclose(meters[valid], feet[valid] / METERS_PER_FOOT, rtol=1e-6)
+
+    def test_clip_raster_nodata(self):
+        with rasterio.open(self.src_path, "r+") as src:
+            src.write(np.full(self.src.shape, NODATA, dtype=np.float32), 1)
+        dst_path = os.path.join(self.tmp_dir, "clip.tif")
+        with self.assertRaises(NullTerrainError):
+            clip_raster(self.src_path, dst_path, self.polygon, "Feet", memory_budget_mb=1)
+        self.assertFalse(os.path.exists(dst_path))
+
+
+class TestDepthCube(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_paths = [os.path.join(self.tmp_dir, f"depth_{i}.tif") for i in range(3)]
+        for i, path in enumerate(self.src_paths):
+            write_depth_grid(path, (400, 500), i)
+        # a grid off the terrain grid is warped onto the grid of the cube
+        write_depth_grid(self.src_paths[2], (400, 500), 2, SRC_TRANSFORM * rasterio.Affine.translation(3, 3))
+        self.tags = [
+            {"us_flow": "100", "ds_wse": "88.5", "boundary_condition": "kwse"},
+            {"us_flow": "100", "boundary_condition": "nd"},
+            {"us_flow": "200", "boundary_condition": "nd"},
+        ]
+        self.descriptions = ["z_88_5/f_100", "z_nd/f_100", "z_nd/f_200"]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write_depth_cube(self):
+        dst_crs = CRS(5070)
+        cube_path = os.path.join(self.tmp_dir, "depth_cube.tif")
+        write_depth_cube(self.src_paths, cube_path, dst_crs, self.tags, self.descriptions, 1, "Meters")
+        with rasterio.open(cube_path) as cube:
+            self.assertEqual(cube.count, 3)
+            self.assertEqual(cube.descriptions, tuple(self.descriptions))
+            self.assertEqual(cube.block_shapes, [(256, 256)] * 3)
+            for band, path in zip(cube.indexes, self.src_paths[:2]):
+                grid_path = path.replace(".tif", "_grid.tif")
+                reproject_raster(path, grid_path, dst_crs, 1, "Meters", tiled=True)
+                with rasterio.open(grid_path) as grid:
+                    self.assertEqual(grid.transform, cube.transform)
+                    np.testing.assert_array_equal(grid.read(1), cube.read(band))
+            self.assertTrue((cube.read(3) != NODATA).any())
+
+        profiles = read_depth_cube_profiles(cube_path)
+        np.testing.assert_array_equal(profiles["us_flow"], [100, 100, 200])
+        np.testing.assert_array_equal(profiles["ds_wse"], [88.5, np.nan, np.nan])
+        bands = depth_cube_bands(profiles, np.array([200, 100, 100, np.nan]), np.array([np.nan, 88.5, 86.0, np.nan]))
+        np.testing.assert_array_equal(bands, [3, 1, 0, 0])
+
+
+class TestQuantizedDepth(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_path = os.path.join(self.tmp_dir, "depth.tif")
+        write_depth_grid(self.src_path, (700, 900), 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_quantize_depth(self):
+        depth = np.array([0.004, 0.006, 1.234, NODATA, np.nan, 1000], dtype=np.float32)
+        quantized = quantize_depth(depth, NODATA, 0.01)
+        np.testing.assert_array_equal(quantized, [0, 1, 123, QUANTIZED_DEPTH_NODATA, QUANTIZED_DEPTH_NODATA, 65534])
+
+    def test_reproject_quantized(self):
+        dst_crs = CRS(5070)
+        float_path = os.path.join(self.tmp_dir, "float.tif")
+        reproject_raster(self.src_path, float_path, dst_crs, 1, "Meters", tiled=True)
+        expected = read_depth_grid(float_path)
+        plan = WarpPlan.from_raster(self.src_path, dst_crs, 1, "Meters", tiled=True)
+        for warp_plan in [plan, None]:
+            quantized_path = os.path.join(self.tmp_dir, "quantized.tif")
+            reproject_raster(
+                self.src_path,
+                quantized_path,
+                dst_crs,
+                1,
+                "Meters",
+                predictor="2",
+                tiled=True,
+                warp_plan=warp_plan,
+                memory_budget_mb=1,
+                depth_scale=0.01,
+            )
+            with rasterio.open(quantized_path) as src:
+                self.assertEqual(src.dtypes, ("uint16",))
+                self.assertEqual(src.nodata, QUANTIZED_DEPTH_NODATA)
+                self.assertEqual(src.scales, (0.01,))
+                self.assertEqual(src.tags(ns="IMAGE_STRUCTURE")["PREDICTOR"], "2")
+                if warp_plan is None:
+                    # without a plan the raster is warped through a WarpedVRT, whose chunks differ from the GDAL warp
+                    with (
+                        rasterio.open(self.src_path) as raw,
+                        WarpedVRT(raw, crs=dst_crs, transform=src.transform, width=src.width, height=src.height) as vrt,
+                    ):
+                        expected = vrt.read(1)
+                        expected = np.where(expected == NODATA, np.nan, expected)
+            depth = read_depth_grid(quantized_path)
+            np.testing.assert_array_equal(np.isnan(depth), np.isnan(expected))
+            self.assertLessEqual(np.nanmax(np.abs(depth - expected)), 0.0051)
+
+
+class TestRasterContentHash(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src_paths = [os.path.join(self.tmp_dir, f"depth_{i}.tif") for i in range(3)]
+        write_depth_grid(self.src_paths[0], (700, 900), 0)
+        write_depth_grid(self.src_paths[1], (700, 900), 0)
+        write_depth_grid(self.src_paths[2], (700, 900), 0, SRC_TRANSFORM * rasterio.Affine.translation(1, 0))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_raster_content_hash(self):
+        content_hash = raster_content_hash(self.src_paths[0])
+        self.assertEqual(content_hash, raster_content_hash(self.src_paths[1], memory_budget_mb=1))
+        # the same pixels on another grid are different content
+        self.assertNotEqual(content_hash, raster_content_hash(self.src_paths[2]))
+        with rasterio.open(self.src_paths[1], "r+") as src:
+            src.write(np.zeros((1, 1), dtype=np.float32), 1, window=((699, 700), (899, 900)))
+        self.assertNotEqual(content_hash, raster_content_hash(self.src_paths[1]))
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+import rasterio
+
+from ripple1d.ops.fim_lib import create_depth_cube, post_process_depth_grid, post_process_depth_grids
+from ripple1d.utils.dg_utils import raster_content_hash
+from ripple1d.utils.ripple_utils import bounded_map
+from tests.dg_utils_tests import write_depth_grid
+
+PLAN_NAME = "2823932_nd"
+FLOWS = ["100", "200", "400", "800"]
+
+
+class TestBoundedMap(unittest.TestCase):
+    def test_bounded_map(self):
+        lock, in_flight, max_in_flight = threading.Lock(), [0], [0]
+
+        def task(i: int) -> int:
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            with lock:
+                in_flight[0] -= 1
+            return i * i
+
+        submitted = []
+
+        def tasks():
+            for i in range(20):
+                submitted.append(i)
+                yield (i,)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = []
+            for result in bounded_map(pool, task, tasks(), 3):
+                # no more than max_pending tasks are submitted ahead of the consumer
+                self.assertLessEqual(len(submitted) - len(results), 3)
+                results.append(result)
+        self.assertEqual(results, [i * i for i in range(20)])
+        self.assertLessEqual(max_in_flight[0], 3)
+
+
+class TestPostProcessDepthGrids(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        plan_dir = os.path.join(self.tmp_dir, PLAN_NAME)
+        os.makedirs(plan_dir)
+        profile_names = [str(i) for i in range(len(FLOWS))]
+        for i, profile_name in enumerate(profile_names):
+            write_depth_grid(os.path.join(plan_dir, f"Depth ({profile_name}).model.terrain.tif"), (300, 400), i)
+        flow = SimpleNamespace(description=json.dumps(dict(zip(profile_names, FLOWS))), profile_names=profile_names)
+        self.rm = SimpleNamespace(
+            plans={PLAN_NAME: SimpleNamespace(flow=flow)},
+            ras_project=SimpleNamespace(_ras_dir=self.tmp_dir, title="model"),
+        )
+        # the terrain of the model is found with a Windows path separator
+        self.terrain = patch("ripple1d.ops.fim_lib.glob.glob", return_value=["Terrain/model.terrain.tif"])
+        self.terrain.start()
+
+    def tearDown(self):
+        self.terrain.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def read_library(self, library: str) -> list[np.ndarray]:
+        grids = []
+        for flow in FLOWS:
+            with rasterio.open(os.path.join(library, "z_nd", f"f_{flow}.tif")) as src:
+                grids.append(src.read(1))
+        return grids
+
+    def test_workers(self):
+        expected_library = os.path.join(self.tmp_dir, "serial")
+        post_process_depth_grids(self.rm, PLAN_NAME, expected_library, workers=1)
+        expected = self.read_library(expected_library)
+        for executor in ["process", "thread"]:
+            library = os.path.join(self.tmp_dir, executor)
+            with self.assertLogs(level=logging.DEBUG) as logs:
+                post_process_depth_grids(self.rm, PLAN_NAME, library, workers=2, executor=executor)
+            for grid, expected_grid in zip(self.read_library(library), expected):
+                np.testing.assert_array_equal(grid, expected_grid)
+            # the log records of the workers reach the handlers of this process
+            for flow in FLOWS:
+                self.assertIn(f"DEBUG:root:{os.path.join(library, 'z_nd', f'f_{flow}.tif')}", logs.output)
+
+    def test_create_depth_cube(self):
+        # profiles in neither flow nor ds_wse order
+        kwse_profiles = {"0": "f_200-z_90_0", "1": "f_100-z_90_0", "2": "f_100-z_88_5"}
+        self.rm.plans[PLAN_NAME].flow.description = json.dumps(
+            dict(zip(["0", "1", "2", "3"], ["800", "100", "400", "200"]))
+        )
+        kwse_dir = os.path.join(self.tmp_dir, "2823932_kwse")
+        os.makedirs(kwse_dir)
+        for i, profile_name in enumerate(kwse_profiles):
+            write_depth_grid(os.path.join(kwse_dir, f"Depth ({profile_name}).model.terrain.tif"), (300, 400), 10 + i)
+        flow = SimpleNamespace(description=json.dumps(kwse_profiles), profile_names=list(kwse_profiles))
+        self.rm.plans["2823932_kwse"] = SimpleNamespace(flow=flow)
+
+        cube_path = os.path.join(self.tmp_dir, "cube", "depth_cube.tif")
+        create_depth_cube(self.rm, [PLAN_NAME, "2823932_kwse"], cube_path)
+        with rasterio.open(cube_path) as cube:
+            descriptions = cube.descriptions
+        expected = ["z_88_5/f_100", "z_90_0/f_100", "z_90_0/f_200"] + [f"z_nd/f_{flow}" for flow in FLOWS]
+        self.assertEqual(list(descriptions), expected)
+
+    def test_thread_gdal_cache(self):
+        library = os.path.join(self.tmp_dir, "thread")
+        with patch("ripple1d.ops.fim_lib.post_process_depth_grid", wraps=post_process_depth_grid) as process:
+            post_process_depth_grids(self.rm, PLAN_NAME, library, workers=2, executor="thread", gdal_cache_mb=64)
+        # threads share the cache of the process rather than resetting it per grid
+        self.assertEqual({call.args[7] for call in process.call_args_list}, {None})
+
+    def test_deduplicate(self):
+        # the last profile is identical to the second
+        write_depth_grid(os.path.join(self.tmp_dir, PLAN_NAME, "Depth (3).model.terrain.tif"), (300, 400), 1)
+        library = os.path.join(self.tmp_dir, "dedup")
+        hash_threads = []
+
+        def content_hash(path: str) -> str:
+            hash_threads.append(threading.current_thread())
+            return raster_content_hash(path)
+
+        with patch("ripple1d.ops.fim_lib.raster_content_hash", side_effect=content_hash):
+            canonical_grids = post_process_depth_grids(
+                self.rm, PLAN_NAME, library, workers=2, executor="thread", deduplicate=True
+            )
+        # the grids are hashed by the workers rather than by this thread
+        self.assertEqual(len(hash_threads), len(FLOWS))
+        self.assertNotIn(threading.main_thread(), hash_threads)
+        self.assertEqual(canonical_grids["z_nd/f_800.tif"], "z_nd/f_200.tif")
+        self.assertEqual(canonical_grids["z_nd/f_400.tif"], "z_nd/f_400.tif")
+        self.assertFalse(os.path.exists(os.path.join(library, "z_nd", "f_800.tif")))
+        self.assertEqual(len(os.listdir(os.path.join(library, "z_nd"))), len(FLOWS) - 1)
+
+    def test_deduplicate_overwritten_grid(self):
+        # the last profile is identical to the second, so z_nd/f_800.tif is stored as z_nd/f_200.tif
+        write_depth_grid(os.path.join(self.tmp_dir, PLAN_NAME, "Depth (3).model.terrain.tif"), (300, 400), 1)
+        library = os.path.join(self.tmp_dir, "dedup")
+        grid_hashes, canonical_grids = {}, {}
+        post_process_depth_grids(
+            self.rm, PLAN_NAME, library, deduplicate=True, grid_hashes=grid_hashes, canonical_grids=canonical_grids
+        )
+        self.assertEqual(canonical_grids["z_nd/f_800.tif"], "z_nd/f_200.tif")
+        with rasterio.open(os.path.join(library, "z_nd", "f_200.tif")) as src:
+            f_200 = src.read(1)
+
+        # a later plan writes different content to z_nd/f_200.tif and the earlier content to z_nd/f_300.tif
+        ind_plan = "2823932_ind"
+        os.makedirs(os.path.join(self.tmp_dir, ind_plan))
+        write_depth_grid(os.path.join(self.tmp_dir, ind_plan, "Depth (0).model.terrain.tif"), (300, 400), 10)
+        write_depth_grid(os.path.join(self.tmp_dir, ind_plan, "Depth (1).model.terrain.tif"), (300, 400), 1)
+        flow = SimpleNamespace(description=json.dumps({"0": "200", "1": "300"}), profile_names=["0", "1"])
+        self.rm.plans[ind_plan] = SimpleNamespace(flow=flow)
+        plan_grids = post_process_depth_grids(
+            self.rm, ind_plan, library, deduplicate=True, grid_hashes=grid_hashes, canonical_grids=canonical_grids
+        )
+
+        # the earlier content of z_nd/f_200.tif is kept as its alias z_nd/f_800.tif rather than left stale
+        self.assertEqual(canonical_grids["z_nd/f_800.tif"], "z_nd/f_800.tif")
+        self.assertEqual(plan_grids, {"z_nd/f_200.tif": "z_nd/f_200.tif", "z_nd/f_300.tif": "z_nd/f_800.tif"})
+        self.assertEqual(canonical_grids["z_nd/f_300.tif"], "z_nd/f_800.tif")
+        self.assertFalse(os.path.exists(os.path.join(library, "z_nd", "f_300.tif")))
+        with rasterio.open(os.path.join(library, "z_nd", "f_800.tif")) as src:
+            np.testing.assert_array_equal(src.read(1), f_200)
+        with rasterio.open(os.path.join(library, "z_nd", "f_200.tif")) as src:
+            self.assertFalse(np.array_equal(src.read(1), f_200))
+        # every alias resolves to a written grid
+        for canonical in canonical_grids.values():
+            self.assertTrue(os.path.exists(os.path.join(library, canonical)))
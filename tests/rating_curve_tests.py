@@ -0,0 +1,212 @@
+import glob
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from ripple1d.ops.fim_lib import consolidate_rating_curves_dbs
+from ripple1d.utils.rating_curve_utils import (
+    RatingCurveLookup,
+    depth_grid_paths,
+    rating_curves_db_to_parquet,
+    read_depth_grid_aliases,
+    read_rating_curves_db,
+)
+from ripple1d.utils.sqlite_utils import create_db_and_table, depth_grid_aliases_to_sqlite, insert_data
+
+REACH_ID = 2823932
+TABLE_NAME = "rating_curves"
+
+
+def rating_curve(flows: list, ds_wse: list, us_wse: list, reach_id: int = REACH_ID) -> pd.DataFrame:
+    """Rating curve rows of a reach in the layout expected by insert_data."""
+    df = pd.DataFrame({"us_flow": flows, "ds_wse": ds_wse, "us_wse": us_wse})
+    df["reach_id"] = reach_id
+    df["us_depth"] = df["us_wse"] - 90
+    df["ds_depth"] = df["ds_wse"] - 80
+    df["xs_overtopped"] = 0
+    return df
+
+
+class TestRatingCurveDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmp_dir, f"{REACH_ID}.db")
+        create_db_and_table(self.db, TABLE_NAME)
+        nd = rating_curve([100, 200, 400], [85.0, 86.0, 87.0], [92.0, 94.0, 96.0])
+        insert_data(self.db, TABLE_NAME, nd, "nd", ["200"], "nd")
+        for ds_wse in [86.5, 88.5]:
+            kwse = rating_curve([100, 200, 400], [ds_wse] * 3, [ds_wse + 7, ds_wse + 8, ds_wse + 9])
+            insert_data(self.db, TABLE_NAME, kwse, "kwse", [f"f_100-z_{str(ds_wse).replace('.', '_')}"], "kwse")
+        # the same curve from a second plan must not duplicate points of the lookup
+        insert_data(self.db, TABLE_NAME, kwse, "ikwse", [], "kwse")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_insert_data(self):
+        with sqlite3.connect(self.db) as conn:
+            rows = conn.execute(
+                f"SELECT us_flow, map_exist FROM {TABLE_NAME} WHERE boundary_condition='nd' ORDER BY us_flow"
+            ).fetchall()
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        conn.close()
+        self.assertEqual(rows, [(100, 1), (200, 0), (400, 1)])
+        self.assertEqual(journal_mode, "delete")
+
+    def test_insert_data_rounding(self):
+        curve = rating_curve([100.05, 200], [85.15, 86.25], [92.45, 1.05], reach_id=1)
+        insert_data(self.db, TABLE_NAME, curve, "nd", [], "nd")
+        with sqlite3.connect(self.db) as conn:
+            rows = conn.execute(f"SELECT us_flow, ds_wse, us_wse FROM {TABLE_NAME} WHERE reach_id=1").fetchall()
+        conn.close()
+        self.assertEqual(rows, [(100.0, 85.2, 92.5), (200.0, 86.2, 1.1)])
+
+    def test_read_rating_curves_db(self):
+        curves = read_rating_curves_db(self.db, [REACH_ID], "kwse")
+        self.assertEqual(len(curves["us_flow"]), 9)
+        self.assertEqual(curves["us_flow"].dtype, np.float64)
+        self.assertEqual(curves["map_exist"].dtype, bool)
+        self.assertTrue((curves["boundary_condition"] == "kwse").all())
+        self.assertEqual(len(read_rating_curves_db(self.db, [0])["reach_id"]), 0)
+
+    def test_rating_curves_db_to_parquet(self):
+        parquet_directory = os.path.join(self.tmp_dir, "rating_curves")
+        rating_curves_db_to_parquet(self.db, parquet_directory, batch_rows=4)
+        rating_curves_db_to_parquet(self.db, parquet_directory, batch_rows=4)
+        self.assertEqual(os.listdir(parquet_directory), [f"reach_id={REACH_ID}"])
+
+        table = ds.dataset(parquet_directory, format="parquet", partitioning="hive").to_table()
+        self.assertEqual(table.num_rows, 12)
+        self.assertEqual(table.schema.field("us_wse").type, pa.float32())
+        self.assertTrue(pa.types.is_dictionary(table.schema.field("boundary_condition").type))
+        df = table.to_pandas().astype({"boundary_condition": str, "plan_suffix": str})
+        df = df.sort_values(["boundary_condition", "plan_suffix", "ds_wse", "us_flow"])
+        with sqlite3.connect(self.db) as conn:
+            expected = pd.read_sql(
+                f"SELECT * FROM {TABLE_NAME} ORDER BY boundary_condition, plan_suffix, ds_wse, us_flow", conn
+            )
+        conn.close()
+        np.testing.assert_allclose(df["us_wse"], expected["us_wse"].astype(np.float32))
+        np.testing.assert_array_equal(df["map_exist"], expected["map_exist"].astype(bool))
+        np.testing.assert_array_equal(df["plan_suffix"], expected["plan_suffix"])
+
+    def test_rating_curves_db_to_parquet_many_reaches(self):
+        db = os.path.join(self.tmp_dir, "regional.db")
+        create_db_and_table(db, TABLE_NAME)
+        reach_ids = np.arange(1500)
+        nd = pd.concat([rating_curve([100, 200], [85.0, 86.0], [92.0, 94.0], reach_id) for reach_id in reach_ids])
+        insert_data(db, TABLE_NAME, nd.sample(frac=1, random_state=0), "nd", [], "nd")
+        parquet_directory = os.path.join(self.tmp_dir, "regional")
+        rating_curves_db_to_parquet(db, parquet_directory, batch_rows=2000)
+        self.assertEqual(len(os.listdir(parquet_directory)), len(reach_ids))
+        self.assertEqual(len(glob.glob(os.path.join(parquet_directory, "*", "*.parquet"))), len(reach_ids))
+        table = ds.dataset(parquet_directory, format="parquet", partitioning="hive").to_table()
+        self.assertEqual(table.num_rows, 2 * len(reach_ids))
+
+    def test_lookup(self):
+        lookup = RatingCurveLookup.from_db(self.db)
+        reach_ids = [REACH_ID, REACH_ID, REACH_ID, REACH_ID, 0]
+        flows = [150, 1000, 140, 110, 150]
+        ds_wses = [np.nan, np.nan, 88.0, 86.4, np.nan]
+        results = lookup.lookup(reach_ids, flows, ds_wses)
+        np.testing.assert_allclose(results["us_wse"], [93.0, 96.0, 95.9, 93.6, np.nan])
+        np.testing.assert_allclose(results["us_depth"], [3.0, 6.0, 5.9, 3.6, np.nan])
+        np.testing.assert_allclose(results["grid_flow"], [100, 400, 100, 200, np.nan])
+        np.testing.assert_allclose(results["grid_ds_wse"], [np.nan, np.nan, 88.5, 86.5, np.nan])
+        self.assertEqual(
+            depth_grid_paths(reach_ids, results["grid_flow"], results["grid_ds_wse"]),
+            [
+                f"{REACH_ID}/z_nd/f_100.tif",
+                f"{REACH_ID}/z_nd/f_400.tif",
+                f"{REACH_ID}/z_88_5/f_100.tif",
+                f"{REACH_ID}/z_86_5/f_200.tif",
+                None,
+            ],
+        )
+
+    def test_depth_grid_aliases(self):
+        self.assertEqual(read_depth_grid_aliases(self.db), {})
+        canonical_grids = {
+            f"{REACH_ID}/z_nd/f_100.tif": f"{REACH_ID}/z_nd/f_100.tif",
+            f"{REACH_ID}/z_88_5/f_100.tif": f"{REACH_ID}/z_nd/f_100.tif",
+            f"{REACH_ID}/z_86_5/f_100.tif": f"{REACH_ID}/z_nd/f_100.tif",
+        }
+        depth_grid_aliases_to_sqlite(self.db, REACH_ID, canonical_grids)
+        # a grid written again as its own canonical grid drops its alias
+        canonical_grids[f"{REACH_ID}/z_86_5/f_100.tif"] = f"{REACH_ID}/z_86_5/f_100.tif"
+        depth_grid_aliases_to_sqlite(self.db, REACH_ID, canonical_grids)
+        aliases = read_depth_grid_aliases(self.db, [REACH_ID])
+        self.assertEqual(aliases, {f"{REACH_ID}/z_88_5/f_100.tif": f"{REACH_ID}/z_nd/f_100.tif"})
+        self.assertEqual(read_depth_grid_aliases(self.db, [0]), {})
+        self.assertEqual(
+            depth_grid_paths([REACH_ID, REACH_ID], np.array([100, 100]), np.array([88.5, 86.5]), aliases),
+            [f"{REACH_ID}/z_nd/f_100.tif", f"{REACH_ID}/z_86_5/f_100.tif"],
+        )
+
+        # the aliases are exported with the rating curves and replaced when the reach is exported again
+        parquet_directory = os.path.join(self.tmp_dir, "rating_curves")
+        self.assertEqual(read_depth_grid_aliases(self.tmp_dir), {})
+        rating_curves_db_to_parquet(self.db, parquet_directory)
+        self.assertEqual(read_depth_grid_aliases(parquet_directory), aliases)
+        self.assertEqual(read_depth_grid_aliases(parquet_directory, [0]), {})
+        depth_grid_aliases_to_sqlite(self.db, REACH_ID, {grid: grid for grid in canonical_grids})
+        rating_curves_db_to_parquet(self.db, parquet_directory)
+        self.assertEqual(read_depth_grid_aliases(parquet_directory), {})
+        table = ds.dataset(parquet_directory, format="parquet", partitioning="hive").to_table()
+        self.assertEqual(table.num_rows, 12)
+
+
+class TestConsolidateRatingCurves(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.reach_ids = list(range(1000, 1025))
+        for reach_id in self.reach_ids:
+            db = os.path.join(self.tmp_dir, f"{reach_id}.db")
+            create_db_and_table(db, TABLE_NAME)
+            nd = rating_curve([100, 200, 300], [85.0, 86.0, 87.0], [90.0, 91.0, reach_id / 10], reach_id)
+            insert_data(db, TABLE_NAME, nd, "nd", [], "nd")
+            if reach_id % 2:
+                depth_grid_aliases_to_sqlite(db, reach_id, {f"{reach_id}/z_nd/f_300.tif": f"{reach_id}/z_nd/f_200.tif"})
+        with open(os.path.join(self.tmp_dir, "corrupt.db"), "w") as f:
+            f.write("not a database")
+        self.databases = sorted(glob.glob(os.path.join(self.tmp_dir, "*.db")))
+        self.databases.append(os.path.join(self.tmp_dir, "missing.db"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @patch("ripple1d.ops.fim_lib.CONSOLIDATE_SHARD_SIZE", 10)
+    def test_consolidate(self):
+        for workers in [1, 2]:
+            output = os.path.join(self.tmp_dir, "regional", f"regional_{workers}.db")
+            result = consolidate_rating_curves_dbs(self.tmp_dir, output, self.databases, workers=workers)
+            # temporary shards are cleaned up
+            expected_files = [f"regional_{i}.db" for i in range(1, workers + 1)]
+            self.assertEqual(sorted(os.listdir(os.path.dirname(output))), expected_files)
+            self.assertEqual(result["merged_databases"], len(self.reach_ids))
+            self.assertEqual(sorted(map(os.path.basename, result["skipped_databases"])), ["corrupt.db", "missing.db"])
+            self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, "missing.db")))
+
+            curves = read_rating_curves_db(output)
+            self.assertEqual(len(curves["reach_id"]), 3 * len(self.reach_ids))
+            np.testing.assert_array_equal(np.unique(curves["reach_id"]), self.reach_ids)
+            np.testing.assert_allclose(curves["us_wse"][2::3], np.array(self.reach_ids) / 10)
+            with sqlite3.connect(output) as conn:
+                indexes = conn.execute("SELECT name FROM sqlite_master WHERE type='index'").fetchall()
+            conn.close()
+            self.assertIn((f"{TABLE_NAME}_lookup",), indexes)
+            # the aliases of the reaches are merged through the shards
+            expected_aliases = {
+                f"{reach_id}/z_nd/f_300.tif": f"{reach_id}/z_nd/f_200.tif"
+                for reach_id in self.reach_ids
+                if reach_id % 2
+            }
+            self.assertEqual(read_depth_grid_aliases(output), expected_aliases)
@@ -1,12 +1,31 @@
+import json
+import math
 import os
+import shutil
+import tempfile
 import unittest
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import PropertyMock, patch
 
+import numpy as np
+import pandas as pd
 import pytest
 from pyproj import CRS
 
 from ripple1d.ras import RasFlowText, RasGeomText, RasManager, RasPlanText, RasProject
+from ripple1d.utils.cache_utils import geom_cache_path, read_geom_cache
+from ripple1d.utils.hdf_utils import HDF_POOL, HdfHandlePool, release_hdf_pool
+from ripple1d.utils.sqlite_utils import check_overtopping
+from ripple1d.utils.ripple_utils import (
+    ReachStationIndex,
+    data_pairs_from_text_block,
+    fixed_width_array,
+    fixed_width_lines,
+    linestrings_from_coords,
+    read_steady_results,
+    text_block_from_start_end_str,
+    text_block_from_start_str_length,
+)
 
 TEST_DIR = os.path.dirname(__file__)
 TEST_ITEM_FILE = "ras-data/baxter.json"
@@ -18,6 +37,8 @@ RAS_GEOM = os.path.join(TEST_DIR, "ras-data/Baxter/Baxter.g02")
 RAS_FLOW = os.path.join(TEST_DIR, "ras-data/Baxter/Baxter.f01")
 PROJECTION_FILE = os.path.join(TEST_DIR, "ras-data/Baxter/CA_SPCS_III_NAVD88.prj")
 NEW_GPKG = os.path.join(TEST_DIR, "ras-data/Baxter/Baxter_test.gpkg")
+RESULTS_PLAN = os.path.join(TEST_DIR, "test-data/14320639/14320639.p01")
+RESULTS_PROJECT = os.path.join(TEST_DIR, "test-data/14320639/14320639.prj")
 
 
 @pytest.fixture(scope="class")
@@ -57,6 +78,25 @@ class TestProject(unittest.TestCase):
         pass
 
 
+# RasManager
+@pytest.mark.usefixtures("setup_data")
+class TestLazyRasManager(unittest.TestCase):
+    def test_lazy_loading(self):
+        rm = RasManager(RAS_PROJECT, crs=CRS(self.PROJECTION), lazy=True)
+        eager = RasManager(RAS_PROJECT, crs=CRS(self.PROJECTION))
+        for name in ["plans", "geoms", "flows"]:
+            self.assertEqual(getattr(rm, name).keys(), getattr(eager, name).keys())
+            self.assertFalse(any(handle.is_loaded for handle in getattr(rm, name).values()))
+        self.assertEqual(rm.plan.file_extension, eager.plan.file_extension)
+        # header values read lazily are not read from the file again
+        plan = next(iter(rm.plans.values()))
+        with patch("builtins.open", side_effect=AssertionError("header read twice")):
+            self.assertEqual(plan.title, next(iter(eager.plans.values())).title)
+        geom = rm.geoms[self.ras_geom.title]
+        self.assertEqual(geom.reaches.keys(), self.ras_geom.reaches.keys())
+        self.assertTrue(geom.is_loaded)
+
+
 # RasPlanText
 @pytest.mark.usefixtures("setup_data")
 class TestPlan(unittest.TestCase):
@@ -71,6 +111,85 @@ class TestPlan(unittest.TestCase):
         pass
 
 
+@pytest.mark.usefixtures("setup_data")
+class TestPlanResults(unittest.TestCase):
+    def test_read_rating_curves(self):
+        plan = RasPlanText(RESULTS_PLAN)
+        profile_name_map = json.loads(RasFlowText(RESULTS_PLAN.replace(".p01", ".f01")).description)
+        wses, flows = plan.read_rating_curves(profile_name_map)
+        self.assertEqual(list(wses.columns), list(profile_name_map.values()))
+        self.assertIn("14320639 14320639 5.0", wses.index)
+
+        river_reach_rs = ["14320639 14320639 2.0", "14320639 14320639 5.0"]
+        wse, flow = plan.read_rating_curves(profile_name_map, river_reach_rs)
+        pd.testing.assert_frame_equal(wse, wses.loc[river_reach_rs])
+        pd.testing.assert_frame_equal(flow, flows.loc[river_reach_rs])
+        with self.assertRaises(KeyError):
+            plan.read_rating_curves(profile_name_map, ["14320639 14320639 99.0"])
+
+    def test_results_cube(self):
+        rm = RasManager(RESULTS_PROJECT, crs=CRS(self.PROJECTION), lazy=True)
+        results = rm.results(variables=["wse", "flow", "velocity"])
+        self.assertEqual(list(results.data_vars), ["wse", "flow", "velocity"])
+        self.assertEqual(results.wse.dims, ("plan", "profile", "xs"))
+        self.assertEqual(list(results.plan.values), list(rm.plans))
+        for i, (plan_name, plan) in enumerate(rm.plans.items()):
+            profile_name_map = json.loads(plan.flow.description)
+            wses, flows = plan.read_rating_curves(profile_name_map)
+            n_profiles = len(profile_name_map)
+            self.assertEqual(list(results.profile_name.values[i, :n_profiles]), list(wses.columns))
+            np.testing.assert_array_equal(results.wse.values[i, :n_profiles], wses.T.values)
+            self.assertTrue(np.isnan(results.wse.values[i, n_profiles:]).all())
+
+            wse, flow = rm.plan_results(plan_name)
+            pd.testing.assert_frame_equal(wse, wses)
+            pd.testing.assert_frame_equal(flow, flows)
+
+    def test_check_overtopping(self):
+        rm = RasManager(RESULTS_PROJECT, crs=CRS(self.PROJECTION), lazy=True)
+        rm.plan = next(iter(rm.plans.values()))
+        self.assertIn(rm.plan_geom(rm.plan), rm.geoms.values())
+        wses, _ = rm.plan_results(rm.plan.title)
+        with patch("ripple1d.ras.RasGeomText.__init__", side_effect=AssertionError("geometry parsed again")):
+            overtopped = check_overtopping(rm, wses)
+        self.assertEqual(list(overtopped.index), list(wses.columns))
+        with self.assertRaisesRegex(ValueError, "duplicated in the plan hdf"):
+            check_overtopping(rm, pd.concat([wses, wses.iloc[:1]]))
+
+    def test_plan_results(self):
+        rm = RasManager(RESULTS_PROJECT, crs=CRS(self.PROJECTION), lazy=True)
+        plan_name = next(iter(rm.plans))
+        with patch("ripple1d.ras.read_steady_results", wraps=read_steady_results) as read:
+            rm.plan_results(plan_name)
+            rm.plan_results(plan_name)
+            rm.results([plan_name], ["wse", "velocity"])
+        self.assertEqual([list(call.args[1]) for call in read.call_args_list], [["wse", "flow"], ["velocity"]])
+
+        rm = RasManager(RESULTS_PROJECT, crs=CRS(self.PROJECTION), lazy=True)
+        with patch.object(RasFlowText, "description", new_callable=PropertyMock, return_value="not json"):
+            with self.assertRaises(ValueError):
+                rm.plan_results(plan_name)
+
+    def test_hdf_pool(self):
+        pool = HdfHandlePool(max_handles=1)
+        hdf = pool.get(f"{RESULTS_PLAN}.hdf")
+        self.assertIs(pool.get(f"{RESULTS_PLAN}.hdf"), hdf)
+        self.assertEqual(hdf.mode, "r")
+
+        pool.get(RESULTS_PLAN.replace(".p01", ".p02.hdf"))
+        self.assertEqual(len(pool), 1)
+        self.assertFalse(hdf.id.valid)
+
+        pool.close()
+        self.assertEqual(len(pool), 0)
+        self.assertTrue(pool.get(f"{RESULTS_PLAN}.hdf").id.valid)
+        pool.close()
+
+        hdf = release_hdf_pool(HDF_POOL.get)(f"{RESULTS_PLAN}.hdf")
+        self.assertFalse(hdf.id.valid)
+        self.assertEqual(len(HDF_POOL), 0)
+
+
 # RasGeomText
 @pytest.mark.usefixtures("setup_data")
 class TestGeom(unittest.TestCase):
@@ -82,6 +201,167 @@ class TestGeom(unittest.TestCase):
         self.assertEqual(len(self.ras_geom.reaches), 3)
         self.assertIn("Baxter River    ,Upper Reach     ", self.ras_geom.reaches.keys())
 
+    def test_text_index(self):
+        contents = self.ras_geom.contents
+        for river_reach, reach in self.ras_geom.reaches.items():
+            expected = text_block_from_start_end_str(f"River Reach={river_reach}", ["River Reach"], contents, -1)
+            self.assertEqual(reach.ras_data, expected)
+            for header, start, end in reach.nodes:
+                expected = text_block_from_start_end_str(
+                    f"Type RM Length L Ch R ={header}", ["Type RM Length L Ch R", "River Reach"], reach.ras_data
+                )
+                self.assertEqual(contents[start:end], expected)
+        self.assertIs(self.ras_geom.text_index, self.ras_geom.text_index)
+
+    def test_contents_cache(self):
+        ras_geom = RasGeomText(RAS_GEOM, crs=CRS(self.PROJECTION))
+        reaches, version = ras_geom.reaches, ras_geom.contents_version
+        self.assertIs(ras_geom.reaches, reaches)
+        self.assertIs(ras_geom.cross_sections, ras_geom.cross_sections)
+        ras_geom.contents = ras_geom.contents[:]
+        self.assertGreater(ras_geom.contents_version, version)
+        self.assertIsNot(ras_geom.reaches, reaches)
+        self.assertEqual(ras_geom.reaches.keys(), reaches.keys())
+
+        reach = next(iter(ras_geom.reaches.values()))
+        self.assertIs(reach.cross_sections, reach.cross_sections)
+        self.assertIs(reach.xs_gdf, reach.xs_gdf)
+        self.assertEqual(type(reach).cross_sections.__doc__, "Cross sections.")
+        self.assertEqual(RasGeomText.reaches.fget.__name__, "reaches")
+
+    def test_geom_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            geom_file = shutil.copy(RAS_GEOM, tmp_dir)
+            ras_geom = RasGeomText(geom_file, crs=CRS(self.PROJECTION), use_cache=True)
+            self.assertTrue(os.path.exists(geom_cache_path(geom_file)))
+            self.assertFalse(RasGeomText(geom_file, crs=CRS(self.PROJECTION)).text_index.persisted)
+
+            cached = RasGeomText(geom_file, crs=CRS(self.PROJECTION), use_cache=True)
+            self.assertTrue(cached.text_index.persisted)
+            self.assertEqual(cached.reaches.keys(), ras_geom.reaches.keys())
+            for key, xs in ras_geom.cross_sections.items():
+                self.assertEqual(cached.cross_sections[key].station_elevation_points, xs.station_elevation_points)
+                self.assertEqual(cached.cross_sections[key].coords, xs.coords)
+                self.assertEqual(cached.cross_sections[key].bank_stations, xs.bank_stations)
+
+            with open(geom_file, "a") as f:
+                f.write("\n")
+            self.assertIsNone(read_geom_cache(geom_file, RasGeomText(geom_file, crs=CRS(self.PROJECTION)).contents))
+
+    def test_fix_htab_errors(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            geom_file = os.path.join(tmp_dir, "Baxter.g01")
+            with open(RAS_GEOM) as f:
+                text = f.read().replace(
+                    "XS HTab Starting El and Incr=33.9,1, 91", "XS HTab Starting El and Incr=3.9,1, 91"
+                )
+            with open(geom_file, "w") as f:
+                f.write(text)
+
+            ras_geom = RasGeomText(geom_file, crs=CRS(self.PROJECTION), use_cache=True)
+            self.assertTrue(ras_geom.needs_save)
+            self.assertFalse(any(xs.has_htab_error for xs in ras_geom.cross_sections.values()))
+            with open(geom_file) as f:
+                self.assertEqual(f.read(), text)
+            self.assertFalse(os.path.exists(geom_cache_path(geom_file)))
+
+            contents_version = ras_geom.contents_version
+            ras_geom.save()
+            self.assertFalse(ras_geom.needs_save)
+            # products derived from the contents are rebuilt after the write
+            self.assertGreater(ras_geom.contents_version, contents_version)
+            with open(geom_file) as f:
+                self.assertEqual(f.read().splitlines(), ras_geom.contents)
+            # the cache written for the corrected file is used when the geometry is read again
+            cached = RasGeomText(geom_file, crs=CRS(self.PROJECTION), use_cache=True)
+            self.assertFalse(cached.needs_save)
+            self.assertTrue(cached.text_index.persisted)
+
+            # writing the contents any other way also clears needs_save
+            with open(geom_file, "w") as f:
+                f.write(text)
+            ras_geom = RasGeomText(geom_file, crs=CRS(self.PROJECTION))
+            self.assertTrue(ras_geom.needs_save)
+            ras_geom.write_updated_contents()
+            self.assertFalse(ras_geom.needs_save)
+
+    def test_xs_record(self):
+        for xs in self.ras_geom.cross_sections.values():
+            self.assertEqual(xs.record.station_elevation.shape, (xs.number_of_station_elevation_points, 2))
+            expected = data_pairs_from_text_block(
+                text_block_from_start_str_length(
+                    f"#Sta/Elev= {xs.number_of_station_elevation_points} ",
+                    math.ceil(xs.number_of_station_elevation_points / 5),
+                    xs.ras_data,
+                ),
+                16,
+            )
+            self.assertEqual(xs.station_elevation_points, expected)
+            self.assertEqual(
+                xs.thalweg, min(e for s, e in expected if xs.left_bank_station <= s <= xs.right_bank_station)
+            )
+
+    def test_fixed_width_array(self):
+        lines = ["     1.5      10.     2.5        ", "    -3.0   1.0e2"]
+        self.assertEqual(fixed_width_array(lines, 8, 2, skip_invalid=True).tolist(), [[1.5, 10.0], [-3.0, 100.0]])
+        with self.assertRaises(ValueError):
+            fixed_width_array(lines, 8, 2)
+        values = fixed_width_array(["".join(f"{i:8.2f}" for i in range(10))] * 20, 8)
+        self.assertEqual(values.ravel().tolist(), [float(i) for i in range(10)] * 20)
+
+        coords = [(6453739.99, 2051684.78), (6453734.97, 2051687.27), (1.23456789012345678, -0.5)]
+        lines = fixed_width_lines(coords, 16, 4)
+        self.assertEqual(lines[0], "".join(str(value)[:16].rjust(16) for pair in coords[:2] for value in pair))
+        self.assertEqual(len(lines[-1]), 32)
+        self.assertEqual(
+            fixed_width_array(lines, 16, 2).tolist(),
+            [[6453739.99, 2051684.78], [6453734.97, 2051687.27], [1.23456789012345, -0.5]],
+        )
+
+    def test_gdfs(self):
+        xs_gdf = self.ras_geom.xs_gdf
+        self.assertEqual(len(xs_gdf), self.ras_geom.n_cross_sections)
+        for row, xs in zip(xs_gdf.itertuples(), self.ras_geom.cross_sections.values()):
+            self.assertEqual(row.river_reach_rs, xs.river_reach_rs)
+            self.assertTrue(row.geometry.equals_exact(xs.geom, 0))
+        for row, structure in zip(self.ras_geom.structures_gdf.itertuples(), self.ras_geom.structures.values()):
+            self.assertTrue(row.geometry.equals_exact(structure.us_xs.geom.offset_curve(structure.distance), 0))
+        reach_gdf = self.ras_geom.reach_gdf
+        self.assertEqual(list(reach_gdf["river_reach"]), list(self.ras_geom.reaches))
+        self.assertEqual(reach_gdf.crs, self.ras_geom.crs)
+
+        geoms = linestrings_from_coords([np.array([[0.0, 0.0], [1.0, 1.0]]), None, np.array([[2.0, 2.0], [3.0, 3.0]])])
+        self.assertEqual(
+            [geom.wkt for geom in geoms], ["LINESTRING (0 0, 1 1)", "LINESTRING EMPTY", "LINESTRING (2 2, 3 3)"]
+        )
+
+    def test_xs_overtop_elevations(self):
+        overtop_elevations = self.ras_geom.xs_overtop_elevations
+        cross_sections = list(self.ras_geom.cross_sections.values())
+        self.assertEqual(list(overtop_elevations.index), [xs.river_reach_rs_str for xs in cross_sections])
+        np.testing.assert_array_equal(overtop_elevations.values, [xs.overtop_elevation for xs in cross_sections])
+
+    def test_reach_station_index(self):
+        xs_gdf = pd.DataFrame(
+            {
+                "river": "River",
+                "reach": "Reach",
+                "river_station": [50.0, 40.0, 30.0, 20.0, 10.0],
+                "channel_reach_length": [10.0, 10.0, 10.0, 10.0, 0.0],
+            }
+        )
+        stations = ReachStationIndex(xs_gdf.iloc[::-1])
+        self.assertEqual(stations.upstream_station("River", "Reach", 35.0), 40.0)
+        self.assertTrue(math.isnan(stations.upstream_station("River", "Reach", 50.0)))
+        self.assertEqual(list(stations.downstream_span("River", "Reach", 40.0, length=15.0)), [3, 2])
+        self.assertEqual(list(stations.downstream_span("River", "Reach", 35.0, count=2)), [2, 1])
+        self.assertEqual(list(stations.downstream_span("River", "Reach", 20.0, length=100.0)), [1, 0])
+        with self.assertRaises(ValueError):
+            stations.downstream_span("River", "Reach", 5.0, length=15.0)
+
+        xs_gdf = self.ras_geom.xs_gdf
+        self.assertEqual(xs_gdf["has_lateral_structure"].sum(), 17)
+
     # def test_to_gpkg(self):
     #     self.ras_geom.to_gpkg(NEW_GPKG)
 
@@ -94,6 +374,12 @@ class TestFlow(unittest.TestCase):
         self.assertEqual(self.ras_flow.version, "6.30")
         self.assertEqual(self.ras_flow.n_profiles, 3)
 
+    def test_flow_change_locations(self):
+        locations = self.ras_flow.flow_change_locations
+        self.assertEqual(len(locations), 3)
+        for location in locations:
+            self.assertEqual(len(location.flows), self.ras_flow.n_profiles)
+
     def test_new_flow(self):
         pass
 